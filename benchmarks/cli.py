@@ -0,0 +1,231 @@
+import contextlib
+import json
+import tempfile
+from pathlib import Path
+from typing import Annotated
+
+import typer
+from typer import Typer
+
+cli = Typer()
+
+DEFAULT_BUFFER_SIZES = [64, 128, 256, 512, 1024, 2048, 4096]
+
+
+@cli.command()
+def run(
+    output: Annotated[Path, typer.Option('--output', '-o')] = Path('benchmark.json'),
+    buffer_size: Annotated[list[int] | None, typer.Option(help='Buffer size to benchmark (repeatable)')] = None,
+    sample_rate: int = 44100,
+    min_time: Annotated[float, typer.Option(help='Minimum seconds to spend timing each measurement')] = 0.2,
+    nodes: Annotated[bool, typer.Option(help='Benchmark every node type')] = True,
+    patches: Annotated[bool, typer.Option(help='Benchmark the example patches')] = True,
+    startup: Annotated[bool, typer.Option(help='Benchmark import and session startup time')] = True,
+    graph: Annotated[bool, typer.Option(help='Benchmark building and clearing a large generated patch')] = True,
+    fusion: Annotated[bool, typer.Option(help='Benchmark a generated patch with and without kernel fusion')] = True,
+    only: Annotated[str | None, typer.Option(help='Only benchmark node types or patches containing this')] = None,
+    workers: Annotated[int, typer.Option(help='Render patches on a thread pool of this size')] = 0,
+    stages: Annotated[int, typer.Option(help='Render patches in this many pipeline stages')] = 1,
+):
+    from .fusion import benchmark_fusion
+    from .graph_build import benchmark_graph_build
+    from .import_time import benchmark_startup
+    from .nodes import benchmark_nodes
+    from .patches import benchmark_patches
+    from .timing import get_environment
+
+    buffer_sizes = buffer_size or DEFAULT_BUFFER_SIZES
+    output = output.resolve()
+    results = {
+        'environment': {
+            **get_environment(),
+            'sample_rate': sample_rate,
+            'min_time': min_time,
+            'render_workers': workers,
+            'pipeline_stages': stages,
+        },
+    }
+
+    if startup:
+        results['startup'] = benchmark_startup()
+        print_startup(results['startup'])
+
+    if graph:
+        results['graph_build'] = benchmark_graph_build()
+        print_graph_build(results['graph_build'])
+
+    if fusion:
+        results['fusion'] = benchmark_fusion(sample_rate=sample_rate, min_time=min_time)
+        print_fusion(results['fusion'])
+
+    # Patches and nodes may write files relative to the working directory (e.g. WavFileNode's output.wav)
+    with tempfile.TemporaryDirectory() as directory, contextlib.chdir(directory):
+        if nodes:
+            results['nodes'] = benchmark_nodes(buffer_sizes, sample_rate, node_filter=only, min_time=min_time)
+            print_results('Nodes', results['nodes'])
+        if patches:
+            results['patches'] = benchmark_patches(
+                buffer_sizes,
+                sample_rate,
+                render_workers=workers,
+                pipeline_stages=stages,
+                patch_filter=only,
+                min_time=min_time,
+            )
+            print_results('Patches', results['patches'])
+
+    output.write_text(json.dumps(results, indent=2))
+    typer.echo(f'Wrote {output}')
+
+
+@cli.command()
+def startup(
+    script: Annotated[str, typer.Option(help='Synchrolang to run once the session has started')] = 'new SineNode sine;',
+    repeats: int = 5,
+    check: Annotated[bool, typer.Option(help='Fail if any heavy dependency was imported')] = False,
+):
+    from .import_time import benchmark_startup
+
+    result = benchmark_startup(script, repeats)
+    print_startup(result)
+    if check and result['heavy_modules']:
+        raise typer.Exit(1)
+
+
+@cli.command()
+def graph(nodes: Annotated[int, typer.Option(help='Number of nodes in the generated patch')] = 10_000):
+    from .graph_build import benchmark_graph_build
+
+    print_graph_build(benchmark_graph_build(nodes))
+
+
+@cli.command()
+def fusion(
+    voices: Annotated[int, typer.Option(help='Number of voices in the generated patch')] = 16,
+    chain_length: Annotated[int, typer.Option(help='Number of arithmetic nodes in each voice')] = 8,
+    buffer_size: int = 256,
+    min_time: Annotated[float, typer.Option(help='Minimum seconds to spend timing each measurement')] = 0.2,
+):
+    from .fusion import benchmark_fusion
+
+    print_fusion(benchmark_fusion(voices, chain_length, buffer_size, min_time=min_time))
+
+
+@cli.command()
+def oscillators(
+    buffer_size: Annotated[list[int] | None, typer.Option(help='Buffer size to benchmark (repeatable)')] = None,
+    sample_rate: int = 44100,
+    min_time: Annotated[float, typer.Option(help='Minimum seconds to spend timing each measurement')] = 0.2,
+):
+    from .oscillators import OSCILLATOR_BUFFER_SIZES, benchmark_oscillators
+
+    results = benchmark_oscillators(buffer_size or OSCILLATOR_BUFFER_SIZES, sample_rate, min_time=min_time)
+    for name, sizes in results.items():
+        for size, result in sizes.items():
+            typer.echo(
+                f'{name:<28} {size:>5} {result["reference"]["buffer_time"]:>9.3f}ms -> '
+                f'{result["vectorised"]["buffer_time"]:>7.3f}ms {result["speedup"]:>8.1f}x  '
+                f'mean difference {result["mean_difference"]:.2g}',
+            )
+
+
+@cli.command()
+def midi_loop(
+    events: Annotated[int, typer.Option(help='Number of events recorded in the loop')] = 10_000,
+    loop_seconds: Annotated[float, typer.Option(help='Length of the loop')] = 4.,
+    buffer_size: int = 256,
+    min_time: Annotated[float, typer.Option(help='Minimum seconds to spend timing each measurement')] = 0.2,
+):
+    from .midi_loop import benchmark_midi_loop
+
+    result = benchmark_midi_loop(events, loop_seconds, buffer_size, min_time=min_time)
+    typer.echo(
+        f'MIDI loop: {result["events"]} events over {result["loop_length"]} samples, '
+        f'{result["reference"]["buffer_time"]:.3f}ms -> {result["indexed"]["buffer_time"]:.3f}ms per buffer '
+        f'({result["speedup"]:.1f}x), {"same" if result["matches"] else "different"} playback',
+    )
+
+
+@cli.command()
+def pipeline(
+    patch: Annotated[str, typer.Option(help='Example patch to render')] = 'megalovania.syn',
+    stages: Annotated[list[int] | None, typer.Option(help='Number of pipeline stages to check (repeatable)')] = None,
+    buffers: int = 30,
+):
+    from .pipeline import PIPELINE_STAGES, check_pipeline
+
+    results = check_pipeline(patch, stages or PIPELINE_STAGES, buffers)
+    for stage_count, result in results.items():
+        delay = 'gaps or different audio' if result['delay'] is None else f'{result["delay"]} buffers'
+        typer.echo(f'{stage_count} stages: {delay} of delay, expected {result["expected_delay"]}')
+    if not all(result['ok'] for result in results.values()):
+        raise typer.Exit(1)
+
+
+@cli.command()
+def compare(baseline: Path, candidate: Path):
+    baseline_results = json.loads(baseline.read_text())
+    candidate_results = json.loads(candidate.read_text())
+    typer.echo(f'{baseline_results["environment"]["commit"]} -> {candidate_results["environment"]["commit"]}')
+
+    if 'startup' in baseline_results and 'startup' in candidate_results:
+        ratio = baseline_results['startup']['total'] / candidate_results['startup']['total']
+        typer.echo(f'{"startup":<28} {"":>5} {ratio:>8.2f}x')
+
+    if 'graph_build' in baseline_results and 'graph_build' in candidate_results:
+        baseline_rate = baseline_results['graph_build']['nodes_per_second']
+        ratio = candidate_results['graph_build']['nodes_per_second'] / baseline_rate
+        typer.echo(f'{"graph build":<28} {"":>5} {ratio:>8.2f}x')
+
+    if 'fusion' in baseline_results and 'fusion' in candidate_results:
+        baseline_rate = baseline_results['fusion']['fused']['buffers_per_second']
+        ratio = candidate_results['fusion']['fused']['buffers_per_second'] / baseline_rate
+        typer.echo(f'{"fusion":<28} {"":>5} {ratio:>8.2f}x')
+
+    for section in ('nodes', 'patches'):
+        for name, sizes in candidate_results.get(section, {}).items():
+            for size, result in sizes.items():
+                baseline_result = baseline_results.get(section, {}).get(name, {}).get(size, {})
+                if 'buffers_per_second' not in result or 'buffers_per_second' not in baseline_result:
+                    continue
+                ratio = result['buffers_per_second'] / baseline_result['buffers_per_second']
+                typer.echo(f'{name:<28} {size:>5} {ratio:>8.2f}x')
+
+
+def print_startup(result: dict) -> None:
+    typer.echo(
+        f'Startup: {result["total"]:.0f}ms (import {result["import"]:.0f}ms, create {result["create"]:.0f}ms, '
+        f'execute {result["execute"]:.0f}ms), {result["modules"]} modules',
+    )
+    if result['heavy_modules']:
+        typer.echo(f'  Heavy modules imported: {", ".join(result["heavy_modules"])}')
+
+
+def print_graph_build(result: dict) -> None:
+    typer.echo(
+        f'Graph build: {result["nodes"]} nodes, {result["connections"]} connections in {result["build"]:.0f}ms '
+        f'({result["nodes_per_second"]:.0f} nodes/s), parse {result["parse"]:.0f}ms, export {result["export"]:.0f}ms, '
+        f'switch {result["switch"]:.0f}ms, snapshot {result["snapshot"]:.0f}ms, restore {result["restore"]:.0f}ms, '
+        f'clear {result["clear"]:.0f}ms',
+    )
+
+
+def print_fusion(result: dict) -> None:
+    unfused, fused = result['unfused'], result['fused']
+    typer.echo(
+        f'Fusion: {result["voices"]} voices of {result["chain_length"]} nodes, {unfused["steps"]} -> {fused["steps"]} '
+        f'steps, {unfused["buffer_time"]:.3f}ms -> {fused["buffer_time"]:.3f}ms per buffer ({result["speedup"]:.2f}x), '
+        f'max difference {result["max_difference"]:g}',
+    )
+
+
+def print_results(title: str, results: dict[str, dict[str, dict]]) -> None:
+    typer.echo(title)
+    for name, sizes in results.items():
+        cells = []
+        for size, result in sizes.items():
+            if 'error' in result:
+                cells.append(f'{size}: {result["error"]}')
+                break
+            cells.append(f'{size}: {result["realtime_factor"]:.1f}x')
+        typer.echo(f'  {name:<28} ' + '  '.join(cells))
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import numpy as np
+
+from synchrotron.synchrotron import Synchrotron
+
+from .timing import measure
+
+
+def generate_patch(voices: int = 16, chain_length: int = 8) -> str:
+    # An oscillator run through a chain of gains and offsets per voice, then bitcrushed and panned into a shared output:
+    # the kind of element-wise arithmetic which fusion renders as one step per voice. The oscillators are shared, so
+    # most of the time is spent on the chains.
+    lines = ['new PlaybackNode out; new 0.5 gain; new 0.01 offset; new 12 bits; new 220 frequency; new 0.3 pan_rate;',
+             'new SineNode osc; link frequency.out -> osc.frequency; new SineNode pan_lfo; '
+             'link pan_rate.out -> pan_lfo.frequency;']
+    for voice in range(voices):
+        previous = 'osc.out'
+        for index in range(chain_length):
+            node_type, constant = ('MultiplyNode', 'gain') if index % 2 == 0 else ('AddNode', 'offset')
+            lines.append(f'new {node_type} c{voice}_{index}; link {previous} -> c{voice}_{index}.a; '
+                         f'link {constant}.out -> c{voice}_{index}.b;')
+            previous = f'c{voice}_{index}.out'
+        lines.append(f'new BitcrushNode crush{voice}; link {previous} -> crush{voice}.signal; '
+                     f'link bits.out -> crush{voice}.bit_depth;')
+        lines.append(f'new PanNode pan{voice}; link crush{voice}.out -> pan{voice}.signal; '
+                     f'link pan_lfo.out -> pan{voice}.pan;')
+    # Each side is mixed into the output through a chain of adds
+    for side in ('left', 'right'):
+        previous = f'pan0.{side}'
+        for voice in range(1, voices):
+            lines.append(f'new AddNode mix_{side}{voice}; link {previous} -> mix_{side}{voice}.a; '
+                         f'link pan{voice}.{side} -> mix_{side}{voice}.b;')
+            previous = f'mix_{side}{voice}.out'
+        lines.append(f'link {previous} -> out.{side};')
+    return '\n'.join(lines) + '\n'
+
+
+def render_patch(script: str, fuse: bool, buffer_size: int, sample_rate: int, buffers: int, **measure_options) -> tuple:
+    synchrotron = Synchrotron(
+        sample_rate=sample_rate,
+        buffer_size=buffer_size,
+        audio_backend='null',
+        fuse_kernels=fuse,
+    )
+    try:
+        synchrotron.execute(script)
+        output = synchrotron.get_node('out')
+        # Rendered from the start for comparison, before being timed
+        audio = []
+        for _ in range(buffers):
+            synchrotron.render_graph()
+            audio.append(synchrotron.buffer_arena.get(output, 'stereo', 2 * buffer_size).copy())
+        result = measure(synchrotron.render_graph, buffer_size, sample_rate, **measure_options).as_json()
+        result['steps'] = len(synchrotron.get_schedule())
+        return result, np.concatenate(audio)
+    finally:
+        synchrotron.shutdown()
+
+
+def benchmark_fusion(
+    voices: int = 16,
+    chain_length: int = 8,
+    buffer_size: int = 256,
+    sample_rate: int = 44100,
+    **measure_options,
+) -> dict:
+    script = generate_patch(voices, chain_length)
+    unfused, unfused_audio = render_patch(script, False, buffer_size, sample_rate, buffers=20, **measure_options)
+    fused, fused_audio = render_patch(script, True, buffer_size, sample_rate, buffers=20, **measure_options)
+    return {
+        'voices': voices,
+        'chain_length': chain_length,
+        'buffer_size': buffer_size,
+        'unfused': unfused,
+        'fused': fused,
+        'speedup': fused['buffers_per_second'] / unfused['buffers_per_second'],
+        # Fused kernels run the same ufuncs on the same dtypes as the nodes themselves, so this should always be 0
+        'max_difference': float(np.max(np.abs(fused_audio - unfused_audio))),
+    }
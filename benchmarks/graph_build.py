@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import time
+
+from synchrotron.synchrotron import Synchrotron
+
+
+def generate_patch(node_count: int = 10_000) -> str:
+    # Independent voices of 4 nodes each: a frequency feeding an oscillator, scaled by a gain
+    lines = []
+    for index in range(node_count // 4):
+        lines.append(
+            f'new {110 + index % 880} f{index}; new SineNode s{index}; new MultiplyNode m{index}; new 0.5 g{index};',
+        )
+        lines.append(f'link f{index}.out -> s{index}.frequency; link s{index}.out -> m{index}.a; '
+                     f'link g{index}.out -> m{index}.b;')
+    return '\n'.join(lines) + '\n'
+
+
+def benchmark_graph_build(node_count: int = 10_000) -> dict:
+    script = generate_patch(node_count)
+    synchrotron = Synchrotron(audio_backend='null')
+    try:
+        start_time = time.perf_counter()
+        tree = synchrotron.synchrolang_parser.parse(script)
+        parse_time = time.perf_counter()
+        synchrotron.synchrolang_transformer.transform(tree)
+        build_time = time.perf_counter()
+        nodes = len(synchrotron.nodes)
+        connections = len(synchrotron.connections)
+        synchrotron.export_state()
+        export_time = time.perf_counter()
+        # Switching to a fresh copy of the same patch, as loading a preset does
+        synchrotron.execute('clear\n' + script, transactional=True)
+        switch_time = time.perf_counter()
+        snapshot = synchrotron.save_snapshot()
+        snapshot_time = time.perf_counter()
+        synchrotron.restore_snapshot(snapshot)
+        restore_time = time.perf_counter()
+        synchrotron.clear()
+        clear_time = time.perf_counter()
+    finally:
+        synchrotron.shutdown()
+
+    return {
+        'nodes': nodes,
+        'connections': connections,
+        'parse': (parse_time - start_time) * 1000,
+        'build': (build_time - parse_time) * 1000,
+        'export': (export_time - build_time) * 1000,
+        'switch': (switch_time - export_time) * 1000,
+        'snapshot': (snapshot_time - switch_time) * 1000,
+        'restore': (restore_time - snapshot_time) * 1000,
+        'clear': (clear_time - restore_time) * 1000,
+        'nodes_per_second': nodes / (build_time - parse_time),
+    }
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+REPOSITORY_PATH = Path(__file__).parent.parent
+
+# Dependencies which are slow to import, and should only be imported by patches which use the nodes needing them
+HEAVY_MODULES = ('cv2', 'mediapipe', 'tinysoundfont', 'rtmidi', 'mingus', 'websocket', 'pyaudio')
+
+# Run in a fresh interpreter every time, as imports are cached for the lifetime of a process
+STARTUP_SCRIPT = '''
+import json
+import sys
+import time
+
+start_time = time.perf_counter()
+from synchrotron.synchrotron import Synchrotron
+import_time = time.perf_counter()
+synchrotron = Synchrotron(audio_backend='null')
+create_time = time.perf_counter()
+synchrotron.execute({script!r})
+execute_time = time.perf_counter()
+
+print(json.dumps({{
+    'import': import_time - start_time,
+    'create': create_time - import_time,
+    'execute': execute_time - create_time,
+    'modules': sorted(sys.modules),
+}}))
+'''
+
+
+def measure_startup(script: str = 'new SineNode sine;') -> dict:
+    process = subprocess.run(
+        [sys.executable, '-c', STARTUP_SCRIPT.format(script=script)],
+        cwd=REPOSITORY_PATH,
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode:
+        raise RuntimeError(f'startup failed: {process.stderr.strip().splitlines()[-1]}')
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+def benchmark_startup(script: str = 'new SineNode sine;', repeats: int = 5) -> dict:
+    runs = [measure_startup(script) for _ in range(repeats)]
+    # The fastest run is the one least disturbed by the rest of the system
+    result = {stage: min(run[stage] for run in runs) * 1000 for stage in ('import', 'create', 'execute')}
+    result['total'] = min(sum(run[stage] for stage in ('import', 'create', 'execute')) for run in runs) * 1000
+
+    modules = runs[0]['modules']
+    result['modules'] = len(modules)
+    result['heavy_modules'] = [
+        name for name in HEAVY_MODULES
+        if any(module == name or module.startswith(name + '.') for module in modules)
+    ]
+    return result
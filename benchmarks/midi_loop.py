@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import contextlib
+import io
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from synchrotron.nodes import MidiBuffer
+from synchrotron.nodes.midi import MidiLoopNode
+from synchrotron.synchrotron import Synchrotron
+
+from .nodes import MidiSourceNode
+from .timing import measure
+
+if TYPE_CHECKING:
+    from synchrotron.nodes import RenderContext
+
+
+class ReferenceMidiLoopNode(MidiLoopNode):
+    # MidiLoopNode as it was first written, keeping its recording as a list and scanning all of it for every sample
+    def __init__(self, synchrotron: Synchrotron, name: str):
+        super().__init__(synchrotron, name)
+        self.recorded_messages = []
+
+    def render(self, ctx: RenderContext) -> None:
+        loop_signal = self.loop.read(ctx)
+        reset_signal = self.reset.read(ctx)
+        output = MidiBuffer(length=ctx.buffer_size)
+        incoming = self.source.buffer.data
+
+        for i in range(ctx.buffer_size):
+            if reset_signal[i] and not self.last_reset_pulse:
+                self.recording = False
+                self.recorded_messages = []
+                self.loop_length = 0
+                self.loop_position = 0
+            self.last_reset_pulse = reset_signal[i]
+
+            if loop_signal[i] and not self.last_loop_pulse:
+                if self.loop_length == 0:
+                    if self.recording:
+                        self.loop_length = self.loop_position
+                        self.loop_position = 0
+                    else:
+                        self.recording = True
+                        self.loop_position = 0
+                        self.recorded_messages = []
+                else:
+                    self.loop_position = 0
+            self.last_loop_pulse = loop_signal[i]
+
+            if self.recording:
+                for message in incoming.get(i, ()):
+                    self.recorded_messages.append((self.loop_position, message))
+
+            if self.loop_length > 0:
+                for recorded_pos, message in self.recorded_messages:
+                    if recorded_pos == self.loop_position:
+                        output.add_message(position=i, message=message)
+
+            if self.recording:
+                if self.loop_length > 0:
+                    self.loop_position = (self.loop_position + 1) % self.loop_length
+                else:
+                    self.loop_position += 1
+
+        self.out.write(output)
+
+
+def generate_loop(events: int, loop_length: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    # Note ons and offs at random positions in the loop, as recorded by MidiLoopNode
+    rng = np.random.default_rng(seed)
+    positions = np.sort(rng.integers(0, loop_length, events))
+    recorded = np.empty((events, 4), dtype=np.uint8)
+    recorded[:, 0] = rng.choice([0x80, 0x90], events)
+    recorded[:, 1] = rng.integers(36, 96, events)
+    recorded[:, 2] = rng.integers(1, 128, events)
+    recorded[:, 3] = 3
+    return positions, recorded
+
+
+def load_loop(node: MidiLoopNode, positions: np.ndarray, recorded: np.ndarray, loop_length: int) -> None:
+    node.recording = True
+    node.loop_length = loop_length
+    node.loop_position = 0
+    if isinstance(node, ReferenceMidiLoopNode):
+        node.recorded_messages = [
+            (position, bytes(message[:3])) for position, message in zip(positions.tolist(), recorded, strict=True)
+        ]
+    else:
+        node.recorded_positions = positions.astype(np.int64)
+        node.recorded_events = recorded.copy()
+
+
+def render_loop(
+    node_type: type[MidiLoopNode],
+    events: int,
+    loop_length: int,
+    buffer_size: int,
+    sample_rate: int,
+    buffers: int,
+    **measure_options,
+) -> tuple[dict, list[list[tuple[int, bytes]]]]:
+    # Plays back a loop of recorded events while overdubbing a chord every buffer, first from the start for comparison
+    # and then timed
+    synchrotron = Synchrotron(
+        sample_rate=sample_rate,
+        buffer_size=buffer_size,
+        audio_backend='null',
+        cull_dead_nodes=False,
+    )
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            node = node_type(synchrotron=synchrotron, name='loop')
+            source = MidiSourceNode(synchrotron, 'source')
+            synchrotron.add_node(node)
+            synchrotron.add_node(source)
+            synchrotron.add_connection(source.out, node.source)
+            load_loop(node, *generate_loop(events, loop_length), loop_length)
+
+            played = []
+            for _ in range(buffers):
+                synchrotron.render_graph()
+                played.append(list(node.out.buffer))
+            result = measure(synchrotron.render_graph, buffer_size, sample_rate, **measure_options).as_json()
+        return result, played
+    finally:
+        synchrotron.shutdown()
+
+
+def benchmark_midi_loop(
+    events: int = 10_000,
+    loop_seconds: float = 4.,
+    buffer_size: int = 256,
+    sample_rate: int = 44100,
+    **measure_options,
+) -> dict:
+    loop_length = int(loop_seconds * sample_rate)
+    options = (events, loop_length, buffer_size, sample_rate, 20)
+    reference, reference_played = render_loop(ReferenceMidiLoopNode, *options, **measure_options)
+    indexed, indexed_played = render_loop(MidiLoopNode, *options, **measure_options)
+    return {
+        'events': events,
+        'loop_length': loop_length,
+        'buffer_size': buffer_size,
+        'reference': reference,
+        'indexed': indexed,
+        'speedup': indexed['buffers_per_second'] / reference['buffers_per_second'],
+        'matches': indexed_played == reference_played,
+    }
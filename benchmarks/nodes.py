@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import contextlib
+import io
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from synchrotron.nodes import DataInput, MidiBuffer, MidiInput, MidiOutput, Node, StreamInput, StreamOutput
+from synchrotron.nodes.core import DataNode
+from synchrotron.synchrotron import Synchrotron
+
+from .stand_ins import get_benchmark_node_types
+from .timing import measure
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+
+    from numpy.typing import NDArray
+
+    from synchrotron.nodes import RenderContext
+
+
+def sine(buffer_size: int, sample_rate: int) -> NDArray[np.float32]:
+    return np.sin(2 * np.pi * 440 * np.arange(buffer_size) / sample_rate).astype(np.float32)
+
+
+def frequency(buffer_size: int, sample_rate: int) -> NDArray[np.float32]:
+    # Vibrato around A4, so nodes can't shortcut constant frequencies
+    return (440 + 20 * sine(buffer_size, sample_rate / 1000)).astype(np.float32)
+
+
+def pulse(buffer_size: int, _: int) -> NDArray[np.float32]:
+    return (np.arange(buffer_size) % 64 < 32).astype(np.float32)
+
+
+def ramp(buffer_size: int, _: int) -> NDArray[np.float32]:
+    return np.linspace(0, 1, buffer_size, dtype=np.float32)
+
+
+def constant(value: float) -> Callable[[int, int], NDArray[np.float32]]:
+    return lambda buffer_size, _: np.full(buffer_size, value, dtype=np.float32)
+
+
+# Synthetic signals fed to stream inputs, by port name (anything else gets a sine wave)
+STREAM_INPUTS: dict[str, Callable[[int, int], NDArray[np.float32]]] = {
+    'frequency': frequency,
+    'pwm': ramp,
+    'trigger': pulse,
+    'step': pulse,
+    'loop': pulse,
+    'reset': constant(0),
+    'strum': ramp,
+    'transposition': constant(12),
+    'bit_depth': constant(8),
+    'smoothing': constant(1),
+    'attack': constant(0.01),
+    'decay': constant(0.1),
+    'release': constant(0.1),
+    'min': constant(-1),
+    'max': constant(1),
+}
+
+# Values for data inputs, by node type and port name (anything else is left unconnected)
+DATA_INPUTS: dict[str, dict[str, Any]] = {
+    'ChordNode': {'chord': 'I', 'key': 'C', 'octave': 4},
+    'SequenceNode': {'sequence': [220., 330., 440., 550.]},
+    'MidiSequenceNode': {'sequence': [60, 64, 67, 72]},
+    'StreamNode': {'data': 0.5},
+    'PolyphonicSynthNode': {'voices': 32},
+    'WavetableNode': {'table': 'saw'},
+    'DebugNode': {'input': np.zeros(1, dtype=np.float32)},
+}
+
+NODE_ARGUMENTS: dict[str, dict[str, Any]] = {
+    'DataNode': {'value': 1.},
+}
+
+
+class SignalNode(Node):
+    out: StreamOutput
+
+    def __init__(self, synchrotron: Synchrotron, name: str, signal: NDArray[np.float32]) -> None:
+        super().__init__(synchrotron, name)
+        self.signal = signal
+
+    def render(self, _: RenderContext) -> None:
+        self.out.write(self.signal)
+
+
+class MidiSourceNode(Node):
+    out: MidiOutput
+
+    def __init__(self, synchrotron: Synchrotron, name: str) -> None:
+        super().__init__(synchrotron, name)
+        # A chord struck at the start of every buffer and released halfway through
+        self.buffer = MidiBuffer(length=synchrotron.buffer_size)
+        for note in (60, 64, 67):
+            self.buffer.add_message(0, bytes((0x90, note, 100)))
+            self.buffer.add_message(synchrotron.buffer_size // 2, bytes((0x80, note, 0)))
+
+    def render(self, _: RenderContext) -> None:
+        self.out.write(self.buffer)
+
+
+def connect_inputs(synchrotron: Synchrotron, node: Node) -> None:
+    data_inputs = DATA_INPUTS.get(node.__class__.__name__, {})
+
+    for input_port in node.inputs:
+        name = f'{node.name}_{input_port.name}'
+        if isinstance(input_port, StreamInput):
+            signal = STREAM_INPUTS.get(input_port.name, sine)(synchrotron.buffer_size, synchrotron.sample_rate)
+            source = SignalNode(synchrotron, name, signal=signal)
+        elif isinstance(input_port, MidiInput):
+            source = MidiSourceNode(synchrotron, name)
+        elif isinstance(input_port, DataInput) and input_port.name in data_inputs:
+            source = DataNode(synchrotron, name, value=data_inputs[input_port.name])
+        else:
+            continue
+
+        synchrotron.add_node(source)
+        synchrotron.add_connection(source.out, input_port)
+
+
+def benchmark_node(node_type: type[Node], buffer_size: int, sample_rate: int = 44100, **measure_options: Any) -> dict:
+    # The node under test usually has nothing downstream of it, so it mustn't be culled
+    synchrotron = Synchrotron(
+        sample_rate=sample_rate,
+        buffer_size=buffer_size,
+        audio_backend='null',
+        cull_dead_nodes=False,
+    )
+    try:
+        # Some nodes print every buffer (e.g. DebugNode), which would otherwise time the terminal
+        with contextlib.redirect_stdout(io.StringIO()):
+            node = node_type(synchrotron=synchrotron, name='node', **NODE_ARGUMENTS.get(node_type.__name__, {}))
+            synchrotron.add_node(node)
+            connect_inputs(synchrotron, node)
+
+            # Render the whole graph once so the synthetic inputs reach the node, then time the node on its own
+            synchrotron.render_graph()
+            ctx = synchrotron.get_render_context()
+
+            def render() -> None:
+                node.render(ctx)
+                ctx.global_clock += buffer_size
+
+            return measure(render, buffer_size, sample_rate, **measure_options).as_json()
+    finally:
+        synchrotron.shutdown()
+
+
+def benchmark_nodes(
+    buffer_sizes: Iterable[int],
+    sample_rate: int = 44100,
+    node_filter: str | None = None,
+    **measure_options: Any,
+) -> dict[str, dict[str, dict]]:
+    results = {}
+    for name, node_type in get_benchmark_node_types().items():
+        if node_filter is not None and node_filter.lower() not in name.lower():
+            continue
+
+        results[name] = node_results = {}
+        for buffer_size in buffer_sizes:
+            try:
+                node_results[str(buffer_size)] = benchmark_node(node_type, buffer_size, sample_rate, **measure_options)
+            except Exception as error:  # noqa: BLE001 (e.g. a missing SoundFont shouldn't stop the whole run)
+                node_results[str(buffer_size)] = {'error': f'{error.__class__.__name__}: {error}'}
+
+    return results
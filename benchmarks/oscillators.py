@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import contextlib
+import io
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from synchrotron.nodes.audio import SawtoothNode, SineNode, SquareNode
+from synchrotron.synchrotron import Synchrotron
+
+from .nodes import benchmark_node, connect_inputs
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from synchrotron.nodes import Node, RenderContext
+
+OSCILLATOR_BUFFER_SIZES = [256, 1024, 4096]
+
+
+# The oscillators as they were first written, stepping the phase one sample at a time in Python, to compare against
+
+
+class ReferenceSineNode(SineNode):
+    def render(self, ctx: RenderContext) -> None:
+        frequency = self.frequency.read(ctx)
+        waveform = self.out.get_buffer(ctx)
+
+        for i in range(ctx.buffer_size):
+            waveform[i] = self.phase
+            self.phase += 2 * np.pi * frequency[i] / ctx.sample_rate
+            self.phase %= 2 * np.pi
+
+        self.out.write(np.sin(waveform, out=waveform))
+
+
+class ReferenceSquareNode(SquareNode):
+    def render(self, ctx: RenderContext) -> None:
+        frequency = self.frequency.read(ctx)
+        waveform = self.out.get_buffer(ctx)
+        pwm_threshold = self.pwm.read(ctx, default_constant=0.5)
+
+        for i in range(ctx.buffer_size):
+            waveform[i] = 1 if self.phase > pwm_threshold[i] else -1
+            self.phase += frequency[i] / ctx.sample_rate
+            self.phase %= 1
+
+        self.out.write(waveform)
+
+
+class ReferenceSawtoothNode(SawtoothNode):
+    def render(self, ctx: RenderContext) -> None:
+        frequency = self.frequency.read(ctx)
+        waveform = self.out.get_buffer(ctx)
+
+        for i in range(ctx.buffer_size):
+            waveform[i] = self.phase
+            self.phase += frequency[i] / ctx.sample_rate
+            self.phase %= 1
+
+        self.out.write(waveform)
+
+
+REFERENCES: dict[type[Node], type[Node]] = {
+    SineNode: ReferenceSineNode,
+    SquareNode: ReferenceSquareNode,
+    SawtoothNode: ReferenceSawtoothNode,
+}
+
+
+def render_oscillator(node_type: type[Node], buffer_size: int, sample_rate: int, buffers: int) -> np.ndarray:
+    # The oscillator's output over several buffers, with an audio-rate vibrato on its frequency (and a PWM ramp)
+    synchrotron = Synchrotron(
+        sample_rate=sample_rate,
+        buffer_size=buffer_size,
+        audio_backend='null',
+        cull_dead_nodes=False,
+    )
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            node = node_type(synchrotron=synchrotron, name='node')
+            synchrotron.add_node(node)
+            connect_inputs(synchrotron, node)
+            audio = []
+            for _ in range(buffers):
+                synchrotron.render_graph()
+                audio.append(np.array(node.out.buffer, copy=True))
+        return np.concatenate(audio)
+    finally:
+        synchrotron.shutdown()
+
+
+def benchmark_oscillators(
+    buffer_sizes: Iterable[int] = OSCILLATOR_BUFFER_SIZES,
+    sample_rate: int = 44100,
+    **measure_options: Any,
+) -> dict[str, dict[str, dict]]:
+    results = {}
+    for node_type, reference_type in REFERENCES.items():
+        results[node_type.__name__] = node_results = {}
+        for buffer_size in buffer_sizes:
+            reference = benchmark_node(reference_type, buffer_size, sample_rate, **measure_options)
+            vectorised = benchmark_node(node_type, buffer_size, sample_rate, **measure_options)
+            # Differences come from the reference accumulating its phase in float32 (so a square wave can flip a
+            # sample early or late), and grow the longer it runs
+            buffers = max(1, sample_rate // buffer_size)
+            reference_audio = render_oscillator(reference_type, buffer_size, sample_rate, buffers)
+            vectorised_audio = render_oscillator(node_type, buffer_size, sample_rate, buffers)
+            node_results[str(buffer_size)] = {
+                'reference': reference,
+                'vectorised': vectorised,
+                'speedup': vectorised['buffers_per_second'] / reference['buffers_per_second'],
+                'max_difference': float(np.max(np.abs(vectorised_audio - reference_audio))),
+                'mean_difference': float(np.mean(np.abs(vectorised_audio - reference_audio))),
+            }
+
+    return results
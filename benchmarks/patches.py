@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import contextlib
+import io
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from synchrotron.synchrotron import Synchrotron
+
+from .stand_ins import STAND_INS
+from .timing import measure
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+EXAMPLES_PATH = Path(__file__).parent.parent / 'examples'
+
+
+def get_example_patches() -> list[Path]:
+    return sorted((*EXAMPLES_PATH.glob('*.sui'), *EXAMPLES_PATH.glob('*.syn')))
+
+
+def benchmark_patch(
+    script: str,
+    buffer_size: int,
+    sample_rate: int = 44100,
+    render_workers: int = 0,
+    pipeline_stages: int = 1,
+    **measure_options: Any,
+) -> dict:
+    synchrotron = Synchrotron(
+        sample_rate=sample_rate,
+        buffer_size=buffer_size,
+        audio_backend='null',
+        render_workers=render_workers,
+        pipeline_stages=pipeline_stages,
+    )
+    synchrotron.node_types.update(STAND_INS)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            synchrotron.execute(script)
+            result = measure(synchrotron.render_graph, buffer_size, sample_rate, **measure_options).as_json()
+
+        schedule = synchrotron.get_schedule()
+        return {
+            **result,
+            'nodes': len(synchrotron.nodes),
+            'steps': len(schedule),
+            'culled': len(schedule.culled_nodes),
+            'folded': len(schedule.folded_nodes),
+            'fused': len(schedule.fused_nodes),
+        }
+    finally:
+        synchrotron.shutdown()
+
+
+def benchmark_patches(
+    buffer_sizes: Iterable[int],
+    sample_rate: int = 44100,
+    render_workers: int = 0,
+    pipeline_stages: int = 1,
+    patch_filter: str | None = None,
+    **measure_options: Any,
+) -> dict[str, dict[str, dict]]:
+    results = {}
+    for path in get_example_patches():
+        if patch_filter is not None and patch_filter.lower() not in path.name.lower():
+            continue
+
+        script = path.read_text()
+        results[path.name] = patch_results = {}
+        for buffer_size in buffer_sizes:
+            try:
+                patch_results[str(buffer_size)] = benchmark_patch(
+                    script,
+                    buffer_size,
+                    sample_rate,
+                    render_workers=render_workers,
+                    pipeline_stages=pipeline_stages,
+                    **measure_options,
+                )
+            except Exception as error:  # noqa: BLE001 (e.g. a missing SoundFont shouldn't stop the whole run)
+                patch_results[str(buffer_size)] = {'error': f'{error.__class__.__name__}: {error}'}
+
+    return results
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import contextlib
+import io
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from synchrotron.backends import NullBackend, OutputStream
+from synchrotron.synchrotron import Synchrotron
+
+from .patches import EXAMPLES_PATH
+from .stand_ins import STAND_INS
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from numpy.typing import NDArray
+
+PIPELINE_STAGES = [2, 3, 4]
+
+
+class RecordingOutputStream(OutputStream):
+    def __init__(self, backend: RecordingBackend, name: str, sample_rate: int, buffer_size: int, channels: int) -> None:
+        super().__init__(backend, name, sample_rate, buffer_size, channels)
+        self.buffers: list[NDArray[np.float32]] = []
+
+    def write(self, buffer: NDArray[np.float32]) -> None:
+        self.buffers.append(buffer.copy())
+
+
+class RecordingBackend(NullBackend):
+    # Keeps every buffer written to each output, to check exactly which buffers came out
+    name = 'recording'
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.outputs: list[RecordingOutputStream] = []
+
+    def _open_output(self, name: str, sample_rate: int, buffer_size: int, channels: int) -> OutputStream:
+        stream = RecordingOutputStream(self, name, sample_rate, buffer_size, channels)
+        self.outputs.append(stream)
+        return stream
+
+
+def render_outputs(
+    script: str,
+    pipeline_stages: int,
+    buffers: int,
+    buffer_size: int,
+) -> list[list[NDArray[np.float32]]]:
+    backend = RecordingBackend()
+    synchrotron = Synchrotron(buffer_size=buffer_size, audio_backend=backend, pipeline_stages=pipeline_stages)
+    synchrotron.node_types.update(STAND_INS)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            synchrotron.execute(script)
+            for _ in range(buffers):
+                synchrotron.render_graph()
+        return [stream.buffers for stream in backend.outputs]
+    finally:
+        synchrotron.shutdown()
+
+
+def get_delay(reference: list[NDArray[np.float32]], pipelined: list[NDArray[np.float32]]) -> int | None:
+    # How many buffers behind the reference the pipelined output is, if it's the reference's output from the start
+    # without any buffers missing
+    delay = len(reference) - len(pipelined)
+    if delay < 0 or not all(np.array_equal(a, b) for a, b in zip(reference, pipelined, strict=False)):
+        return None
+    return delay
+
+
+def check_pipeline(
+    patch: str = 'megalovania.syn',
+    stages: Iterable[int] = PIPELINE_STAGES,
+    buffers: int = 30,
+    buffer_size: int = 256,
+) -> dict[str, dict]:
+    # Each stage after the first should delay the output by exactly one buffer
+    script = (EXAMPLES_PATH / patch).read_text()
+    reference = render_outputs(script, 1, buffers, buffer_size)
+    results = {}
+    for stage_count in stages:
+        pipelined = render_outputs(script, stage_count, buffers, buffer_size)
+        # Every output should be delayed by the same amount
+        delays = {get_delay(*outputs) for outputs in zip(reference, pipelined, strict=True)}
+        delay = delays.pop() if len(delays) == 1 else None
+        results[str(stage_count)] = {
+            'delay': delay,
+            'expected_delay': stage_count - 1,
+            'ok': delay == stage_count - 1,
+        }
+    return results
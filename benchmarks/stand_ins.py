@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import threading
+from queue import Queue
+from threading import Event
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from synchrotron.nodes import Node, get_node_types
+from synchrotron.nodes.grasswave import GrasswaveNode
+from synchrotron.nodes.midi import MidiInputNode
+from synchrotron.nodes.misc import SolanaNode
+
+if TYPE_CHECKING:
+    from synchrotron.nodes import RenderContext
+    from synchrotron.synchrotron import Synchrotron
+
+# Nodes which talk to devices outside of the audio backend are swapped for these local stand-ins, which run the same
+# render code against synthetic devices so benchmarks work on a headless machine. Audio nodes use the null backend.
+
+
+class LocalMidiIn:
+    # Mimics rtmidi.MidiIn, delivering one message per poll of the port (alternating note on and off)
+    def __init__(self, notes: tuple[int, ...] = (60, 64, 67, 72), delta_time: float = 0.01) -> None:
+        self.notes = notes
+        self.delta_time = delta_time
+        self._index = 0
+        self._polled = False
+
+    def open_port(self, _: int) -> LocalMidiIn:
+        return self
+
+    def close_port(self) -> None:
+        pass
+
+    def get_ports(self) -> list[str]:
+        return ['Benchmark MIDI']
+
+    def get_port_name(self, _: int) -> str:
+        return 'Benchmark MIDI'
+
+    def get_message(self) -> tuple[list[int], float] | None:
+        self._polled = not self._polled
+        if not self._polled:
+            return None
+
+        note = self.notes[(self._index // 2) % len(self.notes)]
+        status = 0x90 if self._index % 2 == 0 else 0x80
+        self._index += 1
+        return [status, note, 100 if status == 0x90 else 0], self.delta_time
+
+
+class LocalMidiInputNode(MidiInputNode):
+    def __init__(self, synchrotron: Synchrotron, name: str) -> None:
+        Node.__init__(self, synchrotron, name)
+
+        self.current_port = self.port.read(default=0)
+        self.midi_in = LocalMidiIn().open_port(self.current_port)
+        self.last_message_time = 0.
+
+        self.exports['Available Ports'] = self.midi_in.get_ports()
+        self.exports['Selected Port'] = self.midi_in.get_port_name(self.current_port)
+
+
+class LocalGrasswaveNode(GrasswaveNode):
+    # Skips the camera and hand tracking thread, sweeping the hand position instead
+    def __init__(self, synchrotron: Synchrotron, name: str) -> None:
+        Node.__init__(self, synchrotron, name)
+
+        self._current_hand_height = 0.0
+        self._target_hand_height = 0.0
+        self._current_hand_tilt = 0.0
+        self._target_hand_tilt = 0.0
+        self._current_pinch = 0.0
+        self._target_pinch = 0.0
+        self._show_debug = False
+        self._debug_window_open = False
+        self._lock = threading.Lock()
+        self._running = False
+
+    def render(self, ctx: RenderContext) -> None:
+        sweep = np.sin(2 * np.pi * ctx.global_clock / ctx.sample_rate)
+        with self._lock:
+            self._target_hand_height = (sweep + 1) / 2
+            self._target_hand_tilt = sweep
+            self._target_pinch = (1 - sweep) / 2
+        super().render(ctx)
+
+    def __del__(self) -> None:
+        pass
+
+
+class LocalSolanaNode(SolanaNode):
+    # Skips the websocket connection, and a new slot arrives every buffer instead
+    def __init__(self, synchrotron: Synchrotron, name: str) -> None:
+        Node.__init__(self, synchrotron, name)
+        self.rpc_url = None
+        self.slot_queue = Queue()
+        self.websocket_thread = None
+        self.stop_event = Event()
+        self.ws = None
+        self.exports['RPC URL'] = 'Benchmark slots'
+
+    def render(self, ctx: RenderContext) -> None:
+        self.slot_queue.put(True)
+        super().render(ctx)
+
+    def teardown(self) -> None:
+        self.stop_event.set()
+
+
+STAND_INS: dict[str, type[Node]] = {
+    node_type.__base__.__name__: node_type
+    for node_type in (
+        LocalMidiInputNode,
+        LocalGrasswaveNode,
+        LocalSolanaNode,
+    )
+}
+
+
+def get_benchmark_node_types() -> dict[str, type[Node]]:
+    return {node_type.__name__: STAND_INS.get(node_type.__name__, node_type) for node_type in get_node_types()}
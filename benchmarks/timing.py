@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import platform
+import subprocess
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+
+@dataclass
+class Throughput:
+    buffer_count: int
+    buffer_size: int
+    sample_rate: int
+    elapsed: float
+
+    @property
+    def buffers_per_second(self) -> float:
+        return self.buffer_count / self.elapsed
+
+    @property
+    def realtime_factor(self) -> float:
+        # How many seconds of audio are rendered per second of wall-clock time
+        return self.buffers_per_second * self.buffer_size / self.sample_rate
+
+    def as_json(self) -> dict:
+        return {
+            **asdict(self),
+            'buffers_per_second': self.buffers_per_second,
+            'buffer_time': self.elapsed / self.buffer_count * 1000,
+            'realtime_factor': self.realtime_factor,
+        }
+
+
+def measure(
+    render: Callable[[], None],
+    buffer_size: int,
+    sample_rate: int,
+    min_time: float = 0.2,
+    min_buffers: int = 10,
+    warmup_buffers: int = 3,
+) -> Throughput:
+    for _ in range(warmup_buffers):
+        render()
+
+    buffer_count = 0
+    start_time = time.perf_counter()
+    while True:
+        render()
+        buffer_count += 1
+        elapsed = time.perf_counter() - start_time
+        if elapsed >= min_time and buffer_count >= min_buffers:
+            return Throughput(buffer_count, buffer_size, sample_rate, elapsed)
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_environment() -> dict:
+    return {
+        'commit': get_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+    }
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from collections.abc import Hashable
+
+    from numpy.typing import DTypeLike, NDArray
+
+
+class BufferArena:
+    # Preallocated buffers owned by the engine and handed out to nodes every block, so that rendering doesn't allocate.
+    # A buffer is reused by the same owner on the next block, by which point every downstream consumer has read it.
+    def __init__(self) -> None:
+        self._buffers: dict[Hashable, dict[str, NDArray]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(buffers) for buffers in self._buffers.values())
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} ({len(self)} buffers, {self.nbytes} bytes)>'
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buffer.nbytes for buffers in self._buffers.values() for buffer in buffers.values())
+
+    def get(self, owner: Hashable, name: str, shape: int | tuple[int, ...], dtype: DTypeLike = np.float32) -> NDArray:
+        if isinstance(shape, int):
+            shape = (shape,)
+
+        buffers = self._buffers.get(owner)
+        if buffers is None:
+            buffers = self._buffers.setdefault(owner, {})
+
+        buffer = buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            # First use, or the buffer size has changed since the buffer was allocated
+            buffer = buffers[name] = np.empty(shape=shape, dtype=dtype)
+        return buffer
+
+    def release(self, owner: Hashable) -> None:
+        self._buffers.pop(owner, None)
+
+    def clear(self) -> None:
+        self._buffers.clear()
@@ -0,0 +1,470 @@
+from __future__ import annotations
+
+import abc
+from pathlib import Path
+from queue import Queue
+from threading import Event
+from typing import TYPE_CHECKING, Any, ClassVar
+
+import numpy as np
+
+from .ringbuffer import RingBuffer
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+    from pyaudio import PyAudio
+    from soundfile import SoundFile
+
+
+class AudioStream:
+    def __init__(self, backend: AudioBackend, name: str, sample_rate: int, buffer_size: int, channels: int) -> None:
+        self.backend = backend
+        self.name = name
+        self.sample_rate = sample_rate
+        self.buffer_size = buffer_size
+        self.channels = channels
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} {self.name!r} ({self.device_name})>'
+
+    @property
+    def device_name(self) -> str:
+        return self.backend.device_name
+
+    def close(self) -> None:
+        pass
+
+
+class OutputStream(AudioStream, abc.ABC):
+    # Realtime backends count how many times the device ran out of audio to play
+    underruns: int = 0
+
+    @abc.abstractmethod
+    def write(self, buffer: NDArray[np.float32]) -> None:
+        # Buffers are interleaved, with buffer_size frames of every channel
+        pass
+
+    def sync(self) -> None:  # noqa: B027
+        # Block until the device is ready for the next buffer, which paces rendering for realtime backends
+        pass
+
+
+class InputStream(AudioStream, abc.ABC):
+    @abc.abstractmethod
+    def read(self) -> NDArray[np.float32] | None:
+        # Returns an interleaved buffer of the most recent input, or None if there's nothing but silence
+        pass
+
+
+class AudioBackend(abc.ABC):
+    name: ClassVar[str]
+    device_name: str = 'None'
+
+    def __init__(self) -> None:
+        self.output_streams: list[OutputStream] = []
+        self.input_streams: list[InputStream] = []
+
+    def __repr__(self) -> str:
+        return (
+            f'<{self.__class__.__name__} '
+            f'({len(self.output_streams)} outputs, {len(self.input_streams)} inputs)>'
+        )
+
+    def open_output(self, name: str, sample_rate: int, buffer_size: int, channels: int = 2) -> OutputStream:
+        stream = self._open_output(name, sample_rate, buffer_size, channels)
+        self.output_streams.append(stream)
+        return stream
+
+    def open_input(self, name: str, sample_rate: int, buffer_size: int, channels: int = 2) -> InputStream:
+        stream = self._open_input(name, sample_rate, buffer_size, channels)
+        self.input_streams.append(stream)
+        return stream
+
+    @abc.abstractmethod
+    def _open_output(self, name: str, sample_rate: int, buffer_size: int, channels: int) -> OutputStream:
+        pass
+
+    @abc.abstractmethod
+    def _open_input(self, name: str, sample_rate: int, buffer_size: int, channels: int) -> InputStream:
+        pass
+
+    def close_stream(self, stream: AudioStream) -> None:
+        if stream in self.output_streams:
+            self.output_streams.remove(stream)
+        if stream in self.input_streams:
+            self.input_streams.remove(stream)
+        stream.close()
+
+    def reopen_stream(self, stream: AudioStream, sample_rate: int, buffer_size: int) -> AudioStream:
+        # Streams are closed and opened again with the new settings, which for sound cards leaves a short gap
+        self.close_stream(stream)
+        if isinstance(stream, OutputStream):
+            return self.open_output(stream.name, sample_rate, buffer_size, stream.channels)
+        return self.open_input(stream.name, sample_rate, buffer_size, stream.channels)
+
+    @property
+    def underruns(self) -> int:
+        return sum(stream.underruns for stream in list(self.output_streams))
+
+    def sync(self) -> None:
+        # Copy the list, as streams may be opened or closed from other threads meanwhile
+        for stream in list(self.output_streams):
+            stream.sync()
+
+    def terminate(self) -> None:
+        for stream in (*self.output_streams, *self.input_streams):
+            self.close_stream(stream)
+
+
+# PyAudio (PortAudio) sound card backend
+
+
+class PyAudioOutputStream(OutputStream):
+    backend: PyAudioBackend
+
+    def __init__(self, backend: PyAudioBackend, name: str, sample_rate: int, buffer_size: int, channels: int) -> None:
+        import pyaudio
+
+        super().__init__(backend, name, sample_rate, buffer_size, channels)
+        self._continue = pyaudio.paContinue
+        self.closed = False
+        # Up to `lookahead` buffers can be rendered ahead of the device. One more buffer's worth of space is kept free,
+        # as the callback hands PortAudio a view straight into the ring buffer rather than a copy.
+        self.lookahead = backend.lookahead
+        self.ring_buffer = RingBuffer((self.lookahead + 1) * buffer_size, channels)
+        self._silence = np.zeros(shape=(buffer_size, channels), dtype=np.float32)
+        self._space_available = Event()
+        # Times the device ran out of audio while playing, which is heard as a dropout
+        self.underruns = 0
+        self._playing = False
+
+        # noinspection PyTypeChecker
+        self.stream = backend.session.open(
+            rate=sample_rate,
+            channels=channels,
+            format=pyaudio.paFloat32,
+            output=True,
+            frames_per_buffer=buffer_size,
+            stream_callback=self._pyaudio_callback,
+        )
+
+    @property
+    def device_name(self) -> str:
+        return self.backend.session.get_default_output_device_info().get('name')
+
+    def _pyaudio_callback(self, _: None, frame_count: int, *__) -> tuple[Any, int]:
+        buffer = self.ring_buffer.read_view(frame_count)
+        self._space_available.set()
+        if buffer is None:
+            # Nothing's been rendered in time (or rendering has stopped), so count the dropout once and play silence
+            if self._playing:
+                self.underruns += 1
+                self._playing = False
+            buffer = self._silence if frame_count == self.buffer_size else np.zeros((frame_count, self.channels), np.float32)
+        else:
+            self._playing = True
+        return buffer, self._continue
+
+    def write(self, buffer: NDArray[np.float32]) -> None:
+        self.ring_buffer.write(buffer.reshape(-1, self.channels))
+
+    def sync(self) -> None:
+        # Wait for the device to make room for the next buffer, leaving the one it's currently playing alone
+        max_queued = (self.lookahead - 1) * self.buffer_size
+        timeout = self.buffer_size / self.sample_rate
+        while not self.closed and len(self.ring_buffer) > max_queued:
+            self._space_available.wait(timeout)
+            self._space_available.clear()
+
+    def close(self) -> None:
+        self.closed = True
+        self.stream.stop_stream()
+        self.stream.close()
+
+
+class PyAudioInputStream(InputStream):
+    def __init__(self, backend: PyAudioBackend, name: str, sample_rate: int, buffer_size: int, channels: int) -> None:
+        import pyaudio
+
+        super().__init__(backend, name, sample_rate, buffer_size, channels)
+        self._continue = pyaudio.paContinue
+        self.queue: Queue[NDArray[np.float32]] = Queue()
+
+        # noinspection PyTypeChecker
+        self.stream = backend.session.open(
+            rate=sample_rate,
+            channels=channels,
+            format=pyaudio.paFloat32,
+            input=True,
+            frames_per_buffer=buffer_size,
+            stream_callback=self._pyaudio_callback,
+        )
+
+    @property
+    def device_name(self) -> str:
+        return self.backend.session.get_default_input_device_info().get('name')
+
+    def _pyaudio_callback(self, in_data: bytes, *_) -> tuple[None, int]:
+        self.queue.put_nowait(np.frombuffer(in_data, dtype=np.float32))
+        return None, self._continue
+
+    def read(self) -> NDArray[np.float32]:
+        # Drain all stale buffers from the queue, keeping only the most recent one
+        # This ensures we always get live audio instead of buffered audio from before rendering started
+        buffer = None
+        while not self.queue.empty():
+            buffer = self.queue.get()
+
+        # If queue was empty, block and wait for the next buffer
+        if buffer is None:
+            buffer = self.queue.get()
+        return buffer
+
+    def close(self) -> None:
+        self.stream.stop_stream()
+        self.stream.close()
+
+
+class PyAudioBackend(AudioBackend):
+    name = 'pyaudio'
+
+    def __init__(self, lookahead: int = 2) -> None:
+        super().__init__()
+        if lookahead < 1:
+            raise ValueError(f'lookahead must be at least 1 buffer, got {lookahead}')
+        # Buffers which can be rendered ahead of playback: more absorbs render time spikes, but adds latency
+        self.lookahead = lookahead
+        self._session: PyAudio | None = None
+
+    @property
+    def session(self) -> PyAudio:
+        # PortAudio probes every device when it starts up, so only start it once a stream is actually needed
+        if self._session is None:
+            import pyaudio
+
+            self._session = pyaudio.PyAudio()
+        return self._session
+
+    def _open_output(self, name: str, sample_rate: int, buffer_size: int, channels: int) -> OutputStream:
+        return PyAudioOutputStream(self, name, sample_rate, buffer_size, channels)
+
+    def _open_input(self, name: str, sample_rate: int, buffer_size: int, channels: int) -> InputStream:
+        return PyAudioInputStream(self, name, sample_rate, buffer_size, channels)
+
+    def terminate(self) -> None:
+        super().terminate()
+        if self._session is not None:
+            self._session.terminate()
+            self._session = None
+
+
+# Null backend, which discards all output and records silence
+
+
+class NullOutputStream(OutputStream):
+    def write(self, buffer: NDArray[np.float32]) -> None:
+        pass
+
+
+class NullInputStream(InputStream):
+    def read(self) -> None:
+        return None
+
+
+class NullBackend(AudioBackend):
+    name = 'null'
+
+    def _open_output(self, name: str, sample_rate: int, buffer_size: int, channels: int) -> OutputStream:
+        return NullOutputStream(self, name, sample_rate, buffer_size, channels)
+
+    def _open_input(self, name: str, sample_rate: int, buffer_size: int, channels: int) -> InputStream:
+        return NullInputStream(self, name, sample_rate, buffer_size, channels)
+
+
+# File backend, which writes each output to a WAV file and optionally reads input from one
+
+
+class FileOutputStream(OutputStream):
+    backend: FileBackend
+
+    def __init__(self, backend: FileBackend, name: str, sample_rate: int, buffer_size: int, channels: int) -> None:
+        super().__init__(backend, name, sample_rate, buffer_size, channels)
+        self.path: Path | None = None
+        self.file: SoundFile | None = None
+
+    @property
+    def device_name(self) -> str:
+        return self.backend.output_path.as_posix() if self.path is None else self.path.as_posix()
+
+    def write(self, buffer: NDArray[np.float32]) -> None:
+        if self.file is None:
+            # Files are only opened once rendering starts, by which point it's known how many outputs there are
+            from soundfile import SoundFile
+
+            self.path = self.backend.get_output_path(self)
+            self.backend.output_paths.append(self.path)
+            self.file = SoundFile(
+                self.path,
+                mode='w',
+                samplerate=self.sample_rate,
+                channels=self.channels,
+                subtype='FLOAT',
+            )
+        self.file.write(buffer.reshape(-1, self.channels))
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+
+
+class FileInputStream(InputStream):
+    backend: FileBackend
+
+    def __init__(self, backend: FileBackend, name: str, sample_rate: int, buffer_size: int, channels: int) -> None:
+        super().__init__(backend, name, sample_rate, buffer_size, channels)
+        self.file: SoundFile | None = None
+        if backend.input_path is None:
+            return
+
+        from soundfile import SoundFile
+
+        self.file = SoundFile(backend.input_path)
+        if (file_sample_rate := self.file.samplerate) != sample_rate:
+            self.file.close()
+            raise ValueError(
+                f'input file {backend.input_path} has a sample rate of {file_sample_rate}, expected {sample_rate}',
+            )
+        self.buffer = np.zeros(shape=(buffer_size, channels), dtype=np.float32)
+
+    @property
+    def device_name(self) -> str:
+        return 'None' if self.backend.input_path is None else self.backend.input_path.as_posix()
+
+    def read(self) -> NDArray[np.float32] | None:
+        if self.file is None:
+            return None
+
+        frames = self.file.read(self.buffer_size, dtype='float32', always_2d=True)
+        if not len(frames):
+            # Silence once the end of the file is reached
+            return None
+
+        # Mono (or other mismatched) files are spread across every channel
+        self.buffer.fill(0)
+        self.buffer[:len(frames)] = frames if frames.shape[1] == self.channels else frames[:, :1]
+        return self.buffer.ravel()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+
+
+class FileBackend(AudioBackend):
+    name = 'file'
+
+    def __init__(self, output_path: Path | str = 'output.wav', input_path: Path | str | None = None) -> None:
+        super().__init__()
+        self.output_path = Path(output_path)
+        self.input_path = None if input_path is None else Path(input_path)
+        self.output_paths: list[Path] = []
+
+    def get_output_path(self, stream: FileOutputStream) -> Path:
+        # Give each output its own file if there's more than one of them
+        if len(self.output_streams) == 1:
+            return self.output_path
+        return self.output_path.with_name(f'{self.output_path.stem}.{stream.name}{self.output_path.suffix}')
+
+    def _open_output(self, name: str, sample_rate: int, buffer_size: int, channels: int) -> OutputStream:
+        return FileOutputStream(self, name, sample_rate, buffer_size, channels)
+
+    def reopen_stream(self, stream: AudioStream, sample_rate: int, buffer_size: int) -> AudioStream:
+        # Files carry on from where they were, which only works if they're still read or written at the same rate
+        stream: FileOutputStream | FileInputStream
+        if sample_rate != stream.sample_rate:
+            if stream.file is not None:
+                raise ValueError(f"can't change the sample rate of {stream.device_name} part way through")
+            stream.sample_rate = sample_rate
+
+        stream.buffer_size = buffer_size
+        if isinstance(stream, FileInputStream) and stream.file is not None:
+            stream.buffer = np.zeros(shape=(buffer_size, stream.channels), dtype=np.float32)
+        return stream
+
+    def _open_input(self, name: str, sample_rate: int, buffer_size: int, channels: int) -> InputStream:
+        return FileInputStream(self, name, sample_rate, buffer_size, channels)
+
+
+# In-memory ring buffer backend, for feeding audio to and from other code running in the same process
+
+
+class RingBufferOutputStream(OutputStream):
+    def __init__(
+        self,
+        backend: RingBufferBackend,
+        name: str,
+        sample_rate: int,
+        buffer_size: int,
+        channels: int,
+    ) -> None:
+        super().__init__(backend, name, sample_rate, buffer_size, channels)
+        self.ring_buffer = backend.get_output(name, channels)
+
+    def write(self, buffer: NDArray[np.float32]) -> None:
+        self.ring_buffer.write(buffer.reshape(-1, self.channels))
+
+
+class RingBufferInputStream(InputStream):
+    def __init__(
+        self,
+        backend: RingBufferBackend,
+        name: str,
+        sample_rate: int,
+        buffer_size: int,
+        channels: int,
+    ) -> None:
+        super().__init__(backend, name, sample_rate, buffer_size, channels)
+        self.ring_buffer = backend.get_input(name, channels)
+        self.buffer = np.empty(shape=(buffer_size, channels), dtype=np.float32)
+
+    def read(self) -> NDArray[np.float32] | None:
+        buffer = self.ring_buffer.read(self.buffer_size, out=self.buffer)
+        return None if buffer is None else buffer.ravel()
+
+
+class RingBufferBackend(AudioBackend):
+    name = 'ringbuffer'
+    device_name = 'Ring buffer'
+
+    def __init__(self, capacity: int = 65536) -> None:
+        super().__init__()
+        self.capacity = capacity
+        # Ring buffers are keyed by the name of the stream's node, and can be fetched before the node is created
+        self.outputs: dict[str, RingBuffer] = {}
+        self.inputs: dict[str, RingBuffer] = {}
+
+    def get_output(self, name: str, channels: int = 2) -> RingBuffer:
+        if name not in self.outputs:
+            self.outputs[name] = RingBuffer(self.capacity, channels)
+        return self.outputs[name]
+
+    def get_input(self, name: str, channels: int = 2) -> RingBuffer:
+        if name not in self.inputs:
+            self.inputs[name] = RingBuffer(self.capacity, channels)
+        return self.inputs[name]
+
+    def _open_output(self, name: str, sample_rate: int, buffer_size: int, channels: int) -> OutputStream:
+        return RingBufferOutputStream(self, name, sample_rate, buffer_size, channels)
+
+    def _open_input(self, name: str, sample_rate: int, buffer_size: int, channels: int) -> InputStream:
+        return RingBufferInputStream(self, name, sample_rate, buffer_size, channels)
+
+
+BACKENDS: dict[str, type[AudioBackend]] = {
+    backend.name: backend for backend in (PyAudioBackend, NullBackend, FileBackend, RingBufferBackend)
+}
+
+
+def get_backend(name: str, **options: Any) -> AudioBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"audio backend '{name}' not found (expected one of {', '.join(BACKENDS)})")
+    return BACKENDS[name](**options)
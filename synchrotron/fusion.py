@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import dataclasses
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
+
+from .nodes import ConstantStream, StreamInput
+
+if TYPE_CHECKING:
+    from collections.abc import Collection, Mapping, Sequence
+
+    from .nodes import Node, Output, RenderContext
+    from .schedule import RenderStep
+
+# Kernel outputs are an expression per output, or a tuple of expressions (one per channel) for multichannel outputs
+KernelOutputs = dict[str, 'Expression | tuple[Expression, ...]']
+
+
+class Expression(NDArrayOperatorsMixin):
+    # Nodes' kernels are written as ordinary NumPy code on expressions, which records each ufunc applied to them rather
+    # than evaluating it
+    def __array_ufunc__(self, ufunc: np.ufunc, method: str, *inputs: Any, **kwargs: Any) -> Any:
+        if method != '__call__' or kwargs or ufunc.nout != 1:
+            return NotImplemented
+        return Operation(ufunc, inputs)
+
+
+class Operand(Expression):
+    # A stream input, which is read when the kernel runs unless it's connected to another node in the same kernel
+    def __init__(self, port: StreamInput, default_constant: float = 0.) -> None:
+        self.port = port
+        self.default_constant = default_constant
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.port.instance_name!r})'
+
+
+class Operation(Expression):
+    def __init__(self, ufunc: np.ufunc, args: tuple[Any, ...]) -> None:
+        self.ufunc = ufunc
+        self.args = args
+
+    def __repr__(self) -> str:
+        return f'{self.ufunc.__name__}({", ".join(map(repr, self.args))})'
+
+
+class FusedKernel:
+    # Renders a chain of element-wise nodes in one step, by running every node's ufuncs in turn on a few scratch buffers
+    # which are reused once each intermediate result has been used for the last time. Ufuncs on constant inputs are
+    # evaluated on the scalar value, and outputs are rendered straight into the last node's output buffers, exactly as
+    # the nodes themselves would, so the result is the same down to the bit.
+    def __init__(self, nodes: Sequence[Node], kernels: Mapping[Node, KernelOutputs], ctx: RenderContext) -> None:
+        self.root = nodes[-1]
+        self.nodes = tuple(nodes)
+        self._template: list[Any] = []
+        self._reads: list[tuple[StreamInput, float, int]] = []
+        self._operations: list[list[Any]] = []
+        self._outputs: list[tuple[Output, int | tuple[int, ...], np.ndarray, tuple[np.ndarray, ...]]] = []
+
+        members = set(nodes)
+        registers: dict[int, int] = {}
+        producers: dict[int, list[Any]] = {}
+
+        def add_register(value: Any = None) -> int:
+            self._template.append(value)
+            return len(self._template) - 1
+
+        def register(expression: Any) -> int:
+            if not isinstance(expression, Expression):
+                return add_register(expression)
+            if id(expression) in registers:
+                return registers[id(expression)]
+
+            if isinstance(expression, Operand):
+                connection = expression.port.connection
+                if connection is not None and connection.source.node in members:
+                    index = register(kernels[connection.source.node][connection.source.name])
+                else:
+                    index = add_register()
+                    self._reads.append((expression.port, expression.default_constant, index))
+            else:
+                args = tuple(register(arg) for arg in expression.args)
+                index = add_register()
+                # [ufunc, argument registers, result register, output array]
+                operation = [expression.ufunc, args, index, None]
+                self._operations.append(operation)
+                producers[index] = operation
+
+            registers[id(expression)] = index
+            return index
+
+        pinned = set()
+        for name, expressions in kernels[self.root].items():
+            output = self.root.get_output(name)
+            buffer = output.get_buffer(ctx)
+            if isinstance(expressions, tuple):
+                indices = tuple(register(expression) for expression in expressions)
+                destinations = tuple(buffer)
+            else:
+                indices = register(expressions)
+                destinations = (buffer,)
+            # Each result is rendered straight into the output buffer which first needs it
+            for index, destination in zip(
+                indices if isinstance(indices, tuple) else (indices,),
+                destinations,
+                strict=True,
+            ):
+                operation = producers.get(index)
+                if operation is not None and operation[3] is None:
+                    operation[3] = destination
+                pinned.add(index)
+            self._outputs.append((output, indices, buffer, destinations))
+
+        # Intermediate results get a scratch buffer, which is free to reuse once nothing else will read the result
+        last_uses = {}
+        for position, (_, args, _, _) in enumerate(self._operations):
+            for arg in args:
+                last_uses[arg] = position
+        free_buffers: list[np.ndarray] = []
+        buffer_count = 0
+        held_buffers: dict[int, np.ndarray] = {}
+        for position, operation in enumerate(self._operations):
+            _, args, index, out = operation
+            for arg in set(args):
+                if last_uses.get(arg) == position and arg in held_buffers:
+                    free_buffers.append(held_buffers.pop(arg))
+            if out is not None:
+                continue
+            if free_buffers:
+                out = free_buffers.pop()
+            else:
+                out = self.root.get_buffer(ctx, f'fused {buffer_count}')
+                buffer_count += 1
+            operation[3] = out
+            if index in last_uses and index not in pinned:
+                held_buffers[index] = out
+            elif index not in pinned:
+                free_buffers.append(out)
+
+        self._operations = [tuple(operation) for operation in self._operations]
+        self._plans: dict[tuple[bool, ...], list[tuple[np.ufunc, tuple[int, ...], int, Any]]] = {}
+
+    def __repr__(self) -> str:
+        return (
+            f'<{self.__class__.__name__} {" -> ".join(node.name for node in self.nodes)} '
+            f'({len(self._operations)} ufuncs)>'
+        )
+
+    def _get_plan(self, constant_reads: tuple[bool, ...]) -> list[tuple[np.ufunc, tuple[int, ...], int, Any]]:
+        # Ufuncs on constant inputs only (like ufuncs on constant streams) are evaluated on scalars, which depends on
+        # which inputs are constant, so the operations are planned once for each combination of constant inputs seen
+        constant = [True] * len(self._template)
+        for (_, _, index), is_constant in zip(self._reads, constant_reads, strict=True):
+            constant[index] = is_constant
+        plan = []
+        for ufunc, args, index, out in self._operations:
+            constant[index] = all(constant[arg] for arg in args)
+            plan.append((ufunc, args, index, None if constant[index] else out))
+        self._plans[constant_reads] = plan
+        return plan
+
+    def __call__(self, ctx: RenderContext) -> None:
+        values = self._template.copy()
+        constant_reads = []
+        for port, default_constant, index in self._reads:
+            value = port.read(ctx, default_constant)
+            is_constant = isinstance(value, ConstantStream)
+            values[index] = value.value if is_constant else value
+            constant_reads.append(is_constant)
+
+        constant_reads = tuple(constant_reads)
+        plan = self._plans.get(constant_reads) or self._get_plan(constant_reads)
+        for ufunc, args, index, out in plan:
+            values[index] = ufunc(*map(values.__getitem__, args), out=out)
+
+        for output, indices, buffer, destinations in self._outputs:
+            if isinstance(indices, tuple):
+                for index, destination in zip(indices, destinations, strict=True):
+                    if values[index] is not destination:
+                        destination[...] = values[index]
+                output.write(buffer)
+                continue
+
+            value = values[indices]
+            if not isinstance(value, np.ndarray):
+                value = ConstantStream(value, ctx.buffer_size, np.result_type(value))
+            output.write(value)
+
+
+def get_kernel(node: Node) -> KernelOutputs | None:
+    # Only pure nodes can be fused, as the nodes inside a fused step are never rendered themselves
+    if not node.pure:
+        return None
+    return node.get_kernel(Operand)
+
+
+def can_fuse_into(node: Node, consumers: Collection[Node]) -> bool:
+    # A node is fused into the node it feeds if that's the only node it feeds, through plain mono streams
+    if len(consumers) != 1:
+        return False
+    return all(
+        isinstance(connection.sink, StreamInput)
+        and output.channels == 1
+        and connection.sink.get_conversion(output) is None
+        for output in node.outputs
+        for connection in output.connections
+    )
+
+
+def fuse_steps(steps: Sequence[RenderStep], ctx: RenderContext) -> tuple[list[RenderStep], dict[Node, Node]]:
+    # Chains (or trees) of element-wise nodes are replaced by a single step rendering the last node in the chain, which
+    # runs all of their kernels. Returns the new steps, and which node's step each fused node is now rendered by.
+    kernels = {}
+    for step in steps:
+        kernel = get_kernel(step.node)
+        if kernel is not None:
+            kernels[step.node] = kernel
+
+    fused_into: dict[Node, Node] = {}
+    for step in reversed(steps):
+        node = step.node
+        if node not in kernels:
+            continue
+        consumers = {connection.sink.node for output in node.outputs for connection in output.connections}
+        consumer = next(iter(consumers), None)
+        if can_fuse_into(node, consumers) and consumer in kernels:
+            fused_into[node] = fused_into.get(consumer, consumer)
+
+    members: dict[Node, list[Node]] = {}
+    for step in steps:
+        if step.node in fused_into:
+            members.setdefault(fused_into[step.node], []).append(step.node)
+
+    fused_steps = []
+    for step in steps:
+        if step.node in fused_into:
+            continue
+        if step.node in members:
+            kernel = FusedKernel([*members[step.node], step.node], kernels, ctx)
+            step = dataclasses.replace(step, render=kernel, fused_nodes=tuple(members[step.node]))
+        fused_steps.append(step)
+    return fused_steps, fused_into
@@ -1,5 +1,6 @@
 from ._base import (
     Connection,
+    ConstantStream,
     DataInput,
     DataOutput,
     Input,
@@ -9,6 +10,6 @@ from ._base import (
     RenderContext,
     StreamInput,
     StreamOutput,
-    get_node_types,
 )
 from ._midi import MidiBuffer, MidiInput, MidiMessage, MidiOutput
+from ._registry import NodeRegistry, NodeTypeInfo, find_node_types, get_node_types
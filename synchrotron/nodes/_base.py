@@ -1,18 +1,20 @@
 from __future__ import annotations
 
 import abc
+import copy
+import functools
 from dataclasses import dataclass
-from importlib import import_module
-from pathlib import Path
-from typing import TYPE_CHECKING, Any, get_type_hints
+from typing import TYPE_CHECKING, Any, ClassVar, get_type_hints
 
 import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
 
 if TYPE_CHECKING:
-    from collections.abc import ValuesView
+    from collections.abc import Callable, Iterator, ValuesView
 
-    from numpy.typing import NDArray
+    from numpy.typing import DTypeLike, NDArray
 
+    from synchrotron.fusion import Expression, KernelOutputs
     from synchrotron.synchrotron import Synchrotron
 
 
@@ -33,6 +35,10 @@ class Port:
     def __repr__(self) -> str:
         return f'<{self.__class__.__name__} {self.node.__class__.__name__} {self.instance_name!r}>'
 
+    def reconfigure(self, buffer_size: int) -> None:  # noqa: B027
+        # Reallocate anything sized by the buffer size, which has changed since the port was created
+        pass
+
     def as_json(self) -> dict:
         return {
             'node_name': self.node.name,
@@ -49,6 +55,14 @@ class Input(Port, abc.ABC):
     def read(self, *_, **__) -> Any:
         return self.buffer
 
+    def check_source(self, source: Output) -> None:  # noqa: B027
+        # Raises a ValueError if the output can't be connected to this input
+        pass
+
+    def get_conversion(self, source: Output) -> Callable[[Any], Any] | None:
+        # How buffers from the output are converted before this input reads them, if they need to be at all
+        return None
+
     def as_json(self, include_source: bool = True) -> dict:
         json = super().as_json()
         json['type'] = self.__class__.__name__
@@ -86,19 +100,202 @@ class DataOutput(Output):
         self.buffer = buffer
 
 
-class StreamInput(Input):
-    # TODO: Some magic with generics to allow for non-float32 streams
-    def read(self, render_context: RenderContext, default_constant: float = 0.) -> NDArray[np.float32]:
-        if self.connection is None:
-            self.buffer = np.full(shape=render_context.buffer_size, fill_value=default_constant, dtype=np.float32)
-        elif not isinstance(self.buffer, np.ndarray):
-            self.buffer = np.full(shape=render_context.buffer_size, fill_value=self.buffer, dtype=np.float32)
+class ConstantStream(NDArrayOperatorsMixin):
+    # A stream holding the same value for every sample, which is only materialised into a full buffer if something
+    # actually needs one. Nodes can check for this to take a scalar fast path. Otherwise it behaves like a read-only
+    # array, and ufuncs on constant streams are evaluated on the scalar value alone.
+    def __init__(self, value: Any, size: int, dtype: DTypeLike = np.float32) -> None:
+        self.dtype = np.dtype(dtype)
+        self.value = self.dtype.type(value)
+        self.size = size
+        self._array: NDArray | None = None
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.value!r}, size={self.size}, dtype={self.dtype})'
+
+    @property
+    def shape(self) -> tuple[int]:
+        return (self.size,)
+
+    @property
+    def ndim(self) -> int:
+        return 1
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, int) and -self.size <= index < self.size:
+            return self.value
+        return np.asarray(self)[index]
+
+    def __iter__(self) -> Iterator:
+        return iter(np.asarray(self))
+
+    def __array__(self, dtype: DTypeLike | None = None, copy: bool | None = None) -> NDArray:
+        if self._array is None:
+            array = np.full(shape=self.size, fill_value=self.value, dtype=self.dtype)
+            array.flags.writeable = False
+            self._array = array
+
+        if dtype is not None and np.dtype(dtype) != self.dtype:
+            return self._array.astype(dtype)
+        if copy:
+            return self._array.copy()
+        return self._array
+
+    def __array_ufunc__(self, ufunc: np.ufunc, method: str, *inputs: Any, **kwargs: Any) -> Any:
+        out = kwargs.get('out', ())
+        if any(isinstance(array, ConstantStream) for array in out):
+            return NotImplemented
+        if method != '__call__':
+            return getattr(ufunc, method)(*_materialise(inputs), **kwargs)
+
+        # Evaluate on scalar values, which broadcast against any regular arrays
+        all_constant = True
+        scalar_inputs = []
+        for value in inputs:
+            if isinstance(value, ConstantStream):
+                value = value.value
+            elif isinstance(value, np.ndarray) and value.ndim:
+                all_constant = False
+            scalar_inputs.append(value)
+
+        result = ufunc(*scalar_inputs, **kwargs)
+        if out or not all_constant:
+            return result
+        if isinstance(result, tuple):
+            return tuple(ConstantStream(value, self.size, value.dtype) for value in result)
+        return ConstantStream(result, self.size, np.result_type(result))
+
+    def __array_function__(self, func: Callable, types: Any, args: tuple, kwargs: dict) -> Any:
+        return func(*_materialise(args), **_materialise(kwargs))
+
+    def astype(self, dtype: DTypeLike) -> ConstantStream:
+        return ConstantStream(self.value, self.size, dtype)
+
+    def copy(self) -> NDArray:
+        return np.array(self)
+
+    def item(self) -> Any:
+        return self.value.item()
+
+
+def _materialise(value: Any) -> Any:
+    if isinstance(value, ConstantStream):
+        return np.asarray(value)
+    if isinstance(value, (tuple, list)):
+        return type(value)(_materialise(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _materialise(item) for key, item in value.items()}
+    return value
+
+
+def cast_stream(stream: NDArray | ConstantStream, dtype: np.dtype) -> NDArray | ConstantStream:
+    if stream.dtype == dtype:
+        return stream
+    # Streams become boolean where they're nonzero, as triggers and gates always treated numbers before they had types
+    if dtype.kind == 'b':
+        return np.not_equal(stream, 0)
+    return stream.astype(dtype)
+
+
+@dataclass(frozen=True)
+class StreamConversion:
+    # Applied to buffers copied between stream ports of different types, and only compiled into the render schedule for
+    # connections which need one
+    dtype: np.dtype
+    channels: int
+
+    def __call__(self, buffer: Any) -> Any:
+        if not isinstance(buffer, (np.ndarray, ConstantStream)):
+            return buffer
+        buffer = cast_stream(buffer, self.dtype)
+        # Mono streams are shared by every channel. Constant streams stay one-dimensional, and broadcast the same way.
+        if self.channels > 1 and isinstance(buffer, np.ndarray) and buffer.ndim == 1:
+            buffer = np.broadcast_to(buffer, (self.channels, buffer.shape[0]))
+        return buffer
+
+
+class StreamPort(Port):
+    # Streams carry float32 mono buffers unless the port type says otherwise, e.g. StreamOutput[np.bool] for triggers or
+    # StreamInput[np.float32, 2] for stereo, whose buffers are shaped (channels, buffer size)
+    dtype: ClassVar[np.dtype] = np.dtype(np.float32)
+    channels: ClassVar[int] = 1
+
+    def __class_getitem__(cls, params: DTypeLike | tuple[DTypeLike, int]) -> type[StreamPort]:
+        dtype, channels = params if isinstance(params, tuple) else (params, 1)
+        return _typed_stream_port(cls, np.dtype(dtype), channels)
+
+    def as_json(self, *args: Any, **kwargs: Any) -> dict:
+        json = super().as_json(*args, **kwargs)
+        json['dtype'] = self.dtype.name
+        json['channels'] = self.channels
+        return json
 
-        return self.buffer
 
+@functools.cache
+def _typed_stream_port(port_type: type[StreamPort], dtype: np.dtype, channels: int) -> type[StreamPort]:
+    if dtype.kind not in 'biuf':
+        raise TypeError(f"streams can't carry '{dtype}' samples")
+    if channels < 1:
+        raise TypeError(f'streams must have at least one channel, not {channels}')
+    # Named the same as the port type it's made from, so typed ports look like any other stream port to the API
+    return type(port_type.__name__, (port_type,), {
+        '__module__': port_type.__module__,
+        '__qualname__': f'{port_type.__qualname__}[{dtype}, {channels}]',
+        'dtype': dtype,
+        'channels': channels,
+    })
+
+
+class StreamInput(StreamPort, Input):
+    def __init__(self, node: Node, name: str) -> None:
+        super().__init__(node=node, name=name)
+        self._constant: ConstantStream | None = None
+        self._constant_source: Any = None
 
-class StreamOutput(Output):
-    def write(self, buffer: NDArray[np.float32]) -> None:
+    def read(self, render_context: RenderContext, default_constant: float = 0.) -> NDArray | ConstantStream:
+        if self.connection is None:
+            return self._read_constant(render_context, default_constant)
+        if not isinstance(self.buffer, (np.ndarray, ConstantStream)):
+            return self._read_constant(render_context, self.buffer)
+        return self.buffer
+
+    def check_source(self, source: Output) -> None:
+        if not isinstance(source, (StreamOutput, DataOutput)):
+            raise ValueError(f"can't connect {source.__class__.__name__} {source.instance_name} to stream input "
+                             f'{self.instance_name}')
+        # Mono streams can go to every channel of a multichannel input, but channels are never mixed down implicitly
+        if isinstance(source, StreamOutput) and source.channels not in (1, self.channels):
+            raise ValueError(f"can't connect {source.channels}-channel stream {source.instance_name} to "
+                             f'{self.channels}-channel input {self.instance_name}')
+
+    def get_conversion(self, source: Output) -> StreamConversion | None:
+        if not isinstance(source, StreamOutput) or (source.dtype, source.channels) == (self.dtype, self.channels):
+            return None
+        return StreamConversion(self.dtype, self.channels)
+
+    def reconfigure(self, buffer_size: int) -> None:
+        self._constant = None
+
+    def _read_constant(self, render_context: RenderContext, value: float) -> ConstantStream:
+        # Reuse the same constant stream until the value changes, so it's only ever materialised once
+        constant = self._constant
+        if constant is None or value != self._constant_source or constant.size != render_context.buffer_size:
+            constant = self._constant = cast_stream(ConstantStream(value, render_context.buffer_size), self.dtype)
+            self._constant_source = value
+        return constant
+
+
+class StreamOutput(StreamPort, Output):
+    def get_buffer(self, render_context: RenderContext, dtype: DTypeLike | None = None) -> NDArray:
+        # Nodes should render into this buffer rather than allocating a new one every block
+        shape = render_context.buffer_size if self.channels == 1 else (self.channels, render_context.buffer_size)
+        dtype = self.dtype if dtype is None else dtype
+        return self.node.get_buffer(render_context, self.name, dtype=dtype, shape=shape)
+
+    def write(self, buffer: NDArray) -> None:
         self.buffer = buffer
 
 
@@ -129,6 +326,19 @@ class Connection:
 
 
 class Node(abc.ABC):
+    # Nodes with side effects (e.g. audio sinks) are always rendered, along with everything upstream of them.
+    # Any other node is culled from rendering if its outputs can't reach one of these nodes.
+    always_render: ClassVar[bool] = False
+    # Pure nodes have no internal state or side effects, so their outputs only depend on their inputs. When all of a
+    # pure node's inputs are constant, it's folded: rendered once when the graph is compiled instead of every buffer.
+    pure: ClassVar[bool] = False
+    # Whether the node can be rendered in a worker process instead. Nodes which own audio streams can't be (the worker
+    # has no audio backend), and neither can nodes which need more than a name to be created.
+    offloadable: ClassVar[bool] = True
+    # Attributes holding the node's runtime state (e.g. an oscillator's phase), which are saved in session snapshots and
+    # put back when one is restored. Nodes whose state isn't kept in plain attributes override get_state and set_state.
+    state_attributes: ClassVar[tuple[str, ...]] = ()
+
     def __init__(self, synchrotron: Synchrotron, name: str) -> None:
         self.synchrotron = synchrotron
         self.name = name
@@ -137,10 +347,7 @@ class Node(abc.ABC):
         self._outputs: dict[str, Output] = {}
 
         # A bit of magic so inputs and outputs are nicer to interact with
-        for name, cls in get_type_hints(self.__class__).items():
-            if not issubclass(cls, Port):
-                continue
-
+        for name, cls in _get_port_types(self.__class__):
             if name in self._inputs or name in self._outputs:
                 raise RuntimeError(f"duplicate port name '{name}' for node {self.__class__.__name__}")
 
@@ -191,10 +398,26 @@ class Node(abc.ABC):
             return self._outputs[port_name]
         raise ValueError(f'port {self.__class__.__name__}.{port_name} does not exist')
 
+    def get_buffer(
+        self,
+        ctx: RenderContext,
+        name: str,
+        dtype: DTypeLike = np.float32,
+        shape: int | tuple[int, ...] | None = None,
+    ) -> NDArray:
+        return self.synchrotron.buffer_arena.get(self, name, ctx.buffer_size if shape is None else shape, dtype)
+
     @abc.abstractmethod
     def render(self, ctx: RenderContext) -> None:
         pass
 
+    def get_kernel(self, read: Callable[..., Expression]) -> KernelOutputs | None:
+        # Pure element-wise nodes can also describe each output as NumPy ufuncs applied to their inputs, which are read
+        # with read(port, default_constant) rather than port.read(ctx, default_constant). Chains of these nodes are
+        # fused into a single render step (see synchrotron.fusion), so the kernel must give exactly the same result as
+        # render.
+        return None
+
     def as_json(self) -> dict:
         return {
             'name': self.name,
@@ -204,23 +427,42 @@ class Node(abc.ABC):
             'exports': self.exports,
         }
 
+    def reconfigure(self, sample_rate: int, buffer_size: int) -> None:
+        # Called between two buffers when the session's sample rate or buffer size changes, after which the node carries
+        # on with its state intact. Nodes override this (calling it too) to rebuild whatever depends on either setting.
+        for port in (*self.inputs, *self.outputs):
+            port.reconfigure(buffer_size)
+
+    def get_state(self) -> dict[str, Any]:
+        # A copy, so it can be saved away from the render thread while the node carries on
+        return {name: copy.deepcopy(getattr(self, name)) for name in self.state_attributes}
+
+    def prepare_state(self, state: dict[str, Any]) -> dict[str, Any]:
+        # Called before a state is handed to set_state() between buffers, to do anything slow (like loading files) away
+        # from the render thread. Returns the state to pass to set_state().
+        return state
+
+    def set_state(self, state: dict[str, Any]) -> None:
+        for name in self.state_attributes:
+            if name in state:
+                setattr(self, name, state[name])
+
     def teardown(self) -> None:  # noqa: B027
         pass
 
 
+@functools.cache
+def _get_port_types(node_type: type[Node]) -> tuple[tuple[str, type[Port]], ...]:
+    # Resolving type hints is slow, and only needs doing once per node type rather than for every node
+    return tuple(
+        (name, cls)
+        for name, cls in get_type_hints(node_type).items()
+        if isinstance(cls, type) and issubclass(cls, Port)
+    )
+
+
 @dataclass
 class RenderContext:
     global_clock: int
     sample_rate: int
     buffer_size: int
-
-
-def get_node_types() -> list[type[Node]]:
-    node_types = []
-
-    for path in Path(__file__).parent.rglob('[!_]*.py'):
-        module = import_module('.' + path.stem, package='synchrotron.nodes')
-        if hasattr(module, '__all__'):
-            node_types.extend(getattr(module, node_name) for node_name in module.__all__)
-
-    return node_types
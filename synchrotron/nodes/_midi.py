@@ -1,7 +1,16 @@
 from __future__ import annotations
 
+from typing import TYPE_CHECKING
+
+import numpy as np
+
 from synchrotron.nodes import Input, Node, Output
 
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from numpy.typing import ArrayLike, NDArray
+
 
 class MidiMessage:
     OPCODE_MASK = 0xf0
@@ -11,37 +20,141 @@ class MidiMessage:
     NOTE_ON = 0x90
 
 
+# One row per message, sorted by position. size is the message's length in bytes, as messages like program changes are
+# shorter than 3 bytes.
+MIDI_EVENT_DTYPE = np.dtype([
+    ('position', np.int32),
+    ('status', np.uint8),
+    ('data1', np.uint8),
+    ('data2', np.uint8),
+    ('size', np.uint8),
+])
+MAX_MESSAGE_SIZE = 3
+
+
 class MidiBuffer:
-    def __init__(self, length: int):
-        self.data: dict[int, list[bytes]] = {}
+    # A buffer's MIDI messages as a structured array, so nodes can filter and transform them in bulk rather than looking
+    # at every sample position. Messages added one at a time with add_message() are collected in a list, and only
+    # merged into the array when it's next needed.
+    def __init__(self, length: int, events: NDArray | None = None):
         self.length = length
+        self._events = np.empty(0, dtype=MIDI_EVENT_DTYPE) if events is None else events
+        self._pending: list[tuple[int, int, int, int, int]] = []
 
     def __len__(self) -> int:
-        return sum(len(msgs) for msgs in self.data.values())
+        return len(self._events) + len(self._pending)
+
+    def __repr__(self) -> str:
+        return f'MidiBuffer({self.data})'
+
+    @property
+    def events(self) -> NDArray:
+        if self._pending:
+            pending = np.array(self._pending, dtype=MIDI_EVENT_DTYPE)
+            self._pending.clear()
+            events = np.concatenate((self._events, pending))
+            # Stable, so messages at the same position stay in the order they were added
+            self._events = events[np.argsort(events['position'], kind='stable')]
+        return self._events
+
+    @property
+    def positions(self) -> NDArray[np.int32]:
+        return self.events['position']
+
+    @property
+    def opcodes(self) -> NDArray[np.uint8]:
+        return self.events['status'] & MidiMessage.OPCODE_MASK
+
+    @property
+    def data(self) -> dict[int, list[bytes]]:
+        # Messages by position, as MidiBuffer used to store them
+        data: dict[int, list[bytes]] = {}
+        for position, message in self:
+            data.setdefault(position, []).append(message)
+        return data
+
+    def __iter__(self) -> Iterator[tuple[int, bytes]]:
+        for position, status, data1, data2, size in self.events.tolist():
+            yield position, bytes((status, data1, data2)[:size])
+
+    def iter_events(self) -> Iterator[tuple[int, int, int, int]]:
+        # (position, status, data 1, data 2) for each message, as plain ints
+        for position, status, data1, data2, _ in self.events.tolist():
+            yield position, status, data1, data2
+
+    def iter_positions(self) -> Iterator[tuple[int, NDArray]]:
+        # Only the positions which have any messages, along with their messages
+        events = self.events
+        if not len(events):
+            return
+        boundaries = np.flatnonzero(np.diff(events['position'])) + 1
+        starts = [0, *boundaries.tolist()]
+        stops = [*boundaries.tolist(), len(events)]
+        for start, stop in zip(starts, stops, strict=True):
+            yield int(events['position'][start]), events[start:stop]
 
     def get_messages_at_pos(self, position: int) -> tuple[bytes, ...]:
         if position not in range(self.length):
             raise ValueError(f'MIDI message position {position} out of bounds for buffer length {self.length}')
 
-        if position not in self.data:
-            return ()
-        return tuple(self.data[position])
+        positions = self.positions
+        start, stop = np.searchsorted(positions, (position, position + 1))
+        return tuple(
+            bytes((status, data1, data2)[:size])
+            for _, status, data1, data2, size in self._events[start:stop].tolist()
+        )
 
     def add_message(self, position: int, message: bytes | bytearray):
-        if isinstance(message, bytearray):
-            message = bytes(message)
-        elif not isinstance(message, bytes):
+        if not isinstance(message, (bytes, bytearray)):
             raise TypeError('MIDI message must be bytes or bytearray')
+        if not 0 < len(message) <= MAX_MESSAGE_SIZE:
+            raise ValueError(f'MIDI messages must be 1 to {MAX_MESSAGE_SIZE} bytes long, not {len(message)}')
 
         if position not in range(self.length):
             raise ValueError(f'MIDI message position {position} out of bounds for buffer length {self.length}')
 
-        if position not in self.data:
-            self.data[position] = []
-        self.data[position].append(message)
-
-    def __repr__(self) -> str:
-        return f'MidiBuffer({self.data})'
+        padded = bytes(message) + bytes(MAX_MESSAGE_SIZE - len(message))
+        self._pending.append((position, padded[0], padded[1], padded[2], len(message)))
+
+    def filter(self, mask: ArrayLike) -> MidiBuffer:
+        # A new buffer with only the messages where mask is true
+        return MidiBuffer(self.length, self.events[mask])
+
+    def filter_opcodes(self, *opcodes: int) -> MidiBuffer:
+        # Much faster than np.isin for a couple of opcodes
+        buffer_opcodes = self.opcodes
+        mask = np.zeros(len(buffer_opcodes), dtype=np.bool)
+        for opcode in opcodes:
+            mask |= buffer_opcodes == opcode
+        return self.filter(mask)
+
+    def is_note_on(self) -> NDArray[np.bool]:
+        events = self.events
+        return ((events['status'] & MidiMessage.OPCODE_MASK) == MidiMessage.NOTE_ON) & (events['data2'] > 0)
+
+    def is_note_off(self) -> NDArray[np.bool]:
+        # Note ons with a velocity of 0 are note offs too
+        events = self.events
+        opcodes = events['status'] & MidiMessage.OPCODE_MASK
+        return (opcodes == MidiMessage.NOTE_OFF) | ((opcodes == MidiMessage.NOTE_ON) & (events['data2'] == 0))
+
+    def transpose(self, semitones: ArrayLike) -> MidiBuffer:
+        # Shifts the note of every note on and off, by a number of semitones for all of them or for each message. Notes
+        # shifted out of MIDI's range are dropped, and other messages are left as they are.
+        events = self.events.copy()
+        opcodes = events['status'] & MidiMessage.OPCODE_MASK
+        is_note = (opcodes == MidiMessage.NOTE_ON) | (opcodes == MidiMessage.NOTE_OFF)
+        notes = events['data1'] + np.asarray(semitones, dtype=np.int64)
+        in_range = (notes >= 0) & (notes <= 127)
+        events['data1'] = np.where(is_note & in_range, notes, events['data1'])
+        return MidiBuffer(self.length, events[~is_note | in_range])
+
+    @classmethod
+    def merge(cls, *buffers: MidiBuffer) -> MidiBuffer:
+        # Messages at the same position keep the order of the buffers they came from
+        length = max((buffer.length for buffer in buffers), default=0)
+        events = np.concatenate([np.empty(0, dtype=MIDI_EVENT_DTYPE), *(buffer.events for buffer in buffers)])
+        return cls(length, events[np.argsort(events['position'], kind='stable')])
 
 
 class MidiInput(Input):
@@ -52,6 +165,9 @@ class MidiInput(Input):
     def read(self) -> MidiBuffer:
         return self.buffer
 
+    def reconfigure(self, buffer_size: int) -> None:
+        self.buffer = MidiBuffer(length=buffer_size)
+
 
 class MidiOutput(Output):
     def __init__(self, node: Node, name: str):
@@ -60,3 +176,6 @@ class MidiOutput(Output):
 
     def write(self, buffer: MidiBuffer) -> None:
         self.buffer = buffer
+
+    def reconfigure(self, buffer_size: int) -> None:
+        self.buffer = MidiBuffer(length=buffer_size)
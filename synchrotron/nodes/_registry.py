@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import ast
+import functools
+from collections.abc import MutableMapping
+from dataclasses import dataclass, field
+from importlib import import_module
+from pathlib import Path
+from typing import TYPE_CHECKING, get_type_hints
+
+from ._base import Input, Node, Output, Port
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator, Mapping
+
+
+@dataclass(frozen=True)
+class NodeTypeInfo:
+    name: str
+    module: str
+    # Port names mapped to their port type names, in declaration order
+    inputs: dict[str, str] = field(default_factory=dict)
+    outputs: dict[str, str] = field(default_factory=dict)
+
+    def load(self) -> type[Node]:
+        return getattr(import_module(self.module), self.name)
+
+    @classmethod
+    def from_class(cls, node_type: type[Node]) -> NodeTypeInfo:
+        inputs = {}
+        outputs = {}
+        for name, port_type in get_type_hints(node_type).items():
+            if not isinstance(port_type, type) or not issubclass(port_type, Port):
+                continue
+            if issubclass(port_type, Input):
+                inputs[name] = port_type.__name__
+            elif issubclass(port_type, Output):
+                outputs[name] = port_type.__name__
+
+        return cls(name=node_type.__name__, module=node_type.__module__, inputs=inputs, outputs=outputs)
+
+    def as_json(self) -> dict:
+        return {
+            'name': self.name,
+            'inputs': self.inputs,
+            'outputs': self.outputs,
+        }
+
+
+def _parse_module(path: Path, module: str) -> list[NodeTypeInfo]:
+    tree = ast.parse(path.read_text(encoding='utf-8'), filename=str(path))
+
+    exported_names = []
+    class_defs: dict[str, ast.ClassDef] = {}
+    for statement in tree.body:
+        if isinstance(statement, ast.ClassDef):
+            class_defs[statement.name] = statement
+        elif (
+            isinstance(statement, ast.Assign)
+            and any(isinstance(target, ast.Name) and target.id == '__all__' for target in statement.targets)
+        ):
+            exported_names = ast.literal_eval(statement.value)
+
+    @functools.cache
+    def get_ports(class_name: str) -> tuple[dict[str, str], dict[str, str]]:
+        inputs = {}
+        outputs = {}
+        class_def = class_defs[class_name]
+
+        # Inherit ports from other node types in the same module
+        for base in class_def.bases:
+            if isinstance(base, ast.Name) and base.id in class_defs:
+                base_inputs, base_outputs = get_ports(base.id)
+                inputs.update(base_inputs)
+                outputs.update(base_outputs)
+
+        for statement in class_def.body:
+            if not isinstance(statement, ast.AnnAssign) or not isinstance(statement.target, ast.Name):
+                continue
+            annotation = statement.annotation
+            # Typed stream ports, e.g. StreamOutput[np.bool]
+            if isinstance(annotation, ast.Subscript):
+                annotation = annotation.value
+            port_type = annotation.id if isinstance(annotation, ast.Name) else getattr(annotation, 'attr', None)
+            if port_type is None:
+                continue
+            if port_type.endswith('Input'):
+                inputs[statement.target.id] = port_type
+            elif port_type.endswith('Output'):
+                outputs[statement.target.id] = port_type
+
+        return inputs, outputs
+
+    node_types = []
+    for name in exported_names:
+        inputs, outputs = get_ports(name)
+        node_types.append(NodeTypeInfo(name=name, module=module, inputs=inputs, outputs=outputs))
+
+    return node_types
+
+
+@functools.cache
+def find_node_types() -> dict[str, NodeTypeInfo]:
+    # Read node types and their ports straight from the source, so that none of the node modules (and their often heavy
+    # dependencies) have to be imported until a node type is actually used
+    node_types = {}
+    for path in Path(__file__).parent.rglob('[!_]*.py'):
+        for node_type in _parse_module(path, module='synchrotron.nodes.' + path.stem):
+            node_types[node_type.name] = node_type
+
+    return node_types
+
+
+def get_node_types() -> list[type[Node]]:
+    return [node_type.load() for node_type in find_node_types().values()]
+
+
+class NodeRegistry(MutableMapping[str, type[Node]]):
+    # Node types by name, which are only imported when first looked up
+    def __init__(self, node_types: Mapping[str, NodeTypeInfo] | None = None) -> None:
+        self._node_types = dict(find_node_types() if node_types is None else node_types)
+        self._loaded: dict[str, type[Node]] = {}
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} ({len(self._loaded)}/{len(self)} node types loaded)>'
+
+    def __getitem__(self, name: str) -> type[Node]:
+        node_type = self._loaded.get(name)
+        if node_type is None:
+            node_type = self._loaded[name] = self._node_types[name].load()
+        return node_type
+
+    def __setitem__(self, name: str, node_type: type[Node]) -> None:
+        self._node_types[name] = NodeTypeInfo.from_class(node_type)
+        self._loaded[name] = node_type
+
+    def __delitem__(self, name: str) -> None:
+        del self._node_types[name]
+        self._loaded.pop(name, None)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._node_types)
+
+    def __len__(self) -> int:
+        return len(self._node_types)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._node_types
+
+    def describe(self, name: str) -> NodeTypeInfo:
+        return self._node_types[name]
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._loaded
@@ -1,16 +1,16 @@
 from __future__ import annotations
 
 from pathlib import Path
-from queue import Queue
 from typing import TYPE_CHECKING
 
 import numpy as np
-import pyaudio
 from soundfile import SoundFile
 
-from . import DataInput, Node, RenderContext, StreamInput, StreamOutput
+from . import ConstantStream, DataInput, Node, RenderContext, StreamInput, StreamOutput
 
 if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
     from synchrotron.synchrotron import Synchrotron
 
 __all__ = ['SilenceNode', 'SineNode', 'SquareNode', 'SawtoothNode', 'PlaybackNode', 'RecordingNode', 'WavFileNode']
@@ -19,28 +19,57 @@ __all__ = ['SilenceNode', 'SineNode', 'SquareNode', 'SawtoothNode', 'PlaybackNod
 class SilenceNode(Node):
     out: StreamOutput
 
+    pure = True
+
     def render(self, ctx: RenderContext) -> None:
-        self.out.write(np.zeros(shape=ctx.buffer_size, dtype=np.float32))
+        self.out.write(ConstantStream(0, ctx.buffer_size))
+
+
+def accumulate_phase(
+    phase: float,
+    increments: NDArray[np.float64] | ConstantStream,
+) -> tuple[NDArray[np.float64], float]:
+    # An oscillator's phase in cycles at every sample in the buffer, wrapped to [0, 1), from its phase at the start of
+    # the buffer and how far it moves on after each sample. Also returns the phase to start the next buffer from.
+    # Accumulated in float64 and wrapped once per buffer, so the phase doesn't drift however long the oscillator runs.
+    phases = np.empty(len(increments), dtype=np.float64)
+    if isinstance(increments, ConstantStream):
+        np.multiply(np.arange(len(phases)), increments.value, out=phases)
+        end = phase + len(phases) * increments.value
+    else:
+        phases[0] = 0
+        np.cumsum(increments[:-1], out=phases[1:])
+        end = phase + phases[-1] + increments[-1]
+
+    phases += phase
+    # Much faster than np.remainder
+    phases -= np.floor(phases)
+    return phases, float(end - np.floor(end))
 
 
 class SineNode(Node):
     frequency: StreamInput
     out: StreamOutput
 
+    state_attributes = ('phase',)
+
     def __init__(self, synchrotron: Synchrotron, name: str) -> None:
         super().__init__(synchrotron, name)
         self.phase = 0.
 
     def render(self, ctx: RenderContext) -> None:
         frequency = self.frequency.read(ctx)
-        waveform = np.empty(shape=ctx.buffer_size, dtype=np.float32)
+        waveform = self.out.get_buffer(ctx)
 
-        for i in range(ctx.buffer_size):
-            waveform[i] = self.phase
-            self.phase += 2 * np.pi * frequency[i] / ctx.sample_rate
-            self.phase %= 2 * np.pi
+        # The phase is kept in radians
+        increments = np.divide(frequency, ctx.sample_rate, dtype=np.float64)
+        phases, phase = accumulate_phase(self.phase / (2 * np.pi), increments)
+        self.phase = phase * 2 * np.pi
 
-        self.out.write(np.sin(waveform))
+        # Wrapped phases are precise enough as float32, which np.sin is much faster on
+        waveform[...] = phases
+        waveform *= 2 * np.pi
+        self.out.write(np.sin(waveform, out=waveform))
 
 
 class SquareNode(Node):
@@ -48,20 +77,24 @@ class SquareNode(Node):
     pwm: StreamInput
     out: StreamOutput
 
+    state_attributes = ('phase',)
+
     def __init__(self, synchrotron: Synchrotron, name: str) -> None:
         super().__init__(synchrotron, name)
         self.phase = 0.
 
     def render(self, ctx: RenderContext) -> None:
         frequency = self.frequency.read(ctx)
-        waveform = np.empty(shape=ctx.buffer_size, dtype=np.float32)
+        waveform = self.out.get_buffer(ctx)
         pwm_threshold = self.pwm.read(ctx, default_constant=0.5)
 
-        for i in range(ctx.buffer_size):
-            waveform[i] = 1 if self.phase > pwm_threshold[i] else -1
-            self.phase += frequency[i] / ctx.sample_rate
-            self.phase %= 1
+        increments = np.divide(frequency, ctx.sample_rate, dtype=np.float64)
+        phases, self.phase = accumulate_phase(self.phase, increments)
 
+        # 1 where the phase is past the threshold, otherwise -1
+        np.greater(phases, pwm_threshold, out=waveform)
+        waveform *= 2
+        waveform -= 1
         self.out.write(waveform)
 
 
@@ -69,112 +102,114 @@ class SawtoothNode(Node):
     frequency: StreamInput
     out: StreamOutput
 
+    state_attributes = ('phase',)
+
     def __init__(self, synchrotron: Synchrotron, name: str) -> None:
         super().__init__(synchrotron, name)
         self.phase = 0.
 
     def render(self, ctx: RenderContext) -> None:
         frequency = self.frequency.read(ctx)
-        waveform = np.empty(shape=ctx.buffer_size, dtype=np.float32)
+        waveform = self.out.get_buffer(ctx)
 
-        for i in range(ctx.buffer_size):
-            waveform[i] = self.phase
-            self.phase += frequency[i] / ctx.sample_rate
-            self.phase %= 1
+        increments = np.divide(frequency, ctx.sample_rate, dtype=np.float64)
+        phases, self.phase = accumulate_phase(self.phase, increments)
 
+        waveform[...] = phases
+        # Phases just below 1 round up to 1 as float32, so they're wrapped again
+        wraps = self.get_buffer(ctx, 'wraps')
+        np.subtract(waveform, np.floor(waveform, out=wraps), out=waveform)
         self.out.write(waveform)
 
 
 class PlaybackNode(Node):
     left: StreamInput
     right: StreamInput
+    stereo: StreamInput[np.float32, 2]
+
+    always_render = True
+    offloadable = False
 
     def __init__(self, synchrotron: Synchrotron, name: str) -> None:
         super().__init__(synchrotron, name)
 
-        self.playback_queue = Queue()
-        synchrotron.add_output_queue(self.playback_queue)
-
-        # noinspection PyTypeChecker
-        self.stream = synchrotron.pyaudio_session.open(
-            rate=synchrotron.sample_rate,
+        self.stream = synchrotron.audio_backend.open_output(
+            name=name,
+            sample_rate=synchrotron.sample_rate,
+            buffer_size=synchrotron.buffer_size,
             channels=2,
-            format=pyaudio.paFloat32,
-            output=True,
-            frames_per_buffer=synchrotron.buffer_size,
-            stream_callback=self._pyaudio_callback,
         )
 
-        self.exports['Device'] = synchrotron.pyaudio_session.get_default_output_device_info().get('name')
-
-    def _pyaudio_callback(self, *_):
-        buffer = self.playback_queue.get()
-        self.playback_queue.task_done()
-        return buffer, pyaudio.paContinue
+        self.exports['Device'] = self.stream.device_name
 
     def render(self, ctx: RenderContext) -> None:
-        left_buffer = self.left.read(ctx)
-        right_buffer = self.right.read(ctx)
+        # Streams copy (or finish with) the buffer before the next one is rendered
+        stereo_buffer = self.synchrotron.buffer_arena.get(self, 'stereo', 2 * ctx.buffer_size)
+        # The interleaved buffer seen as (channels, buffer size), so it can be written to like any stereo stream
+        channels = stereo_buffer.reshape(ctx.buffer_size, 2).T
+        channels[...] = self.stereo.read(ctx)
+        channels[0] += self.left.read(ctx)
+        channels[1] += self.right.read(ctx)
+        self.stream.write(stereo_buffer)
+
+    def reconfigure(self, sample_rate: int, buffer_size: int) -> None:
+        super().reconfigure(sample_rate, buffer_size)
+        self.stream = self.synchrotron.audio_backend.reopen_stream(self.stream, sample_rate, buffer_size)
 
-        stereo_buffer = np.empty(shape=left_buffer.size + right_buffer.size, dtype=np.float32)
-        stereo_buffer[0::2] = left_buffer
-        stereo_buffer[1::2] = right_buffer
-        self.playback_queue.put_nowait(stereo_buffer)
+    def teardown(self) -> None:
+        self.synchrotron.audio_backend.close_stream(self.stream)
 
 
 # ai-generated
 class RecordingNode(Node):
     left: StreamOutput
     right: StreamOutput
+    out: StreamOutput[np.float32, 2]
+
+    # Keep draining the input device even when nothing is listening
+    always_render = True
+    offloadable = False
 
     def __init__(self, synchrotron: Synchrotron, name: str) -> None:
         super().__init__(synchrotron, name)
 
-        self.recording_queue = Queue()
-
-        # noinspection PyTypeChecker
-        self.stream = synchrotron.pyaudio_session.open(
-            rate=synchrotron.sample_rate,
+        self.stream = synchrotron.audio_backend.open_input(
+            name=name,
+            sample_rate=synchrotron.sample_rate,
+            buffer_size=synchrotron.buffer_size,
             channels=2,
-            format=pyaudio.paFloat32,
-            input=True,
-            frames_per_buffer=synchrotron.buffer_size,
-            stream_callback=self._pyaudio_callback,
         )
 
-        self.exports['Device'] = synchrotron.pyaudio_session.get_default_input_device_info().get('name')
-
-    def _pyaudio_callback(self, in_data, *_):
-        stereo_buffer = np.frombuffer(in_data, dtype=np.float32)
-        self.recording_queue.put_nowait(stereo_buffer)
-        return None, pyaudio.paContinue
+        self.exports['Device'] = self.stream.device_name
 
     def render(self, ctx: RenderContext) -> None:
-        # Drain all stale buffers from the queue, keeping only the most recent one
-        # This ensures we always get live audio instead of buffered audio from before rendering started
-        stereo_buffer = None
-        while not self.recording_queue.empty():
-            if stereo_buffer is not None:
-                self.recording_queue.task_done()
-            stereo_buffer = self.recording_queue.get()
-
-        # If queue was empty, block and wait for the next buffer
+        stereo_buffer = self.stream.read()
         if stereo_buffer is None:
-            stereo_buffer = self.recording_queue.get()
+            # The backend has nothing to record from (e.g. the null backend)
+            silence = ConstantStream(0, ctx.buffer_size)
+            self.left.write(silence)
+            self.right.write(silence)
+            self.out.write(silence)
+            return
 
-        self.recording_queue.task_done()
+        self.left.write(stereo_buffer[0::2])
+        self.right.write(stereo_buffer[1::2])
+        self.out.write(stereo_buffer.reshape(-1, 2).T)
 
-        left_buffer = stereo_buffer[0::2]
-        right_buffer = stereo_buffer[1::2]
+    def reconfigure(self, sample_rate: int, buffer_size: int) -> None:
+        super().reconfigure(sample_rate, buffer_size)
+        self.stream = self.synchrotron.audio_backend.reopen_stream(self.stream, sample_rate, buffer_size)
 
-        self.left.write(left_buffer)
-        self.right.write(right_buffer)
+    def teardown(self) -> None:
+        self.synchrotron.audio_backend.close_stream(self.stream)
 
 
 class WavFileNode(Node):
     path: DataInput
     signal: StreamInput
 
+    always_render = True
+
     def __init__(self, synchrotron: Synchrotron, name: str):
         super().__init__(synchrotron, name)
 
@@ -184,7 +219,12 @@ class WavFileNode(Node):
         self.exports['File Path'] = path.as_posix()
 
     def render(self, ctx: RenderContext) -> None:
-        self.file.write(self.signal.read(ctx))
+        self.file.write(np.asarray(self.signal.read(ctx)))
+
+    def reconfigure(self, sample_rate: int, buffer_size: int) -> None:
+        if sample_rate != self.file.samplerate:
+            raise ValueError(f"can't change the sample rate of {self.exports['File Path']} while it's being written")
+        super().reconfigure(sample_rate, buffer_size)
 
     def teardown(self) -> None:
         self.file.close()
@@ -2,9 +2,7 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-import numpy as np
-
-from . import DataInput, DataOutput, Node, RenderContext, StreamOutput
+from . import ConstantStream, DataInput, DataOutput, Node, RenderContext, StreamOutput
 
 if TYPE_CHECKING:
     from synchrotron.synchrotron import Synchrotron
@@ -15,6 +13,9 @@ __all__ = ['DataNode', 'StreamNode']
 class DataNode(Node):
     out: DataOutput
 
+    pure = True
+    offloadable = False
+
     def __init__(self, synchrotron: Synchrotron, name: str, value) -> None:
         super().__init__(synchrotron, name)
         self.value = value
@@ -28,5 +29,7 @@ class StreamNode(Node):
     data: DataInput
     out: StreamOutput
 
+    pure = True
+
     def render(self, ctx: RenderContext) -> None:
-        self.out.write(np.full(shape=ctx.buffer_size, fill_value=self.data.read(), dtype=np.float32))
+        self.out.write(ConstantStream(self.data.read(), ctx.buffer_size))
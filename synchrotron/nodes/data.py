@@ -4,9 +4,12 @@ from typing import TYPE_CHECKING
 
 import numpy as np
 
-from . import DataInput, Node, RenderContext, StreamInput, StreamOutput
+from . import ConstantStream, DataInput, Node, RenderContext, StreamInput, StreamOutput
 
 if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from synchrotron.fusion import Expression, KernelOutputs
     from synchrotron.synchrotron import Synchrotron
 
 __all__ = [
@@ -30,10 +33,21 @@ class UniformRandomNode(Node):
         super().__init__(synchrotron, name)
         self.rng = np.random.default_rng()
 
+    def get_state(self) -> dict:
+        return {'rng': self.rng.bit_generator.state}
+
+    def set_state(self, state: dict) -> None:
+        if 'rng' in state:
+            self.rng.bit_generator.state = state['rng']
+
     def render(self, ctx: RenderContext) -> None:
         low = self.min.read(ctx)[0]
         high = self.max.read(ctx)[0]
-        self.out.write(self.rng.uniform(low=low, high=high, size=ctx.buffer_size).astype(np.float32))
+
+        samples = self.rng.random(dtype=np.float32, out=self.out.get_buffer(ctx))
+        samples *= high - low
+        samples += low
+        self.out.write(samples)
 
 
 class AddNode(Node):
@@ -41,8 +55,18 @@ class AddNode(Node):
     b: StreamInput
     out: StreamOutput
 
+    pure = True
+
     def render(self, ctx: RenderContext) -> None:
-        self.out.write(self.a.read(ctx) + self.b.read(ctx))
+        a = self.a.read(ctx)
+        b = self.b.read(ctx)
+        if isinstance(a, ConstantStream) and isinstance(b, ConstantStream):
+            self.out.write(a + b)
+        else:
+            self.out.write(np.add(a, b, out=self.out.get_buffer(ctx)))
+
+    def get_kernel(self, read: Callable[..., Expression]) -> KernelOutputs:
+        return {'out': read(self.a) + read(self.b)}
 
 
 class MultiplyNode(Node):
@@ -50,13 +74,25 @@ class MultiplyNode(Node):
     b: StreamInput
     out: StreamOutput
 
+    pure = True
+
     def render(self, ctx: RenderContext) -> None:
-        self.out.write(self.a.read(ctx) * self.b.read(ctx))
+        a = self.a.read(ctx)
+        b = self.b.read(ctx)
+        if isinstance(a, ConstantStream) and isinstance(b, ConstantStream):
+            self.out.write(a * b)
+        else:
+            self.out.write(np.multiply(a, b, out=self.out.get_buffer(ctx)))
+
+    def get_kernel(self, read: Callable[..., Expression]) -> KernelOutputs:
+        return {'out': read(self.a) * read(self.b)}
 
 
 class DebugNode(Node):
     input: DataInput
 
+    always_render = True
+
     def render(self, _: RenderContext) -> None:
         if self.input.connection is None:
             return
@@ -66,16 +102,19 @@ class DebugNode(Node):
 
 class SequenceNode(Node):
     sequence: DataInput
-    step: StreamInput
+    step: StreamInput[np.bool]
     out: StreamOutput
 
+    state_attributes = ('sequence_position',)
+
     def __init__(self, synchrotron: Synchrotron, name: str):
         super().__init__(synchrotron, name)
         self.sequence_position = 0
 
     def render(self, ctx: RenderContext) -> None:
-        step = self.step.read(ctx)
-        output = np.empty(shape=ctx.buffer_size, dtype=np.float32)
+        # Read as an array, as indexing a constant stream sample by sample is much slower
+        step = np.asarray(self.step.read(ctx))
+        output = self.out.get_buffer(ctx)
         sequence = self.sequence.read()
 
         for i in range(ctx.buffer_size):
@@ -89,15 +128,18 @@ class SequenceNode(Node):
 
 class ClockNode(Node):
     frequency: StreamInput
-    out: StreamOutput
+    out: StreamOutput[np.bool]
+
+    state_attributes = ('count',)
 
     def __init__(self, synchrotron: Synchrotron, name: str):
         super().__init__(synchrotron, name)
         self.count = float('inf')  # Fire on first sample
 
     def render(self, ctx: RenderContext) -> None:
-        frequency = self.frequency.read(ctx)
-        output = np.zeros(shape=ctx.buffer_size, dtype=np.bool)
+        frequency = np.asarray(self.frequency.read(ctx))
+        output = self.out.get_buffer(ctx)
+        output.fill(False)
 
         for i in range(ctx.buffer_size):
             period = 1 / frequency[i]
@@ -110,16 +152,17 @@ class ClockNode(Node):
 
 
 class TriggerEnvelopeNode(Node):
-    trigger: StreamInput
+    trigger: StreamInput[np.bool]
     attack: StreamInput
     decay: StreamInput
     envelope: StreamOutput
 
     def render(self, ctx: RenderContext) -> None:
-        envelope = np.zeros(shape=ctx.buffer_size, dtype=np.float32)
-        trigger = self.trigger.read(ctx)
-        attack = self.attack.read(ctx)
-        decay = self.decay.read(ctx)
+        envelope = self.envelope.get_buffer(ctx)
+        envelope.fill(0)
+        trigger = np.asarray(self.trigger.read(ctx))
+        attack = np.asarray(self.attack.read(ctx))
+        decay = np.asarray(self.decay.read(ctx))
 
         for i in range(ctx.buffer_size):
             if not trigger[i]:
@@ -134,8 +177,28 @@ class FrequencyQuantiseNode(Node):
     frequency: StreamInput
     out: StreamOutput
 
+    pure = True
+
     def render(self, ctx: RenderContext) -> None:
         freq = self.frequency.read(ctx)
-        semitone_offset = np.round(np.log2(freq / 440) * 12)
-        quantised_freq = 440 * (2 ** (semitone_offset / 12))
-        self.out.write(quantised_freq.astype(np.float32))
+        if isinstance(freq, ConstantStream):
+            semitone_offset = np.round(np.log2(freq.value / 440) * 12)
+            self.out.write(ConstantStream(440 * (2 ** (semitone_offset / 12)), ctx.buffer_size))
+            return
+
+        quantised_freq = self.out.get_buffer(ctx)
+
+        # Round to the nearest semitone offset from A4, then convert back to a frequency
+        np.divide(freq, 440, out=quantised_freq)
+        np.log2(quantised_freq, out=quantised_freq)
+        np.multiply(quantised_freq, 12, out=quantised_freq)
+        np.round(quantised_freq, out=quantised_freq)
+        np.divide(quantised_freq, 12, out=quantised_freq)
+        np.power(2, quantised_freq, out=quantised_freq)
+        np.multiply(quantised_freq, 440, out=quantised_freq)
+
+        self.out.write(quantised_freq)
+
+    def get_kernel(self, read: Callable[..., Expression]) -> KernelOutputs:
+        semitone_offset = np.rint(np.log2(read(self.frequency) / 440) * 12)
+        return {'out': np.power(2, semitone_offset / 12) * 440}
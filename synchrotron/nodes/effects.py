@@ -4,9 +4,12 @@ from typing import TYPE_CHECKING
 
 import numpy as np
 
-from . import Node, RenderContext, StreamInput, StreamOutput
+from . import ConstantStream, Node, RenderContext, StreamInput, StreamOutput
 
 if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from synchrotron.fusion import Expression, KernelOutputs
     from synchrotron.synchrotron import Synchrotron
 
 __all__ = ['PanNode', 'BitcrushNode']
@@ -17,16 +20,51 @@ class PanNode(Node):
     pan: StreamInput
     left: StreamOutput
     right: StreamOutput
+    out: StreamOutput[np.float32, 2]
+
+    pure = True
 
     def render(self, ctx: RenderContext) -> None:
         signal = self.signal.read(ctx)
         pan = self.pan.read(ctx, default_constant=0.0)
+        # Both channels are rendered into the stereo output, and the left and right outputs are views of its rows
+        stereo = self.out.get_buffer(ctx)
+        left, right = stereo
+
+        if isinstance(pan, ConstantStream):
+            # Static pan, so the gains only need working out once, in float32 like the buffers they're worked out in
+            # for a changing pan
+            angle = (np.float32(pan.value) + np.float32(1)) * np.float32(np.pi / 4)
+            left_gain = np.cos(angle)
+            right_gain = np.sin(angle)
+            if isinstance(signal, ConstantStream):
+                self.left.write(signal * left_gain)
+                self.right.write(signal * right_gain)
+                left.fill(signal.value * left_gain)
+                right.fill(signal.value * right_gain)
+            else:
+                self.left.write(np.multiply(signal, left_gain, out=left))
+                self.right.write(np.multiply(signal, right_gain, out=right))
+            self.out.write(stereo)
+            return
+
+        angle = self.get_buffer(ctx, 'angle')
+        np.add(pan, 1, out=angle)
+        np.multiply(angle, np.pi / 4, out=angle)
 
-        left_gain = np.cos((pan + 1) * (np.pi / 4))
-        right_gain = np.sin((pan + 1) * (np.pi / 4))
+        np.multiply(signal, np.cos(angle, out=left), out=left)
+        np.multiply(signal, np.sin(angle, out=right), out=right)
 
-        self.left.write(signal * left_gain)
-        self.right.write(signal * right_gain)
+        self.left.write(left)
+        self.right.write(right)
+        self.out.write(stereo)
+
+    def get_kernel(self, read: Callable[..., Expression]) -> KernelOutputs:
+        signal = read(self.signal)
+        angle = (read(self.pan, 0.0) + 1) * (np.pi / 4)
+        left = signal * np.cos(angle)
+        right = signal * np.sin(angle)
+        return {'out': (left, right), 'left': left, 'right': right}
 
 
 class BitcrushNode(Node):
@@ -34,11 +72,28 @@ class BitcrushNode(Node):
     bit_depth: StreamInput
     out: StreamOutput
 
+    pure = True
+
     def render(self, ctx: RenderContext) -> None:
         signal = self.signal.read(ctx)
         bit_depth = self.bit_depth.read(ctx, default_constant=16)
 
-        steps = 2 ** bit_depth
-        bitcrushed = np.round(signal * steps) / steps
+        if isinstance(signal, ConstantStream) and isinstance(bit_depth, ConstantStream):
+            steps = 2 ** bit_depth.value
+            self.out.write(ConstantStream(np.round(signal.value * steps) / steps, ctx.buffer_size))
+            return
+
+        bitcrushed = self.out.get_buffer(ctx)
+        if isinstance(bit_depth, ConstantStream):
+            steps = 2 ** bit_depth.value
+        else:
+            steps = np.power(2, bit_depth, out=self.get_buffer(ctx, 'steps'))
+        np.multiply(signal, steps, out=bitcrushed)
+        np.round(bitcrushed, out=bitcrushed)
+        np.divide(bitcrushed, steps, out=bitcrushed)
 
         self.out.write(bitcrushed)
+
+    def get_kernel(self, read: Callable[..., Expression]) -> KernelOutputs:
+        steps = np.power(2, read(self.bit_depth, 16))
+        return {'out': np.rint(read(self.signal) * steps) / steps}
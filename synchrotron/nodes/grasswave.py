@@ -176,9 +176,9 @@ class GrasswaveNode(Node):
         smoothing_factor = 1 / (smoothing * 1000)
 
         # Generate interpolated values for each sample in the buffer
-        height_buffer = np.empty(ctx.buffer_size, dtype=np.float32)
-        tilt_buffer = np.empty(ctx.buffer_size, dtype=np.float32)
-        pinch_buffer = np.empty(ctx.buffer_size, dtype=np.float32)
+        height_buffer = self.hand_height.get_buffer(ctx)
+        tilt_buffer = self.hand_tilt.get_buffer(ctx)
+        pinch_buffer = self.hand_pinch.get_buffer(ctx)
 
         for i in range(ctx.buffer_size):
             current_height += (target_height - current_height) * smoothing_factor
@@ -198,6 +198,12 @@ class GrasswaveNode(Node):
         self.hand_tilt.write(tilt_buffer)
         self.hand_pinch.write(pinch_buffer)
 
+    def teardown(self) -> None:
+        # The capture thread holds on to the node, so it'd never be garbage collected while the thread's still running
+        self._running = False
+        self._thread.join(timeout=1.0)
+        self.capture.release()
+
     def __del__(self):
         self._running = False
         if hasattr(self, '_thread'):
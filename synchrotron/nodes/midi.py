@@ -9,7 +9,19 @@ import tinysoundfont.midi
 # noinspection PyUnresolvedReferences
 from rtmidi import MidiIn
 
-from . import DataInput, MidiBuffer, MidiInput, MidiMessage, MidiOutput, Node, RenderContext, StreamInput, StreamOutput
+from . import (
+    ConstantStream,
+    DataInput,
+    MidiBuffer,
+    MidiInput,
+    MidiMessage,
+    MidiOutput,
+    Node,
+    RenderContext,
+    StreamInput,
+    StreamOutput,
+)
+from ._midi import MAX_MESSAGE_SIZE, MIDI_EVENT_DTYPE
 
 if TYPE_CHECKING:
     from synchrotron.synchrotron import Synchrotron
@@ -21,6 +33,9 @@ class MidiInputNode(Node):
     port: DataInput
     out: MidiOutput
 
+    # Keep draining incoming messages so they don't all arrive at once when the node is connected up
+    always_render = True
+
     def __init__(self, synchrotron: Synchrotron, name: str):
         super().__init__(synchrotron, name)
 
@@ -47,6 +62,9 @@ class MidiInputNode(Node):
             message: tuple[list[int], float]
 
             self.last_message_time += message[1]
+            # SysEx messages aren't passed on, as none of the nodes use them
+            if len(message[0]) > MAX_MESSAGE_SIZE:
+                continue
             sample_offset = int((self.last_message_time * ctx.sample_rate) % ctx.buffer_size)
 
             buffer.add_message(position=sample_offset, message=bytes(message[0]))
@@ -56,35 +74,74 @@ class MidiInputNode(Node):
 
 class MidiLoopNode(Node):
     source: MidiInput
-    loop: StreamInput
-    reset: StreamInput
+    loop: StreamInput[np.bool]
+    reset: StreamInput[np.bool]
     out: MidiOutput
 
+    state_attributes = (
+        'recording',
+        'recorded_positions',
+        'recorded_events',
+        'loop_length',
+        'loop_position',
+        'last_loop_pulse',
+        'last_reset_pulse',
+    )
+
     def __init__(self, synchrotron: Synchrotron, name: str):
         super().__init__(synchrotron, name)
         self.recording = False  # Wait for first pulse to start recording
-        self.recorded_messages = []  # list of (position_in_loop, message) tuples
+        # Recorded messages sorted by their position in the loop (in the order they were recorded at each position), so
+        # the messages for a stretch of the loop are a single slice found with searchsorted. Each event is the
+        # message's status, data bytes and size, as in MidiBuffer.
+        self.recorded_positions = np.empty(0, dtype=np.int64)
+        self.recorded_events = np.empty((0, 4), dtype=np.uint8)
         self.loop_length = 0
         self.loop_position = 0
         self.last_loop_pulse = False
         self.last_reset_pulse = False
+        self._sample_rate = synchrotron.sample_rate
 
-    def render(self, ctx: RenderContext) -> None:
-        loop_signal = self.loop.read(ctx)
-        reset_signal = self.reset.read(ctx)
-        output = MidiBuffer(length=ctx.buffer_size)
+    def reconfigure(self, sample_rate: int, buffer_size: int) -> None:
+        super().reconfigure(sample_rate, buffer_size)
+        if sample_rate == self._sample_rate:
+            return
 
-        for i in range(ctx.buffer_size):
-            # Check for reset pulse
-            if reset_signal[i] and not self.last_reset_pulse:
+        # Loops are recorded in samples, so they're stretched to keep the same length in time at the new sample rate
+        scale = sample_rate / self._sample_rate
+        self._sample_rate = sample_rate
+        self.recorded_positions = np.rint(self.recorded_positions * scale).astype(np.int64)
+        self.loop_position = round(self.loop_position * scale)
+        if self.loop_length > 0:
+            self.loop_length = max(round(self.loop_length * scale), 1)
+            np.minimum(self.recorded_positions, self.loop_length - 1, out=self.recorded_positions)
+            self.loop_position %= self.loop_length
+
+    def render(self, ctx: RenderContext) -> None:
+        loop_signal = np.asarray(self.loop.read(ctx))
+        reset_signal = np.asarray(self.reset.read(ctx))
+        incoming = self.source.buffer.events
+        played = []
+
+        # Rising edges of the loop and reset pulses, where the loop's state changes
+        loop_pulses = np.flatnonzero(loop_signal & ~np.concatenate(([self.last_loop_pulse], loop_signal[:-1])))
+        reset_pulses = np.flatnonzero(reset_signal & ~np.concatenate(([self.last_reset_pulse], reset_signal[:-1])))
+        self.last_loop_pulse = bool(loop_signal[-1])
+        self.last_reset_pulse = bool(reset_signal[-1])
+
+        # The buffer is run in stretches between pulses, and each pulse takes effect from its own sample
+        start = 0
+        for pulse in sorted({*loop_pulses.tolist(), *reset_pulses.tolist()}):
+            self._run(start, pulse, incoming, played)
+            start = pulse
+
+            if pulse in reset_pulses:
                 self.recording = False
-                self.recorded_messages = []
+                self._clear_recording()
                 self.loop_length = 0
                 self.loop_position = 0
-            self.last_reset_pulse = reset_signal[i]
 
-            # Check for loop pulse
-            if loop_signal[i] and not self.last_loop_pulse:
+            if pulse in loop_pulses:
                 if self.loop_length == 0:
                     # No loop yet
                     if self.recording:
@@ -95,33 +152,67 @@ class MidiLoopNode(Node):
                         # First pulse: start recording
                         self.recording = True
                         self.loop_position = 0
-                        self.recorded_messages = []
+                        self._clear_recording()
                 else:
                     # Already have a loop: reset loop position
                     self.loop_position = 0
-            self.last_loop_pulse = loop_signal[i]
+        self._run(start, ctx.buffer_size, incoming, played)
 
-            # Record incoming MIDI if we're recording
-            if self.recording:
-                for message in self.source.buffer.get_messages_at_pos(i):
-                    self.recorded_messages.append((self.loop_position, message))
+        output = MidiBuffer(length=ctx.buffer_size)
+        if played:
+            positions, events = zip(*played, strict=True)
+            midi_events = self._to_midi_events(np.concatenate(positions), np.concatenate(events))
+            output = MidiBuffer(ctx.buffer_size, midi_events)
+        self.out.write(output)
+
+    def _run(self, start: int, stop: int, incoming: np.ndarray, played: list[tuple[np.ndarray, np.ndarray]]) -> None:
+        # Records (and once there's a loop, overdubs and plays back) the samples from start to stop, in stretches which
+        # don't wrap around the end of the loop, so every sample in a stretch is at a different position in the loop
+        while start < stop and self.recording:
+            if self.loop_length > 0:
+                end = min(stop, start + self.loop_length - self.loop_position)
+            else:
+                end = stop
+            offset = self.loop_position - start
+
+            # Record incoming MIDI
+            first, last = np.searchsorted(incoming['position'], (start, end))
+            if first < last:
+                messages = incoming[first:last]
+                new_positions = messages['position'].astype(np.int64) + offset
+                new_events = np.stack((messages['status'], messages['data1'], messages['data2'], messages['size']), 1)
+                # After any messages already recorded at the same positions
+                indices = np.searchsorted(self.recorded_positions, new_positions, side='right')
+                self.recorded_positions = np.insert(self.recorded_positions, indices, new_positions)
+                self.recorded_events = np.insert(self.recorded_events, indices, new_events, axis=0)
 
             # Play back loop if we have one
             if self.loop_length > 0:
-                for recorded_pos, message in self.recorded_messages:
-                    if recorded_pos == self.loop_position:
-                        output.add_message(position=i, message=message)
+                loop_stop = self.loop_position + end - start
+                first, last = np.searchsorted(self.recorded_positions, (self.loop_position, loop_stop))
+                if first < last:
+                    played.append((self.recorded_positions[first:last] - offset, self.recorded_events[first:last]))
 
             # Increment loop position (used both for recording and playback)
-            if self.recording:
-                if self.loop_length > 0:
-                    # Looping mode: wrap around
-                    self.loop_position = (self.loop_position + 1) % self.loop_length
-                else:
-                    # Still recording first loop: just increment
-                    self.loop_position += 1
-
-        self.out.write(output)
+            if self.loop_length > 0:
+                # Looping mode: wrap around
+                self.loop_position = (self.loop_position + end - start) % self.loop_length
+            else:
+                # Still recording first loop: just increment
+                self.loop_position += end - start
+            start = end
+
+    def _clear_recording(self) -> None:
+        self.recorded_positions = np.empty(0, dtype=np.int64)
+        self.recorded_events = np.empty((0, 4), dtype=np.uint8)
+
+    @staticmethod
+    def _to_midi_events(positions: np.ndarray, events: np.ndarray) -> np.ndarray:
+        midi_events = np.empty(len(positions), dtype=MIDI_EVENT_DTYPE)
+        midi_events['position'] = positions
+        for column, field in enumerate(('status', 'data1', 'data2', 'size')):
+            midi_events[field] = events[:, column]
+        return midi_events
 
 
 class MidiHoldNode(Node):
@@ -129,22 +220,9 @@ class MidiHoldNode(Node):
     out: MidiOutput
 
     def render(self, ctx: RenderContext) -> None:
-        output = MidiBuffer(length=ctx.buffer_size)
-
-        for i in range(ctx.buffer_size):
-            for message in self.midi.buffer.get_messages_at_pos(i):
-                opcode = message[0] & MidiMessage.OPCODE_MASK
-
-                # Filter out NOTE_OFF messages and NOTE_ON with velocity 0
-                if opcode == MidiMessage.NOTE_OFF:
-                    continue
-                elif opcode == MidiMessage.NOTE_ON and message[2] == 0:
-                    continue
-
-                # Pass through all other messages
-                output.add_message(position=i, message=message)
-
-        self.out.write(output)
+        # Pass through everything but note offs (including note ons with velocity 0)
+        buffer = self.midi.buffer
+        self.out.write(buffer.filter(~buffer.is_note_off()))
 
 
 class MidiStrumNode(Node):
@@ -152,6 +230,8 @@ class MidiStrumNode(Node):
     strum: StreamInput
     out: MidiOutput
 
+    state_attributes = ('held_notes', 'previous_strum_value', 'current_note')
+
     def __init__(self, synchrotron: Synchrotron, name: str):
         super().__init__(synchrotron, name)
         self.held_notes: set[int] = set()  # Set of pitch classes (0-11)
@@ -159,20 +239,21 @@ class MidiStrumNode(Node):
         self.current_note: int | None = None
 
     def render(self, ctx: RenderContext) -> None:
-        strum_signal = self.strum.read(ctx)
+        strum_signal = np.asarray(self.strum.read(ctx))
         output = MidiBuffer(length=ctx.buffer_size)
 
         # Process incoming MIDI to update held notes
-        for i in range(ctx.buffer_size):
-            for message in self.notes.buffer.get_messages_at_pos(i):
-                opcode = message[0] & MidiMessage.OPCODE_MASK
-                note = message[1]
-                pitch_class = note % 12
-
-                if opcode == MidiMessage.NOTE_ON and message[2] > 0:  # velocity > 0
-                    self.held_notes.add(pitch_class)
-                elif opcode == MidiMessage.NOTE_OFF or (opcode == MidiMessage.NOTE_ON and message[2] == 0):
-                    self.held_notes.discard(pitch_class)
+        buffer = self.notes.buffer
+        for is_note_on, is_note_off, note in zip(
+            buffer.is_note_on().tolist(),
+            buffer.is_note_off().tolist(),
+            buffer.events['data1'].tolist(),
+            strict=True,
+        ):
+            if is_note_on:
+                self.held_notes.add(note % 12)
+            elif is_note_off:
+                self.held_notes.discard(note % 12)
 
         # If no notes are held, turn off current note and exit
         if not self.held_notes:
@@ -219,14 +300,14 @@ class MidiStrumNode(Node):
 
 class MidiTriggerNode(Node):
     midi: MidiInput
-    trigger: StreamOutput
+    trigger: StreamOutput[np.bool]
 
     def render(self, ctx: RenderContext) -> None:
-        output = np.zeros(shape=ctx.buffer_size, dtype=np.bool)
+        output = self.trigger.get_buffer(ctx)
+        output.fill(False)
 
-        for i, messages in self.midi.buffer.data.items():
-            if any(msg[0] & MidiMessage.OPCODE_MASK == MidiMessage.NOTE_ON for msg in messages):
-                output[i] = True
+        buffer = self.midi.buffer
+        output[buffer.positions[buffer.opcodes == MidiMessage.NOTE_ON]] = True
 
         self.trigger.write(output)
 
@@ -238,43 +319,51 @@ class MidiTransposeNode(Node):
 
     def render(self, ctx: RenderContext) -> None:
         transposition = self.transposition.read(ctx)
-        output = MidiBuffer(length=ctx.buffer_size)
+        notes = self.midi.buffer.filter_opcodes(MidiMessage.NOTE_ON, MidiMessage.NOTE_OFF)
 
-        for i in range(ctx.buffer_size):
-            for message in self.midi.buffer.get_messages_at_pos(i):
-                if message[0] & MidiMessage.OPCODE_MASK in (MidiMessage.NOTE_ON, MidiMessage.NOTE_OFF):
-                    transposed = bytearray(message)
-                    transposed[1] += round(transposition[i])
-                    output.add_message(position=i, message=bytes(transposed))
-
-        self.out.write(output)
+        # Each note is shifted by the transposition at its own position
+        if isinstance(transposition, ConstantStream):
+            semitones = np.rint(transposition.value)
+        else:
+            semitones = np.rint(transposition[notes.positions])
+        self.out.write(notes.transpose(semitones))
 
 
 class MonophonicRenderNode(Node):
     midi: MidiInput
     frequency: StreamOutput
 
+    state_attributes = ('current_note',)
+
     def __init__(self, synchrotron: Synchrotron, name: str):
         super().__init__(synchrotron, name)
         self.current_note: int | None = None
 
     def render(self, ctx: RenderContext) -> None:
-        output = np.zeros(shape=ctx.buffer_size, dtype=np.float32)
-
-        for i in range(ctx.buffer_size):
-            for message in self.midi.buffer.get_messages_at_pos(i):
-                if message[0] & MidiMessage.OPCODE_MASK == MidiMessage.NOTE_ON:
-                    self.current_note = message[1]
-                elif message[0] & MidiMessage.OPCODE_MASK == MidiMessage.NOTE_OFF:
-                    if message[1] != self.current_note:
-                        continue
-                    self.current_note = None
-
-            if self.current_note is not None:
-                output[i] = 440 * (2 ** ((self.current_note - 69) / 12))
+        output = self.frequency.get_buffer(ctx)
+
+        # The frequency only changes at messages, so it's filled in up to each one
+        start = 0
+        for position, status, note, _ in self.midi.buffer.iter_events():
+            opcode = status & MidiMessage.OPCODE_MASK
+            if opcode not in (MidiMessage.NOTE_ON, MidiMessage.NOTE_OFF):
+                continue
+            output[start:position] = self.get_frequency()
+            start = position
+
+            if opcode == MidiMessage.NOTE_ON:
+                self.current_note = note
+            elif note == self.current_note:
+                self.current_note = None
+        output[start:] = self.get_frequency()
 
         self.frequency.write(output)
 
+    def get_frequency(self) -> float:
+        if self.current_note is None:
+            return 0
+        return 440 * (2 ** ((self.current_note - 69) / 12))
+
 
 class SoundFontNode(Node):
     path: DataInput
@@ -283,6 +372,7 @@ class SoundFontNode(Node):
     preset: DataInput
     left: StreamOutput
     right: StreamOutput
+    out: StreamOutput[np.float32, 2]
 
     def __init__(self, synchrotron: Synchrotron, name: str):
         super().__init__(synchrotron, name)
@@ -290,7 +380,8 @@ class SoundFontNode(Node):
         self._current_path = None
         self._current_bank = None
         self._current_preset = None
-        self.synth = tinysoundfont.Synth()
+        self._sample_rate = synchrotron.sample_rate
+        self.synth = tinysoundfont.Synth(samplerate=synchrotron.sample_rate)
         self.sequencer = tinysoundfont.Sequencer(self.synth)
 
     def get_bank(self) -> int:
@@ -305,18 +396,23 @@ class SoundFontNode(Node):
             return 0
         return np.clip(round(raw_value), 0, 127)
 
+    @staticmethod
+    def resolve_path(path: Path | str) -> Path:
+        path = Path(path)
+        soundfonts_dir_path = Path(__file__).parent / 'soundfonts' / path
+        if soundfonts_dir_path.is_file():
+            path = soundfonts_dir_path
+        return path.resolve()
+
     def load_soundfont(self, path: Path | str) -> None:
         if self._sfid is not None:
             self.synth.sfunload(self._sfid)
 
         self._current_path = path
-        path = Path(path)
-        soundfonts_dir_path = Path(__file__).parent / 'soundfonts' / path
-        if soundfonts_dir_path.is_file():
-            path = soundfonts_dir_path
-        self._sfid = self.synth.sfload(path.resolve().as_posix())
+        resolved_path = self.resolve_path(path)
+        self._sfid = self.synth.sfload(resolved_path.as_posix())
 
-        self.exports['SoundFont'] = path.stem
+        self.exports['SoundFont'] = resolved_path.stem
 
     def load_bank(self, bank: int, preset: int = 0) -> None:
         self.synth.program_select(0, self._sfid, bank, preset, preset == 127)
@@ -332,6 +428,54 @@ class SoundFontNode(Node):
         self._current_preset = preset
         self.exports['Preset'] = self.synth.sfpreset_name(self._sfid, self._current_bank, preset)
 
+    def get_state(self) -> dict:
+        # Notes still sounding aren't saved, only which SoundFont, bank and preset are loaded
+        return {'path': self._current_path, 'bank': self._current_bank, 'preset': self._current_preset}
+
+    def prepare_state(self, state: dict) -> dict:
+        # A different SoundFont is loaded into a new synth ahead of time, which set_state() then swaps in
+        path = state.get('path')
+        if path is None or path == self._current_path:
+            return state
+        synth = tinysoundfont.Synth(samplerate=self._sample_rate)
+        resolved_path = self.resolve_path(path)
+        sfid = synth.sfload(resolved_path.as_posix())
+        return {**state, 'loaded': (self._sample_rate, synth, sfid, resolved_path.stem)}
+
+    def set_state(self, state: dict) -> None:
+        # Loading a SoundFont is slow, so it's done now (before the node goes live) rather than on its first render,
+        # unless prepare_state() has already loaded it
+        path = state.get('path')
+        if path is None:
+            return
+        loaded = state.get('loaded')
+        if loaded is not None and loaded[0] == self._sample_rate and path != self._current_path:
+            _, self.synth, self._sfid, self.exports['SoundFont'] = loaded
+            self.sequencer = tinysoundfont.Sequencer(self.synth)
+            self._current_path = path
+            self._current_bank = None
+        elif path != self._current_path:
+            self.load_soundfont(path)
+            self._current_bank = None
+        bank = state.get('bank') or 0
+        preset = state.get('preset') or 0
+        if bank != self._current_bank:
+            self.load_bank(bank, preset)
+        elif preset != self._current_preset:
+            self.load_preset(preset)
+
+    def reconfigure(self, sample_rate: int, buffer_size: int) -> None:
+        super().reconfigure(sample_rate, buffer_size)
+        if sample_rate == self._sample_rate:
+            return
+
+        # The synth's sample rate is fixed when it's created, so the SoundFont is reloaded into a new one on the next
+        # render (cutting off any notes which were still sounding)
+        self._sample_rate = sample_rate
+        self.synth = tinysoundfont.Synth(samplerate=sample_rate)
+        self.sequencer = tinysoundfont.Sequencer(self.synth)
+        self._sfid = None
+        self._current_path = None
 
     def render(self, ctx: RenderContext) -> None:
         if (new_path := self.path.read(default='8MBGMSFX.sf2')) != self._current_path:
@@ -344,24 +488,22 @@ class SoundFontNode(Node):
 
         events = []
 
-        for pos, messages in self.midi.buffer.data.items():
-
-            for message in messages:
-                opcode = message[0] & MidiMessage.OPCODE_MASK
+        for pos, status, note, velocity in self.midi.buffer.iter_events():
+            opcode = status & MidiMessage.OPCODE_MASK
 
-                if opcode == MidiMessage.NOTE_ON:
-                    action = tinysoundfont.midi.NoteOn(message[1], message[2])
-                elif opcode == MidiMessage.NOTE_OFF:
-                    action = tinysoundfont.midi.NoteOff(message[1])
-                else:
-                    continue
+            if opcode == MidiMessage.NOTE_ON:
+                action = tinysoundfont.midi.NoteOn(note, velocity)
+            elif opcode == MidiMessage.NOTE_OFF:
+                action = tinysoundfont.midi.NoteOff(note)
+            else:
+                continue
 
-                events.append(tinysoundfont.midi.Event(
-                    action=action,
-                    t=self.sequencer.time + (pos / ctx.sample_rate),
-                    channel=0,
-                    persistent=False,
-                ))
+            events.append(tinysoundfont.midi.Event(
+                action=action,
+                t=self.sequencer.time + (pos / ctx.sample_rate),
+                channel=0,
+                persistent=False,
+            ))
 
         self.sequencer.add(events)
         self.sequencer.process(ctx.buffer_size / ctx.sample_rate)
@@ -370,3 +512,4 @@ class SoundFontNode(Node):
 
         self.left.write(interleaved_buffer[0::2])
         self.right.write(interleaved_buffer[1::2])
+        self.out.write(interleaved_buffer.reshape(-1, 2).T)
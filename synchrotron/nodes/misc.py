@@ -18,7 +18,9 @@ __all__ = ['SolanaNode']
 
 
 class SolanaNode(Node):
-    blocks: StreamOutput
+    blocks: StreamOutput[np.bool]
+
+    always_render = True
 
     def __init__(self, synchrotron: Synchrotron, name: str, rpc_url: str = "wss://api.mainnet-beta.solana.com/") -> None:
         super().__init__(synchrotron, name)
@@ -80,7 +82,8 @@ class SolanaNode(Node):
         print("WebSocket connection closed")
 
     def render(self, ctx: RenderContext) -> None:
-        output = np.zeros(shape=ctx.buffer_size, dtype=np.bool_)
+        output = self.blocks.get_buffer(ctx)
+        output.fill(False)
 
         # Check if we have any new slots
         has_trigger = False
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from . import DataInput, MidiInput, MidiMessage, Node, RenderContext, StreamInput, StreamOutput
+from .wavetable import Wavetable, get_wavetable
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+    from synchrotron.synchrotron import Synchrotron
+
+__all__ = ['PolyphonicSynthNode']
+
+# Waveforms by name, as the wavetable shapes they're played from
+WAVEFORMS = {'sine': 'sine', 'square': 'square', 'sawtooth': 'saw'}
+
+
+class PolyphonicSynthNode(Node):
+    midi: MidiInput
+    voices: DataInput
+    waveform: DataInput
+    attack: StreamInput
+    release: StreamInput
+    out: StreamOutput
+
+    default_voices = 16
+
+    # Every voice's state is kept in arrays indexed by voice, so all of them are rendered together as rows of a
+    # (voices, samples) array rather than one node (and one Python loop) per voice
+    state_attributes = ('notes', 'velocities', 'phases', 'levels', 'gates', 'ages', 'note_count')
+
+    def __init__(self, synchrotron: Synchrotron, name: str) -> None:
+        super().__init__(synchrotron, name)
+        self.notes = np.full(0, -1, dtype=np.int16)
+        self.velocities = np.zeros(0, dtype=np.float32)
+        self.phases = np.zeros(0, dtype=np.float64)  # In cycles, so they don't depend on the sample rate
+        self.levels = np.zeros(0, dtype=np.float32)
+        self.gates = np.zeros(0, dtype=np.bool)
+        self.ages = np.zeros(0, dtype=np.int64)  # When each voice was last started, for voice stealing
+        self.note_count = 0
+        self.resize_voices(self.default_voices)
+
+    def resize_voices(self, voice_count: int) -> None:
+        # Voices past the new count are cut off, and new voices start silent
+        def resized(array: NDArray, fill: object) -> NDArray:
+            new_array = np.full(voice_count, fill, dtype=array.dtype)
+            kept = min(voice_count, len(array))
+            new_array[:kept] = array[:kept]
+            return new_array
+
+        self.notes = resized(self.notes, -1)
+        self.velocities = resized(self.velocities, 0)
+        self.phases = resized(self.phases, 0)
+        self.levels = resized(self.levels, 0)
+        self.gates = resized(self.gates, False)
+        self.ages = resized(self.ages, 0)
+        self.exports['Voices'] = voice_count
+
+    def note_on(self, note: int, velocity: int) -> None:
+        # Retrigger the voice already playing this note, otherwise take the longest idle voice, otherwise steal the
+        # oldest released voice, and failing that the oldest held one
+        candidates = np.flatnonzero(self.notes == note)
+        if not candidates.size:
+            candidates = np.flatnonzero(~self.gates & (self.levels == 0))
+        if not candidates.size:
+            candidates = np.flatnonzero(~self.gates)
+        if not candidates.size:
+            candidates = np.arange(len(self.notes))
+        voice = candidates[np.argmin(self.ages[candidates])]
+
+        # Stolen voices carry on from their current level and phase rather than jumping, to avoid clicks
+        if self.levels[voice] == 0:
+            self.phases[voice] = 0
+        self.notes[voice] = note
+        self.velocities[voice] = velocity / 127
+        self.gates[voice] = True
+        self.ages[voice] = self.note_count
+        self.note_count += 1
+
+    def note_off(self, note: int) -> None:
+        self.gates[self.notes == note] = False
+
+    def render(self, ctx: RenderContext) -> None:
+        voice_count = max(1, int(self.voices.read(default=self.default_voices)))
+        if voice_count != len(self.notes):
+            self.resize_voices(voice_count)
+        waveform = self.waveform.read(default='sine')
+        if waveform not in WAVEFORMS:
+            raise ValueError(f"unknown waveform '{waveform}', expected one of {', '.join(WAVEFORMS)}")
+        wavetable = get_wavetable(WAVEFORMS[waveform])
+        # Linear envelopes, as the change in level per sample
+        attack_step = 1 / max(self.attack.read(ctx, default_constant=0.005)[0] * ctx.sample_rate, 1)
+        release_step = 1 / max(self.release.read(ctx, default_constant=0.05)[0] * ctx.sample_rate, 1)
+
+        output = self.out.get_buffer(ctx)
+        output.fill(0)
+
+        # Voices are rendered up to each MIDI message, so notes start and stop on the exact sample
+        start = 0
+        for position, status, note, velocity in self.midi.buffer.iter_events():
+            if position > start:
+                self._render_voices(output[start:position], wavetable, attack_step, release_step, ctx.sample_rate)
+                start = position
+
+            opcode = status & MidiMessage.OPCODE_MASK
+            if opcode == MidiMessage.NOTE_ON and velocity > 0:
+                self.note_on(note, velocity)
+            elif opcode in (MidiMessage.NOTE_ON, MidiMessage.NOTE_OFF):
+                self.note_off(note)
+        if start < ctx.buffer_size:
+            self._render_voices(output[start:], wavetable, attack_step, release_step, ctx.sample_rate)
+
+        self.out.write(output)
+
+    def _render_voices(
+        self,
+        output: NDArray[np.float32],
+        wavetable: Wavetable,
+        attack_step: float,
+        release_step: float,
+        sample_rate: int,
+    ) -> None:
+        active = np.flatnonzero(self.gates | (self.levels > 0))
+        if not active.size:
+            return
+
+        samples = np.arange(len(output))
+        increments = 440 * 2 ** ((self.notes[active] - 69) / 12) / sample_rate
+        phases = np.multiply.outer(increments, samples)
+        phases += self.phases[active, np.newaxis]
+        # Much faster than np.remainder
+        phases -= np.floor(phases)
+        self.phases[active] = (self.phases[active] + increments * len(output)) % 1
+
+        # Each voice reads the band-limited table for its own note, so high notes don't alias
+        levels = Wavetable.get_level(increments * sample_rate, sample_rate)
+        signal = wavetable.lookup(phases, levels, out=np.empty(phases.shape, dtype=np.float32))
+
+        # Each envelope rises towards full level while its key is held, and falls to silence once it's released
+        slopes = np.where(self.gates[active], attack_step, -release_step)
+        envelopes = np.multiply.outer(slopes, samples + 1)
+        envelopes += self.levels[active, np.newaxis]
+        np.clip(envelopes, 0, 1, out=envelopes)
+        self.levels[active] = envelopes[:, -1]
+
+        envelopes *= self.velocities[active, np.newaxis]
+        signal *= envelopes
+        output += signal.sum(axis=0)
@@ -18,9 +18,12 @@ class ChordNode(Node):
     chord: DataInput
     key: DataInput
     octave: DataInput
+    # A number rather than a boolean, as chords have always been held only while it's above zero
     trigger: StreamInput
     out: MidiOutput
 
+    state_attributes = ('_held_notes', '_key_down')
+
     def __init__(self, synchrotron: Synchrotron, name: str):
         super().__init__(synchrotron, name)
         self._held_notes = []
@@ -47,7 +50,7 @@ class ChordNode(Node):
         chord: str = self.chord.read(None)
         key: str = self.key.read('C')
         octave: int = self.octave.read(4)
-        trigger = (self.trigger.read(ctx) > 0).astype(np.bool)
+        trigger = np.greater(self.trigger.read(ctx), 0)
 
         midi_notes = self.compute_chord_midi(chord, key, octave)
         buffer = MidiBuffer(length=ctx.buffer_size)
@@ -70,16 +73,18 @@ class ChordNode(Node):
 
 class MidiSequenceNode(Node):
     sequence: DataInput
-    step: StreamInput
+    step: StreamInput[np.bool]
     out: MidiOutput
 
+    state_attributes = ('sequence_position', 'current_note')
+
     def __init__(self, synchrotron: Synchrotron, name: str):
         super().__init__(synchrotron, name)
         self.sequence_position = 0
         self.current_note: int | None = None
 
     def render(self, ctx: RenderContext) -> None:
-        step = self.step.read(ctx)
+        step = np.asarray(self.step.read(ctx))
         buffer = MidiBuffer(length=ctx.buffer_size)
         sequence = self.sequence.read()
 
@@ -103,9 +108,11 @@ class MidiSequenceNode(Node):
 # ai-generated
 class MidiArpeggiatorNode(Node):
     notes: MidiInput
-    step: StreamInput
+    step: StreamInput[np.bool]
     out: MidiOutput
 
+    state_attributes = ('_held_notes', '_arp_position', '_current_arp_note')
+
     def __init__(self, synchrotron: Synchrotron, name: str):
         super().__init__(synchrotron, name)
         self._held_notes = []  # Notes in order they were pressed
@@ -116,11 +123,12 @@ class MidiArpeggiatorNode(Node):
         step = self.step.read(ctx)
         buffer = MidiBuffer(length=ctx.buffer_size)
 
-        for i in range(ctx.buffer_size):
+        # Only the positions with incoming MIDI or a step need looking at
+        messages = {position: events.tolist() for position, events in self.notes.buffer.iter_positions()}
+        for i in sorted(messages.keys() | set(np.flatnonzero(step).tolist())):
             # Process incoming MIDI messages to update held notes
-            for message in self.notes.buffer.get_messages_at_pos(i):
-                opcode = message[0] & MidiMessage.OPCODE_MASK
-                note = message[1]
+            for _, status, note, _, _ in messages.get(i, ()):
+                opcode = status & MidiMessage.OPCODE_MASK
 
                 if opcode == MidiMessage.NOTE_ON:
                     if note not in self._held_notes:
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import functools
+import math
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from . import ConstantStream, DataInput, Node, RenderContext, StreamInput, StreamOutput
+from .audio import accumulate_phase
+
+if TYPE_CHECKING:
+    from numpy.typing import ArrayLike, NDArray
+
+    from synchrotron.synchrotron import Synchrotron
+
+__all__ = ['WavetableNode']
+
+WAVETABLE_SHAPES = ('sine', 'saw', 'square')
+TABLE_SIZE = 4096
+# Level 0 has every harmonic up to MAX_HARMONICS, and each level after it has half as many, down to a plain sine
+LEVEL_COUNT = 11
+MAX_HARMONICS = 2 ** (LEVEL_COUNT - 1)
+
+
+class Wavetable:
+    # A single-cycle waveform as a table per octave, each band-limited to the harmonics which stay below the Nyquist
+    # frequency for the notes it's used for, so oscillators reading from it don't alias. Tables are built once and
+    # shared by every oscillator using the same waveform (see get_wavetable()).
+    def __init__(self, spectrum: NDArray[np.complex128]) -> None:
+        # The waveform's complex amplitude at each harmonic (0 being DC), as given by rfft(cycle) / len(cycle)
+        harmonics = np.zeros(TABLE_SIZE // 2 + 1, dtype=np.complex128)
+        count = min(len(spectrum), MAX_HARMONICS + 1)
+        harmonics[:count] = spectrum[:count] * TABLE_SIZE
+
+        # Each table is followed by a copy of its first sample, so interpolating past the last sample wraps around
+        self.levels = np.empty((LEVEL_COUNT, TABLE_SIZE + 1), dtype=np.float32)
+        for level in range(LEVEL_COUNT):
+            level_harmonics = harmonics.copy()
+            level_harmonics[(MAX_HARMONICS >> level) + 1:] = 0
+            table = np.fft.irfft(level_harmonics, n=TABLE_SIZE)
+            self.levels[level, :TABLE_SIZE] = table
+            self.levels[level, TABLE_SIZE] = table[0]
+        self.levels.flags.writeable = False
+
+        # Flattened, so rows of phases can each read from a different level in one lookup, along with the slope from
+        # each sample to the next for interpolation
+        self._samples = self.levels.reshape(-1)
+        self._slopes = np.diff(self._samples, append=self._samples[0])
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} ({LEVEL_COUNT} levels of {TABLE_SIZE} samples)>'
+
+    @staticmethod
+    def get_level(frequency: ArrayLike, sample_rate: int) -> int | NDArray[np.intp]:
+        # The table with the most harmonics which all stay below the Nyquist frequency at this frequency
+        if not np.ndim(frequency):
+            harmonics = sample_rate / 2 / max(abs(float(frequency)), 1e-3)
+            return min(max(math.ceil(LEVEL_COUNT - 1 - math.log2(harmonics)), 0), LEVEL_COUNT - 1)
+        harmonics = np.divide(sample_rate / 2, np.maximum(np.abs(frequency), 1e-3))
+        level = np.ceil(LEVEL_COUNT - 1 - np.log2(harmonics))
+        return np.minimum(np.maximum(level, 0), LEVEL_COUNT - 1).astype(np.intp)
+
+    def lookup(self, phases: NDArray[np.float64], level: ArrayLike, out: NDArray[np.float32]) -> NDArray[np.float32]:
+        # Reads the table at each phase (in cycles, from 0 to 1) with linear interpolation. level can be one level, or a
+        # level per row of phases.
+        positions = np.multiply(phases, TABLE_SIZE, dtype=np.float32)
+        indices = positions.astype(np.int32)
+        positions -= indices
+        # Indexing into every level at once, as an offset into the flattened tables
+        if np.ndim(level):
+            indices += np.multiply(level, TABLE_SIZE + 1, dtype=np.int32)[:, np.newaxis]
+        else:
+            indices += level * (TABLE_SIZE + 1)
+
+        np.multiply(self._slopes.take(indices), positions, out=out)
+        out += self._samples.take(indices)
+        return out
+
+
+def get_shape_spectrum(shape: str) -> NDArray[np.complex128]:
+    # The built-in waveforms, as sums of sines with amplitudes b_k (which rfft gives as -b_k / 2 * i)
+    harmonics = np.arange(1, MAX_HARMONICS + 1)
+    amplitudes = np.zeros(MAX_HARMONICS + 1)
+    if shape == 'sine':
+        amplitudes[1] = 1
+    elif shape == 'saw':
+        # Rising from -1 to 1
+        amplitudes[1:] = -2 / (np.pi * harmonics)
+    elif shape == 'square':
+        # -1 for the first half of the cycle and 1 for the second, like SquareNode
+        amplitudes[1::2] = -4 / (np.pi * harmonics[::2])
+    else:
+        raise ValueError(f"unknown wavetable shape '{shape}', expected one of {', '.join(WAVETABLE_SHAPES)}")
+    return amplitudes * -0.5j
+
+
+@functools.cache
+def _get_shape_wavetable(shape: str) -> Wavetable:
+    return Wavetable(get_shape_spectrum(shape))
+
+
+@functools.lru_cache(maxsize=64)
+def _get_sampled_wavetable(samples: bytes) -> Wavetable:
+    cycle = np.frombuffer(samples, dtype=np.float64)
+    spectrum = np.fft.rfft(cycle) / len(cycle)
+    # The Nyquist bin of the cycle can't tell sines from cosines, so it's left out
+    if len(cycle) % 2 == 0:
+        spectrum = spectrum[:-1]
+    return Wavetable(spectrum)
+
+
+def get_wavetable(table: str | ArrayLike) -> Wavetable:
+    # A built-in shape by name, or a single cycle of samples (of any length). Wavetables are cached, so each one is
+    # only built the first time it's used.
+    if isinstance(table, str):
+        return _get_shape_wavetable(table)
+
+    cycle = np.asarray(table, dtype=np.float64).reshape(-1)
+    if len(cycle) < 2:
+        raise ValueError('wavetables need at least 2 samples')
+    return _get_sampled_wavetable(cycle.tobytes())
+
+
+class WavetableNode(Node):
+    frequency: StreamInput
+    table: DataInput
+    out: StreamOutput
+
+    state_attributes = ('phase',)
+
+    def __init__(self, synchrotron: Synchrotron, name: str) -> None:
+        super().__init__(synchrotron, name)
+        self.phase = 0.
+        self._table: Any = None
+        self._wavetable: Wavetable | None = None
+
+    def get_wavetable(self) -> Wavetable:
+        table = self.table.read(default='sine')
+        # Looked up again only when the table changes, as hashing a sampled table every buffer would add up
+        if self._wavetable is None or table is not self._table:
+            self._wavetable = get_wavetable(table)
+            self._table = table
+        return self._wavetable
+
+    def render(self, ctx: RenderContext) -> None:
+        wavetable = self.get_wavetable()
+        frequency = self.frequency.read(ctx)
+        waveform = self.out.get_buffer(ctx)
+
+        increments = np.divide(frequency, ctx.sample_rate, dtype=np.float64)
+        phases, self.phase = accumulate_phase(self.phase, increments)
+
+        # One table for the whole buffer, band-limited for its highest frequency
+        peak_frequency = frequency.value if isinstance(frequency, ConstantStream) else np.max(np.abs(frequency))
+        level = Wavetable.get_level(peak_frequency, ctx.sample_rate)
+        self.out.write(wavetable.lookup(phases, level, out=waveform))
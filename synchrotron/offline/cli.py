@@ -0,0 +1,48 @@
+from pathlib import Path
+from typing import Annotated
+
+import typer
+from typer import Typer
+
+cli = Typer()
+
+
+@cli.command()
+def main(
+    patch: Annotated[Path, typer.Argument(exists=True, dir_okay=False, help='.sui or .syn patch to render')],
+    output: Annotated[Path, typer.Option('--output', '-o')] = Path('render.wav'),
+    seconds: float | None = None,
+    buffers: int | None = None,
+    sample_rate: int = 44100,
+    buffer_size: int = 256,
+    workers: Annotated[int, typer.Option(help='Render independent nodes on a thread pool of this size')] = 0,
+    input_file: Annotated[
+        Path | None,
+        typer.Option('--input', '-i', exists=True, dir_okay=False, help='Audio file for recording nodes to read'),
+    ] = None,
+):
+    from .renderer import render_patch
+
+    if seconds is None and buffers is None:
+        raise typer.BadParameter('either --seconds or --buffers must be given')
+    if buffers is None:
+        buffers = round(seconds * sample_rate / buffer_size)
+
+    result = render_patch(
+        script=patch.read_text(),
+        output_path=output,
+        buffer_count=buffers,
+        sample_rate=sample_rate,
+        buffer_size=buffer_size,
+        render_workers=workers,
+        input_path=input_file,
+    )
+
+    for path in result.output_paths:
+        typer.echo(f'Wrote {path}')
+    typer.echo(
+        f'Rendered {result.duration:.2f}s ({result.buffer_count} buffers) in {result.elapsed:.2f}s '
+        f'({result.realtime_factor:.1f}x realtime)'
+    )
+    if result.parallel_speedup is not None:
+        typer.echo(f'Parallel speedup with {workers} workers: {result.parallel_speedup:.2f}x')
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from synchrotron.backends import FileBackend
+from synchrotron.synchrotron import Synchrotron
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+@dataclass
+class RenderResult:
+    buffer_count: int
+    sample_rate: int
+    buffer_size: int
+    elapsed: float
+    output_paths: list[Path] = field(default_factory=list)
+    parallel_speedup: float | None = None
+
+    @property
+    def duration(self) -> float:
+        return self.buffer_count * self.buffer_size / self.sample_rate
+
+    @property
+    def realtime_factor(self) -> float:
+        return self.duration / self.elapsed if self.elapsed else float('inf')
+
+
+def render_patch(
+    script: str,
+    output_path: Path,
+    buffer_count: int,
+    sample_rate: int = 44100,
+    buffer_size: int = 256,
+    render_workers: int = 0,
+    input_path: Path | None = None,
+) -> RenderResult:
+    # Each playback node is written to its own file, and recording nodes read from the input file (if there is one)
+    backend = FileBackend(output_path=output_path, input_path=input_path)
+    synchrotron = Synchrotron(
+        sample_rate=sample_rate,
+        buffer_size=buffer_size,
+        audio_backend=backend,
+        render_workers=render_workers,
+    )
+    try:
+        synchrotron.execute(script)
+
+        start_time = time.perf_counter()
+        for _ in range(buffer_count):
+            synchrotron.render_graph()
+        elapsed = time.perf_counter() - start_time
+        parallel_speedup = None if synchrotron.parallel_renderer is None else synchrotron.parallel_renderer.speedup
+    finally:
+        synchrotron.shutdown()
+
+    return RenderResult(
+        buffer_count=buffer_count,
+        sample_rate=sample_rate,
+        buffer_size=buffer_size,
+        elapsed=elapsed,
+        output_paths=backend.output_paths,
+        parallel_speedup=parallel_speedup,
+    )
@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import contextlib
+import functools
+import multiprocessing
+from importlib import import_module
+from multiprocessing.shared_memory import SharedMemory
+from typing import TYPE_CHECKING, Any, ClassVar, get_type_hints
+
+import numpy as np
+
+from .nodes import Connection, ConstantStream, DataOutput, Node, Port, RenderContext, StreamInput, StreamOutput
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from multiprocessing.connection import Connection as Pipe
+
+    from .synchrotron import Synchrotron
+
+# Stream buffers are copied into shared memory blocks big enough for any numeric dtype, and everything else (data
+# values, MIDI buffers, constant streams, oversized buffers) is pickled along with the message for each buffer
+MAX_ITEMSIZE = 8
+
+ARRAY = 'array'
+CONSTANT = 'constant'
+VALUE = 'value'
+
+
+def encode(value: Any, memory: SharedMemory | None) -> tuple:
+    if isinstance(value, np.ndarray) and memory is not None and value.nbytes <= memory.size:
+        np.ndarray(value.shape, value.dtype, buffer=memory.buf)[...] = value
+        return ARRAY, value.dtype.str, value.shape
+    if isinstance(value, ConstantStream):
+        return CONSTANT, value.item(), value.dtype.str, value.size
+    return VALUE, value
+
+
+def decode(encoded: tuple, memory: SharedMemory | None) -> Any:
+    kind = encoded[0]
+    if kind == ARRAY:
+        _, dtype, shape = encoded
+        return np.ndarray(shape, np.dtype(dtype), buffer=memory.buf)
+    if kind == CONSTANT:
+        _, value, dtype, size = encoded
+        return ConstantStream(value, size, dtype)
+    return encoded[1]
+
+
+class PortDecoder:
+    # Reuses the array views and constant streams decoded for the previous buffer when nothing about them has changed
+    def __init__(self, memory: SharedMemory | None) -> None:
+        self.memory = memory
+        self._encoded: tuple | None = None
+        self._decoded: Any = None
+
+    def __call__(self, encoded: tuple) -> Any:
+        if encoded[0] == VALUE:
+            return encoded[1]
+        if encoded != self._encoded:
+            self._decoded = decode(encoded, self.memory)
+            self._encoded = encoded
+        return self._decoded
+
+
+def release_memory(blocks: Iterable[SharedMemory], unlink: bool = False) -> None:
+    for block in blocks:
+        # Arrays still viewing a block (e.g. in downstream nodes' input buffers) keep it mapped until they're released
+        with contextlib.suppress(BufferError):
+            block.close()
+        if unlink:
+            block.unlink()
+
+
+def is_stream_port(port: Port) -> bool:
+    return isinstance(port, (StreamInput, StreamOutput))
+
+
+class RemoteSourceNode(Node):
+    # Stands in for whatever is connected to an offloaded node's inputs back in the main process
+    out: DataOutput
+
+    def render(self, _: RenderContext) -> None:
+        pass
+
+
+def run_worker(
+    pipe: Pipe,
+    node_type_path: tuple[str, str],
+    node_name: str,
+    sample_rate: int,
+    buffer_size: int,
+    memory_names: dict[str, str],
+) -> None:
+    from .synchrotron import Synchrotron
+
+    memory = {port_name: SharedMemory(name=name) for port_name, name in memory_names.items()}
+    synchrotron = Synchrotron(sample_rate=sample_rate, buffer_size=buffer_size, audio_backend='null')
+    try:
+        module, qualname = node_type_path
+        node_type = functools.reduce(getattr, qualname.split('.'), import_module(module))
+        node = node_type(synchrotron=synchrotron, name=node_name)
+    except Exception as error:  # noqa: BLE001 (reported to the main process)
+        pipe.send(('error', f'{error.__class__.__name__}: {error}'))
+        return
+
+    source = RemoteSourceNode(synchrotron, name='_remote')
+    connections = {port: Connection(source.out, port, is_connected=True) for port in node.inputs}
+    input_decoders = [PortDecoder(memory.get(port.name)) for port in node.inputs]
+    exports = dict(node.exports)
+    pipe.send(('ready', exports))
+
+    try:
+        while True:
+            try:
+                message = pipe.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+
+            if message[0] == 'reconfigure':
+                # Stream buffers move to new blocks of shared memory, sized for the new buffer size
+                _, sample_rate, buffer_size, memory_names = message
+                for port in node.inputs:
+                    port.buffer = None
+                input_decoders.clear()
+                release_memory(memory.values())
+                memory = {port_name: SharedMemory(name=name) for port_name, name in memory_names.items()}
+                input_decoders = [PortDecoder(memory.get(port.name)) for port in node.inputs]
+                try:
+                    synchrotron.reconfigure(sample_rate, buffer_size)
+                    node.reconfigure(sample_rate, buffer_size)
+                except Exception as error:  # noqa: BLE001 (reported to the main process)
+                    pipe.send(('error', f'{error.__class__.__name__}: {error}'))
+                    continue
+                pipe.send(('ok', None))
+                continue
+
+            if message[0] in ('get_state', 'set_state'):
+                try:
+                    result = node.get_state() if message[0] == 'get_state' else node.set_state(message[1])
+                except Exception as error:  # noqa: BLE001 (reported to the main process)
+                    pipe.send(('error', f'{error.__class__.__name__}: {error}'))
+                    continue
+                pipe.send(('ok', result))
+                continue
+
+            global_clock, inputs = message
+            for port, decoder, (connected, value) in zip(node.inputs, input_decoders, inputs, strict=True):
+                port.connection = connections[port] if connected else None
+                port.buffer = decoder(value)
+
+            try:
+                node.render(RenderContext(global_clock, sample_rate, buffer_size))
+            except Exception as error:  # noqa: BLE001 (reported to the main process)
+                pipe.send(('error', f'{error.__class__.__name__}: {error}'))
+                continue
+
+            outputs = tuple(encode(port.buffer, memory.get(port.name)) for port in node.outputs)
+            changed_exports = None
+            if node.exports != exports:
+                changed_exports = exports = dict(node.exports)
+            pipe.send(('ok', (outputs, changed_exports)))
+    finally:
+        node.teardown()
+        synchrotron.shutdown()
+        input_decoders.clear()
+        release_memory(memory.values())
+
+
+class OffloadedNode(Node):
+    # Renders an instance of another node type in a worker process, so it doesn't compete with the render thread for
+    # the GIL. Both processes step through every buffer together: the render thread sends the node's inputs and waits
+    # for its outputs, which only holds the GIL while copying buffers in and out of shared memory.
+    node_type: ClassVar[type[Node]]
+
+    def __init__(self, synchrotron: Synchrotron, name: str) -> None:
+        super().__init__(synchrotron, name)
+        self._memory = self._create_memory(synchrotron.buffer_size)
+        self._output_decoders = [PortDecoder(self._memory.get(port.name)) for port in self.outputs]
+
+        # Spawned rather than forked, as forking a process with running threads (e.g. the render thread) isn't safe
+        context = multiprocessing.get_context('spawn')
+        self._pipe, worker_pipe = context.Pipe()
+        self.process = context.Process(
+            target=run_worker,
+            args=(
+                worker_pipe,
+                (self.node_type.__module__, self.node_type.__qualname__),
+                name,
+                synchrotron.sample_rate,
+                synchrotron.buffer_size,
+                {port_name: block.name for port_name, block in self._memory.items()},
+            ),
+            name=f'Offload-{name}',
+            daemon=True,
+        )
+        self.process.start()
+        worker_pipe.close()
+
+        try:
+            status, payload = self._pipe.recv()
+        except EOFError:
+            self.process.join()
+            status, payload = 'error', f'worker process exited with code {self.process.exitcode}'
+        if status == 'error':
+            self.teardown()
+            raise RuntimeError(f"couldn't offload node '{name}': {payload}")
+
+        self.exports.update(payload)
+        self.exports['Process'] = self.process.pid
+
+    def _create_memory(self, buffer_size: int) -> dict[str, SharedMemory]:
+        return {
+            port.name: SharedMemory(create=True, size=port.channels * buffer_size * MAX_ITEMSIZE)
+            for port in (*self.inputs, *self.outputs)
+            if is_stream_port(port)
+        }
+
+    def _request(self, message: tuple) -> Any:
+        self._pipe.send(message)
+        status, payload = self._pipe.recv()
+        if status == 'error':
+            raise RuntimeError(f"offloaded node '{self.name}' failed: {payload}")
+        return payload
+
+    def render(self, ctx: RenderContext) -> None:
+        inputs = tuple(
+            (port.connection is not None, encode(port.buffer, self._memory.get(port.name)))
+            for port in self.inputs
+        )
+        outputs, exports = self._request((ctx.global_clock, inputs))
+        for port, decoder, value in zip(self.outputs, self._output_decoders, outputs, strict=True):
+            port.write(decoder(value))
+        if exports is not None:
+            self.exports.update(exports)
+
+    def reconfigure(self, sample_rate: int, buffer_size: int) -> None:
+        super().reconfigure(sample_rate, buffer_size)
+        memory = self._memory
+        self._memory = self._create_memory(buffer_size)
+        self._output_decoders = [PortDecoder(self._memory.get(port.name)) for port in self.outputs]
+        for port in self.outputs:
+            port.buffer = None
+        try:
+            names = {port_name: block.name for port_name, block in self._memory.items()}
+            self._request(('reconfigure', sample_rate, buffer_size, names))
+        finally:
+            release_memory(memory.values(), unlink=True)
+
+    def get_state(self) -> dict[str, Any]:
+        return self._request(('get_state',))
+
+    def set_state(self, state: dict[str, Any]) -> None:
+        self._request(('set_state', state))
+
+    def teardown(self) -> None:
+        if self.process.is_alive():
+            try:
+                self._pipe.send(None)
+            except OSError:
+                pass
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+        self._pipe.close()
+
+        for port in self.outputs:
+            port.buffer = None
+        self._output_decoders.clear()
+        release_memory(self._memory.values(), unlink=True)
+
+
+@functools.cache
+def get_offloaded_type(node_type: type[Node]) -> type[OffloadedNode]:
+    # Offloaded nodes have the same name and ports as the node type they run, so they look just like it to the graph
+    ports = {
+        name: port_type
+        for name, port_type in get_type_hints(node_type).items()
+        if isinstance(port_type, type) and issubclass(port_type, Port)
+    }
+    return type(node_type.__name__, (OffloadedNode,), {
+        '__annotations__': ports,
+        '__module__': __name__,
+        '__qualname__': f'{OffloadedNode.__qualname__}[{node_type.__qualname__}]',
+        'node_type': node_type,
+        'always_render': node_type.always_render,
+        'pure': node_type.pure,
+    })
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from numpy.typing import ArrayLike, DTypeLike, NDArray
+
+
+class RingBuffer:
+    # Fixed-capacity FIFO of audio frames, shared between one producer thread and one consumer thread.
+    # Each side only ever advances its own (ever-increasing) index, so neither needs to take a lock.
+    def __init__(self, capacity: int, channels: int = 2, dtype: DTypeLike = np.float32) -> None:
+        if capacity < 1:
+            raise ValueError(f'ring buffer capacity must be at least 1 frame, got {capacity}')
+
+        self.capacity = capacity
+        self.channels = channels
+        self._data = np.zeros(shape=(capacity, channels), dtype=dtype)
+        self._read_index = 0
+        self._write_index = 0
+        # Frames dropped because the buffer was full, and reads which couldn't be satisfied because it was too empty
+        self.overruns = 0
+        self.underruns = 0
+
+    def __len__(self) -> int:
+        return self._write_index - self._read_index
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} ({len(self)}/{self.capacity} frames, {self.channels} channels)>'
+
+    @property
+    def free(self) -> int:
+        return self.capacity - len(self)
+
+    def write(self, frames: ArrayLike) -> int:
+        frames = np.asarray(frames).reshape(-1, self.channels)
+        count = min(len(frames), self.free)
+        self.overruns += len(frames) - count
+
+        start = self._write_index % self.capacity
+        first = min(count, self.capacity - start)
+        self._data[start:start + first] = frames[:first]
+        self._data[:count - first] = frames[first:count]
+
+        # Only publish the frames once they've been copied in
+        self._write_index += count
+        return count
+
+    def read(self, frame_count: int, out: NDArray | None = None) -> NDArray | None:
+        if len(self) < frame_count:
+            self.underruns += 1
+            return None
+
+        if out is None:
+            out = np.empty(shape=(frame_count, self.channels), dtype=self._data.dtype)
+        else:
+            out = out.reshape(frame_count, self.channels)
+
+        start = self._read_index % self.capacity
+        first = min(frame_count, self.capacity - start)
+        out[:first] = self._data[start:start + first]
+        out[first:] = self._data[:frame_count - first]
+
+        self._read_index += frame_count
+        return out
+
+    def read_view(self, frame_count: int) -> NDArray | None:
+        # Reads without copying, returning a view of the frames which stays valid until the producer overwrites them.
+        # Only frames which wrap around the end of the buffer have to be copied.
+        if len(self) < frame_count:
+            self.underruns += 1
+            return None
+
+        start = self._read_index % self.capacity
+        if start + frame_count > self.capacity:
+            return self.read(frame_count)
+
+        self._read_index += frame_count
+        return self._data[start:start + frame_count]
+
+    def clear(self) -> None:
+        # Only safe to call from the consumer thread
+        self._read_index = self._write_index
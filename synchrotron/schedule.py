@@ -0,0 +1,436 @@
+from __future__ import annotations
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, replace
+from graphlib import TopologicalSorter
+from threading import Barrier, BrokenBarrierError, Thread
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from .fusion import fuse_steps
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Mapping, Set
+
+    from .nodes import Input, Node, Output, RenderContext
+    from .stats import RenderStats
+
+
+@dataclass(frozen=True, slots=True)
+class RenderStep:
+    node: Node
+    render: Callable[[RenderContext], None]
+    # Triples of (output, conversion, sinks) to copy buffers along once the node has rendered, where the buffer is
+    # converted first for sinks of a different stream type to the output
+    propagations: tuple[tuple[Output, Callable[[Any], Any] | None, tuple[Input, ...]], ...]
+    # Nodes fused into this step, whose kernels are rendered along with the node's own (see synchrotron.fusion)
+    fused_nodes: tuple[Node, ...] = ()
+
+    def run(self, ctx: RenderContext) -> None:
+        self.render(ctx)
+        for output, conversion, sinks in self.propagations:
+            buffer = output.buffer if conversion is None else conversion(output.buffer)
+            for sink in sinks:
+                sink.buffer = buffer
+
+
+# Flat execution plan for the node graph, compiled once and then reused for every buffer until the graph changes
+class RenderSchedule:
+    def __init__(
+        self,
+        steps: tuple[RenderStep, ...],
+        levels: tuple[tuple[RenderStep, ...], ...],
+        culled_nodes: frozenset[Node] = frozenset(),
+        folded_nodes: frozenset[Node] = frozenset(),
+        fused_nodes: frozenset[Node] = frozenset(),
+    ) -> None:
+        self.steps = steps
+        # Steps grouped by dependency depth: every step in a level only depends on steps in earlier levels
+        self.levels = levels
+        # Nodes left out of the schedule because nothing they output can ever be heard
+        self.culled_nodes = culled_nodes
+        # Pure nodes with constant inputs, which were rendered once at compile time and are left out of the schedule
+        self.folded_nodes = folded_nodes
+        # Element-wise nodes rendered as part of another node's step, which runs their kernels together in one pass
+        self.fused_nodes = fused_nodes
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def __repr__(self) -> str:
+        return (
+            f'<{self.__class__.__name__} '
+            f'({len(self.steps)} steps, {len(self.culled_nodes)} culled, {len(self.folded_nodes)} folded, '
+            f'{len(self.fused_nodes)} fused)>'
+        )
+
+    @staticmethod
+    def find_live_nodes(node_dependencies: Mapping[Node, Set[Node]]) -> set[Node]:
+        # Walk upstream from every node that must always render (sinks and other side effects)
+        live_nodes = {node for node in node_dependencies if node.always_render}
+        stack = list(live_nodes)
+        while stack:
+            for dependency in node_dependencies[stack.pop()]:
+                if dependency not in live_nodes:
+                    live_nodes.add(dependency)
+                    stack.append(dependency)
+
+        return live_nodes
+
+    @classmethod
+    def compile(
+        cls,
+        node_dependencies: Mapping[Node, Set[Node]],
+        ctx: RenderContext,
+        cull: bool = True,
+        fold: bool = True,
+        fuse: bool = True,
+    ) -> RenderSchedule:
+        culled_nodes = frozenset()
+        if cull:
+            live_nodes = cls.find_live_nodes(node_dependencies)
+            culled_nodes = frozenset(node_dependencies.keys() - live_nodes)
+            node_dependencies = {node: node_dependencies[node] for node in node_dependencies if node in live_nodes}
+
+        steps = []
+        node_levels: dict[Node, int] = {}
+        folded_nodes = set()
+        for node in TopologicalSorter(node_dependencies).static_order():
+            propagations = []
+            for output in node.outputs:
+                # Sinks needing the same conversion share the converted buffer
+                conversion_sinks: dict[Callable[[Any], Any] | None, list[Input]] = {}
+                for connection in output.connections:
+                    conversion_sinks.setdefault(connection.sink.get_conversion(output), []).append(connection.sink)
+                propagations.extend(
+                    (output, conversion, tuple(sinks)) for conversion, sinks in conversion_sinks.items()
+                )
+            step = RenderStep(node=node, render=node.render, propagations=tuple(propagations))
+
+            if fold and node.pure and all(
+                input_port.connection is None or input_port.connection.source.node in folded_nodes
+                for input_port in node.inputs
+            ):
+                # Render once now, and the sinks keep hold of the constant result until the graph changes
+                step.run(ctx)
+                folded_nodes.add(node)
+                continue
+
+            steps.append(step)
+            node_levels[node] = max(
+                (node_levels[dependency] + 1 for dependency in node_dependencies[node] if dependency in node_levels),
+                default=0,
+            )
+
+        fused_nodes = {}
+        if fuse:
+            steps, fused_nodes = fuse_steps(steps, ctx)
+
+        # A fused step stays at the level of the node it renders, which is above every node fused into it, so it still
+        # only depends on steps in earlier levels. Levels left with only fused nodes are dropped.
+        levels: list[list[RenderStep]] = [[] for _ in range(max(node_levels.values(), default=-1) + 1)]
+        for step in steps:
+            levels[node_levels[step.node]].append(step)
+
+        return cls(
+            tuple(steps),
+            tuple(tuple(level) for level in levels if level),
+            culled_nodes,
+            frozenset(folded_nodes),
+            frozenset(fused_nodes),
+        )
+
+    def render(self, ctx: RenderContext) -> None:
+        for step in self.steps:
+            step.run(ctx)
+
+    def render_profiled(self, ctx: RenderContext, stats: RenderStats) -> None:
+        for step in self.steps:
+            start_time = time.perf_counter()
+            step.run(ctx)
+            stats.record_node(step.node, time.perf_counter() - start_time)
+
+
+class ParallelRenderer:
+    def __init__(self, workers: int) -> None:
+        if workers < 1:
+            raise ValueError(f'parallel renderer needs at least 1 worker, got {workers}')
+
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='RenderWorker')
+        # Accumulated time spent rendering nodes vs wall-clock time spent rendering buffers
+        self.node_time = 0.
+        self.wall_time = 0.
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} ({self.workers} workers, {self.speedup:.2f}x speedup)>'
+
+    @property
+    def speedup(self) -> float:
+        # How much faster buffers render compared to running the same node work serially
+        return self.node_time / self.wall_time if self.wall_time else 1.
+
+    def reset_stats(self) -> None:
+        self.node_time = 0.
+        self.wall_time = 0.
+
+    @staticmethod
+    def _run_step(step: RenderStep, ctx: RenderContext, stats: RenderStats | None) -> float:
+        start_time = time.perf_counter()
+        step.run(ctx)
+        elapsed = time.perf_counter() - start_time
+        if stats is not None:
+            stats.record_node(step.node, elapsed)
+        return elapsed
+
+    def render(self, schedule: RenderSchedule, ctx: RenderContext, stats: RenderStats | None = None) -> None:
+        start_time = time.perf_counter()
+        node_time = 0.
+
+        for level in schedule.levels:
+            # Independent steps are dispatched to the pool, while the render thread takes the first one itself
+            futures = [self.pool.submit(self._run_step, step, ctx, stats) for step in level[1:]]
+            node_time += self._run_step(level[0], ctx, stats)
+            if futures:
+                wait(futures)
+                for future in futures:
+                    node_time += future.result()
+
+        self.node_time += node_time
+        self.wall_time += time.perf_counter() - start_time
+
+    def shutdown(self) -> None:
+        self.pool.shutdown()
+
+
+@dataclass(frozen=True, slots=True)
+class PipelineStage:
+    steps: tuple[RenderStep, ...]
+    nodes: frozenset[Node]
+    # Nodes rendered by any of the following stages, which values handed over from earlier stages are passed on to
+    later_nodes: frozenset[Node]
+    # Triples of (output, conversion, sinks) in later stages, which the output's buffer is handed over to along with the
+    # block
+    handoffs: tuple[tuple[Output, Callable[[Any], Any] | None, tuple[Input, ...]], ...]
+
+    def run(self, ctx: RenderContext, stats: RenderStats | None) -> None:
+        if stats is None:
+            for step in self.steps:
+                step.run(ctx)
+        else:
+            for step in self.steps:
+                start_time = time.perf_counter()
+                step.run(ctx)
+                stats.record_node(step.node, time.perf_counter() - start_time)
+
+
+class Handoff:
+    # Passes blocks, as (render context, sink buffers), from one pipeline stage to the next, with only one thread ever
+    # publishing and one ever taking. A block published while rendering one buffer is only ready to take once the
+    # render thread has swapped the slots, between buffers while no stage is running, so each stage always renders the
+    # block the stage before it rendered for the previous buffer, without either of them taking a lock.
+    __slots__ = ('_published', '_ready')
+
+    def __init__(self) -> None:
+        self._published: tuple[RenderContext, dict[Input, Any]] | None = None
+        self._ready: tuple[RenderContext, dict[Input, Any]] | None = None
+
+    def publish(self, block: tuple[RenderContext, dict[Input, Any]]) -> None:
+        self._published = block
+
+    def take(self) -> tuple[RenderContext, dict[Input, Any]] | None:
+        block, self._ready = self._ready, None
+        return block
+
+    def swap(self) -> None:
+        self._ready, self._published = self._published, None
+
+    def clear(self) -> None:
+        self._published = self._ready = None
+
+
+class PipelineRenderer:
+    # Splits the schedule into stages which all render at the same time, each on a different buffer: while the first
+    # stage renders buffer n, the second renders buffer n - 1, and so on. Every stage after the first delays everything
+    # it renders by one more buffer, in exchange for the graph's render time being spread across several threads.
+    def __init__(self, stages: int, pin_threads: bool = True) -> None:
+        if stages < 2:
+            raise ValueError(f'pipeline renderer needs at least 2 stages, got {stages}')
+
+        self.stage_count = stages
+        self._schedule: RenderSchedule | None = None
+        self._stages: tuple[PipelineStage, ...] = ()
+        # Blocks handed from each stage to the next
+        self._handoffs = [Handoff() for _ in range(stages - 1)]
+        self._ctx: RenderContext | None = None
+        self._stats: RenderStats | None = None
+        self._errors: deque[BaseException] = deque()
+
+        # Stages step through buffers together, with the render thread running the first stage itself
+        self._barrier = Barrier(stages)
+        cpus = sorted(os.sched_getaffinity(0)) if pin_threads and hasattr(os, 'sched_getaffinity') else []
+        self._threads = [
+            Thread(
+                target=self._stage_loop,
+                args=(index, cpus[index % len(cpus)] if len(cpus) > 1 else None),
+                name=f'PipelineStage-{index}',
+                daemon=True,
+            )
+            for index in range(1, stages)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} ({self.stage_count} stages, {self.latency} buffers of latency)>'
+
+    @property
+    def latency(self) -> int:
+        # Extra buffers between the first stage rendering a buffer and the last stage finishing it
+        return self.stage_count - 1
+
+    @property
+    def stages(self) -> tuple[PipelineStage, ...]:
+        return self._stages
+
+    @staticmethod
+    def partition(
+        schedule: RenderSchedule,
+        stage_count: int,
+        stats: RenderStats | None = None,
+    ) -> tuple[PipelineStage, ...]:
+        # Sinks with nothing downstream go in the last stage, so everything which is heard is delayed by the same amount
+        steps = []
+        final_steps = []
+        for step in schedule.steps:
+            (final_steps if step.node.always_render and not step.propagations else steps).append(step)
+
+        # Split the rest into contiguous runs of roughly equal cost, by measured render time if there's any
+        node_times = {} if stats is None else stats.node_times
+        costs = [float(np.mean(node_times[step.node])) if node_times.get(step.node) else 1. for step in steps]
+        total_cost = sum(costs) or 1.
+        node_stages = {step.node: stage_count - 1 for step in final_steps}
+        cumulative_cost = 0.
+        for step, cost in zip(steps, costs, strict=True):
+            node_stages[step.node] = min(int((cumulative_cost + cost / 2) / total_cost * stage_count), stage_count - 1)
+            cumulative_cost += cost
+        # Nodes fused into a step still have their inputs handed over to them, in the same stage as the step
+        for step in schedule.steps:
+            for node in step.fused_nodes:
+                node_stages[node] = node_stages[step.node]
+
+        stage_steps: list[list[RenderStep]] = [[] for _ in range(stage_count)]
+        stage_handoffs: list[list[tuple[Output, Callable[[Any], Any] | None, tuple[Input, ...]]]] = [
+            [] for _ in range(stage_count)
+        ]
+        for step in (*steps, *final_steps):
+            index = node_stages[step.node]
+            propagations = []
+            for output, conversion, sinks in step.propagations:
+                local_sinks = tuple(sink for sink in sinks if node_stages.get(sink.node) == index)
+                later_sinks = tuple(sink for sink in sinks if node_stages.get(sink.node, -1) > index)
+                if local_sinks:
+                    propagations.append((output, conversion, local_sinks))
+                if later_sinks:
+                    stage_handoffs[index].append((output, conversion, later_sinks))
+            stage_steps[index].append(replace(step, propagations=tuple(propagations)))
+
+        stage_nodes = [
+            frozenset(node for step in steps for node in (step.node, *step.fused_nodes)) for steps in stage_steps
+        ]
+        return tuple(
+            PipelineStage(
+                steps=tuple(stage_steps[index]),
+                nodes=stage_nodes[index],
+                later_nodes=frozenset().union(*stage_nodes[index + 1:]),
+                handoffs=tuple(stage_handoffs[index]),
+            )
+            for index in range(stage_count)
+        )
+
+    def _run_stage(self, index: int) -> None:
+        stage = self._stages[index]
+        if index == 0:
+            ctx, values = self._ctx, {}
+        else:
+            block = self._handoffs[index - 1].take()
+            # Until the pipeline has filled up, there's nothing for later stages to render yet
+            if block is None:
+                return
+            ctx, values = block
+
+        handed_over = {}
+        for sink, value in values.items():
+            if sink.node in stage.nodes:
+                sink.buffer = value
+            elif sink.node in stage.later_nodes:
+                handed_over[sink] = value
+
+        stage.run(ctx, self._stats)
+
+        for output, conversion, sinks in stage.handoffs:
+            buffer = output.buffer
+            # The node will render its next buffer into the same array while later stages are still reading this one
+            if isinstance(buffer, np.ndarray):
+                buffer = buffer.copy()
+            if conversion is not None:
+                buffer = conversion(buffer)
+            for sink in sinks:
+                handed_over[sink] = buffer
+        if index < len(self._handoffs):
+            self._handoffs[index].publish((ctx, handed_over))
+
+    def _stage_loop(self, index: int, cpu: int | None) -> None:
+        if cpu is not None:
+            # On Linux, this pins just the calling thread
+            os.sched_setaffinity(0, {cpu})
+
+        while True:
+            try:
+                self._barrier.wait()
+            except BrokenBarrierError:
+                return
+            try:
+                self._run_stage(index)
+            except BaseException as error:  # noqa: BLE001 (re-raised on the render thread)
+                self._errors.append(error)
+            try:
+                self._barrier.wait()
+            except BrokenBarrierError:
+                return
+
+    def render(self, schedule: RenderSchedule, ctx: RenderContext, stats: RenderStats | None = None) -> None:
+        # The schedule only changes between buffers, while none of the stages are rendering
+        if schedule is not self._schedule:
+            self._stages = self.partition(schedule, self.stage_count, stats)
+            self._schedule = schedule
+        self._ctx = ctx
+        self._stats = stats
+
+        self._barrier.wait()
+        try:
+            self._run_stage(0)
+        finally:
+            self._barrier.wait()
+            # Every stage has finished this buffer and is waiting for the next, so blocks can be passed along
+            for handoff in self._handoffs:
+                handoff.swap()
+
+        if self._errors:
+            error = self._errors.popleft()
+            self._errors.clear()
+            raise error
+
+    def reset(self) -> None:
+        # Drop every buffer part way through the pipeline, which then fills up again from the first stage
+        for handoff in self._handoffs:
+            handoff.clear()
+
+    def shutdown(self) -> None:
+        self._barrier.abort()
+        for thread in self._threads:
+            thread.join()
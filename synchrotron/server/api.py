@@ -1,5 +1,8 @@
 from fastapi import APIRouter
 from fastapi.requests import Request
+from fastapi.responses import Response
+
+from synchrotron.synchrolang import SynchrolangTransformer
 
 from . import models
 from .dependencies import SynchrotronDependency
@@ -8,12 +11,38 @@ router = APIRouter()
 
 
 @router.post('/execute')
-async def execute(request: Request, synchrotron: SynchrotronDependency) -> str:
+async def execute(request: Request, synchrotron: SynchrotronDependency, transactional: bool = False) -> str:
     body = await request.body()
-    return_values = synchrotron.execute(body.decode())
+    return_values = synchrotron.execute(body.decode(), transactional=transactional)
     return repr(return_values)
 
 
+@router.post('/batch')
+async def execute_batch(synchrotron: SynchrotronDependency, operations: list[models.Operation]) -> list[models.Node]:
+    # Operations are applied together between two buffers, or not at all if any of them fails. The created nodes are
+    # returned, which includes the names given to any unnamed ones.
+    created_nodes = []
+    with synchrotron.transaction() as transaction:
+        transformer = SynchrolangTransformer(synchrotron, transaction)
+        for operation in operations:
+            if isinstance(operation, models.CreateOperation):
+                cls = operation.value if operation.type is None else transformer.node_type(type_name=operation.type)
+                created_nodes.append(transformer.create(cls=cls, name=operation.name))
+            elif isinstance(operation, models.RemoveOperation):
+                transaction.remove_node(operation.name)
+            elif isinstance(operation, models.ClearOperation):
+                transaction.clear()
+            else:
+                source = transaction.get_node(operation.source.node_name).get_output(operation.source.port_name)
+                sink = transaction.get_node(operation.sink.node_name).get_input(operation.sink.port_name)
+                if isinstance(operation, models.LinkOperation):
+                    transaction.add_connection(source, sink)
+                else:
+                    transaction.remove_connection(source, sink)
+
+    return [models.Node.model_validate(node.as_json()) for node in created_nodes]
+
+
 @router.get('/start')
 async def start_rendering(synchrotron: SynchrotronDependency) -> None:
     synchrotron.start_rendering()
@@ -29,11 +58,68 @@ async def clear_graph(synchrotron: SynchrotronDependency) -> None:
     synchrotron.execute('clear')
 
 
+@router.get('/config')
+async def get_configuration(synchrotron: SynchrotronDependency) -> models.Configuration:
+    return models.Configuration(sample_rate=synchrotron.sample_rate, buffer_size=synchrotron.buffer_size)
+
+
+@router.post('/config')
+async def reconfigure(
+    synchrotron: SynchrotronDependency,
+    sample_rate: int | None = None,
+    buffer_size: int | None = None,
+) -> models.Configuration:
+    synchrotron.reconfigure(sample_rate, buffer_size)
+    return models.Configuration(sample_rate=synchrotron.sample_rate, buffer_size=synchrotron.buffer_size)
+
+
+@router.get('/stats')
+async def get_stats(synchrotron: SynchrotronDependency) -> models.Stats:
+    return models.Stats.model_validate(synchrotron.get_stats())
+
+
+@router.get('/stats/enable')
+async def enable_profiling(synchrotron: SynchrotronDependency) -> None:
+    synchrotron.enable_profiling()
+
+
+@router.get('/stats/disable')
+async def disable_profiling(synchrotron: SynchrotronDependency) -> None:
+    synchrotron.disable_profiling()
+
+
+@router.get('/stats/reset')
+async def reset_stats(synchrotron: SynchrotronDependency) -> None:
+    if synchrotron.render_stats is not None:
+        synchrotron.render_stats.reset()
+    if synchrotron.parallel_renderer is not None:
+        synchrotron.parallel_renderer.reset_stats()
+
+
 @router.get('/export')
 async def export_state(synchrotron: SynchrotronDependency) -> str:
     return synchrotron.export_state()
 
 
+@router.get('/snapshot')
+async def save_snapshot(synchrotron: SynchrotronDependency) -> Response:
+    return Response(content=synchrotron.save_snapshot(), media_type='application/octet-stream')
+
+
+@router.post('/snapshot')
+async def restore_snapshot(request: Request, synchrotron: SynchrotronDependency) -> list[models.Node]:
+    body = await request.body()
+    return [models.Node.model_validate(node.as_json()) for node in synchrotron.restore_snapshot(body)]
+
+
+@router.get('/types')
+async def get_node_types(synchrotron: SynchrotronDependency) -> list[models.NodeType]:
+    return [
+        models.NodeType.model_validate(synchrotron.node_types.describe(name).as_json())
+        for name in synchrotron.node_types
+    ]
+
+
 @router.get('/nodes')
 async def get_nodes(synchrotron: SynchrotronDependency) -> list[models.Node]:
     return [models.Node.model_validate(node.as_json()) for node in synchrotron.nodes]
@@ -72,6 +158,21 @@ async def remove_node(synchrotron: SynchrotronDependency, node_name: str) -> mod
     return models.Node.model_validate(synchrotron.remove_node(node_name).as_json())
 
 
+@router.post('/nodes/{node_name}/offload')
+async def offload_node(synchrotron: SynchrotronDependency, node_name: str) -> models.Node:
+    return models.Node.model_validate(synchrotron.offload_node(node_name).as_json())
+
+
+@router.post('/nodes/{node_name}/inline')
+async def inline_node(synchrotron: SynchrotronDependency, node_name: str) -> models.Node:
+    return models.Node.model_validate(synchrotron.inline_node(node_name).as_json())
+
+
+@router.post('/offload')
+async def offload_expensive_nodes(synchrotron: SynchrotronDependency, threshold: float = 0.25) -> list[models.Node]:
+    return [models.Node.model_validate(node.as_json()) for node in synchrotron.offload_expensive_nodes(threshold)]
+
+
 @router.get('/connections')
 async def get_connections(synchrotron: SynchrotronDependency) -> list[models.Connection]:
     return [
@@ -1,15 +1,38 @@
+from typing import Annotated
+
+import typer
 from typer import Typer
 
 cli = Typer()
 
 
 @cli.command()
-def main(host: str = 'localhost', port: int = 2031):
+def main(
+    host: str = 'localhost',
+    port: int = 2031,
+    workers: int = 0,
+    stages: Annotated[int, typer.Option(help='Pipeline stages, each adding a buffer of latency')] = 1,
+    profile: bool = False,
+    backend: Annotated[str, typer.Option(help='Audio backend: pyaudio, null, file or ringbuffer')] = 'pyaudio',
+    lookahead: Annotated[int, typer.Option(help='Buffers rendered ahead of the sound card (pyaudio only)')] = 2,
+):
     import contextlib
 
     import uvicorn
 
+    from synchrotron.backends import BACKENDS, get_backend
+
     from . import server
 
+    if backend not in BACKENDS:
+        raise typer.BadParameter(f"unknown audio backend '{backend}'", param_hint='--backend')
+
+    server.app.state.synchrotron_options = {
+        'render_workers': workers,
+        'pipeline_stages': stages,
+        'profile': profile,
+        'audio_backend': get_backend(backend, lookahead=lookahead) if backend == 'pyaudio' else backend,
+    }
+
     with contextlib.suppress(KeyboardInterrupt):
         uvicorn.run(server.app, host=host, port=port)
@@ -1,6 +1,6 @@
-from typing import Any
+from typing import Annotated, Any, Literal, TypeAlias
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class Port(BaseModel):
@@ -29,3 +29,70 @@ class Node(BaseModel):
 class Connection(BaseModel):
     source: Port
     sink: Port
+
+
+class CreateOperation(BaseModel):
+    # Either a node type, or a value for a data node
+    action: Literal['create']
+    name: str | None = None
+    type: str | None = None
+    value: Any = None
+
+
+class RemoveOperation(BaseModel):
+    action: Literal['remove']
+    name: str
+
+
+class LinkOperation(Connection):
+    action: Literal['link']
+
+
+class UnlinkOperation(Connection):
+    action: Literal['unlink']
+
+
+class ClearOperation(BaseModel):
+    action: Literal['clear']
+
+
+Operation: TypeAlias = Annotated[
+    CreateOperation | RemoveOperation | LinkOperation | UnlinkOperation | ClearOperation,
+    Field(discriminator='action'),
+]
+
+
+class NodeType(BaseModel):
+    name: str
+    inputs: dict[str, str]
+    outputs: dict[str, str]
+
+
+class Timings(BaseModel):
+    mean: float
+    p50: float
+    p99: float
+    max: float
+
+
+class NodeTimings(Timings):
+    type: str
+
+
+class Configuration(BaseModel):
+    sample_rate: int
+    buffer_size: int
+
+
+class Stats(BaseModel):
+    enabled: bool
+    parallel_speedup: float | None = None
+    pipeline_stages: int = 1
+    pipeline_latency: float = 0.
+    underruns: int = 0
+    blocks: int = 0
+    xruns: int = 0
+    deadline: float | None = None
+    block_time: Timings | None = None
+    load: Timings | None = None
+    nodes: dict[str, NodeTimings] = {}
@@ -11,7 +11,7 @@ from . import api
 # noinspection PyUnresolvedReferences
 @asynccontextmanager
 async def lifespan(fastapi_app: FastAPI):
-    fastapi_app.state.synchrotron = Synchrotron()
+    fastapi_app.state.synchrotron = Synchrotron(**getattr(fastapi_app.state, 'synchrotron_options', {}))
     yield
     fastapi_app.state.synchrotron.shutdown()
 
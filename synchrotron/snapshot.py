@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import json
+import struct
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+
+# A snapshot is laid out as a fixed preamble (magic bytes, format version and header length), a JSON header describing
+# the graph and every node's state, then the raw bytes of each array in the state, each starting on an 8-byte boundary
+MAGIC = b'SYNCSNAP'
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct('<8sII')
+ALIGNMENT = 8
+
+# State values which JSON can't represent are swapped for single-key objects marked with one of these keys
+ARRAY = '$array'
+BYTES = '$bytes'
+BYTEARRAY = '$bytearray'
+SCALAR = '$scalar'
+TUPLE = '$tuple'
+SET = '$set'
+
+
+@dataclass
+class NodeSnapshot:
+    name: str
+    type: str
+    state: dict[str, Any] = field(default_factory=dict)
+    # Only for data nodes, which are created with their value
+    value: Any = None
+    offloaded: bool = False
+
+
+@dataclass
+class Snapshot:
+    sample_rate: int
+    buffer_size: int
+    nodes: list[NodeSnapshot]
+    # (source node, output port, sink node, input port)
+    connections: list[tuple[str, str, str, str]]
+
+    def to_bytes(self) -> bytes:
+        arrays: list[np.ndarray] = []
+        header = {
+            'sample_rate': self.sample_rate,
+            'buffer_size': self.buffer_size,
+            'nodes': [
+                {
+                    'name': node.name,
+                    'type': node.type,
+                    'state': encode_value(node.state, arrays),
+                    'value': encode_value(node.value, arrays),
+                    'offloaded': node.offloaded,
+                }
+                for node in self.nodes
+            ],
+            'connections': self.connections,
+            'arrays': [],
+        }
+
+        offset = 0
+        for array in arrays:
+            header['arrays'].append((array.dtype.str, array.shape, offset))
+            offset += _aligned(array.nbytes)
+        header_bytes = json.dumps(header, separators=(',', ':')).encode()
+        header_bytes += b' ' * (_aligned(PREAMBLE.size + len(header_bytes)) - PREAMBLE.size - len(header_bytes))
+
+        data = bytearray(PREAMBLE.size + len(header_bytes) + offset)
+        PREAMBLE.pack_into(data, 0, MAGIC, FORMAT_VERSION, len(header_bytes))
+        data[PREAMBLE.size:PREAMBLE.size + len(header_bytes)] = header_bytes
+        data_start = PREAMBLE.size + len(header_bytes)
+        array_data = np.frombuffer(data, dtype=np.uint8, offset=data_start)
+        for array, (_, _, array_offset) in zip(arrays, header['arrays'], strict=True):
+            array_data[array_offset:array_offset + array.nbytes] = np.ascontiguousarray(array).reshape(-1).view(np.uint8)
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Snapshot:
+        if len(data) < PREAMBLE.size:
+            raise ValueError('snapshot is truncated')
+        magic, version, header_length = PREAMBLE.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError('not a Synchrotron snapshot')
+        if version != FORMAT_VERSION:
+            raise ValueError(f'unsupported snapshot format version {version}')
+        data_start = PREAMBLE.size + header_length
+        header = json.loads(bytes(data[PREAMBLE.size:data_start]))
+
+        arrays = []
+        for dtype, shape, offset in header['arrays']:
+            dtype = np.dtype(dtype)
+            count = int(np.prod(shape, dtype=np.int64))
+            if data_start + offset + count * dtype.itemsize > len(data):
+                raise ValueError('snapshot is truncated')
+            # Copied out, so nodes are free to write to their state arrays
+            array = np.frombuffer(data, dtype=dtype, count=count, offset=data_start + offset).reshape(shape)
+            arrays.append(array.copy())
+
+        return cls(
+            sample_rate=header['sample_rate'],
+            buffer_size=header['buffer_size'],
+            nodes=[
+                NodeSnapshot(
+                    name=node['name'],
+                    type=node['type'],
+                    state=decode_value(node['state'], arrays),
+                    value=decode_value(node['value'], arrays),
+                    offloaded=node['offloaded'],
+                )
+                for node in header['nodes']
+            ],
+            connections=[tuple(connection) for connection in header['connections']],
+        )
+
+
+def encode_value(value: Any, arrays: list[np.ndarray]) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise TypeError("can't save arrays of Python objects in a snapshot")
+        arrays.append(value)
+        return {ARRAY: len(arrays) - 1}
+    if isinstance(value, (bytes, bytearray)):
+        arrays.append(np.frombuffer(value, dtype=np.uint8))
+        return {BYTEARRAY if isinstance(value, bytearray) else BYTES: len(arrays) - 1}
+    if isinstance(value, np.generic):
+        # Kept as NumPy scalars, as arithmetic on them gives different results to Python's (e.g. float32 phases)
+        return {SCALAR: (value.dtype.str, value.item())}
+    if isinstance(value, list):
+        return [encode_value(item, arrays) for item in value]
+    if isinstance(value, tuple):
+        return {TUPLE: [encode_value(item, arrays) for item in value]}
+    if isinstance(value, (set, frozenset)):
+        return {SET: [encode_value(item, arrays) for item in value]}
+    if isinstance(value, dict):
+        if not all(isinstance(key, str) for key in value):
+            raise TypeError(f'state dictionaries must have string keys: {value!r}')
+        return {key: encode_value(item, arrays) for key, item in value.items()}
+    raise TypeError(f"can't save state of type '{value.__class__.__name__}' in a snapshot")
+
+
+def decode_value(value: Any, arrays: list[np.ndarray]) -> Any:
+    if isinstance(value, list):
+        return [decode_value(item, arrays) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    if len(value) == 1:
+        (key, item), = value.items()
+        if key == ARRAY:
+            return arrays[item]
+        if key == BYTES:
+            return arrays[item].tobytes()
+        if key == BYTEARRAY:
+            return bytearray(arrays[item].tobytes())
+        if key == SCALAR:
+            dtype, scalar = item
+            return np.dtype(dtype).type(scalar)
+        if key == TUPLE:
+            return tuple(decode_value(element, arrays) for element in item)
+        if key == SET:
+            return {decode_value(element, arrays) for element in item}
+    return {key: decode_value(item, arrays) for key, item in value.items()}
+
+
+def _aligned(size: int) -> int:
+    return -(-size // ALIGNMENT) * ALIGNMENT
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from .nodes import Node
+
+
+def summarise(samples: Iterable[float], scale: float = 1.) -> dict[str, float] | None:
+    # Copy to a list first, as the render thread may be appending to the samples meanwhile
+    samples = np.array(list(samples), dtype=np.float64)
+    if not samples.size:
+        return None
+
+    p50, p99 = np.percentile(samples, (50, 99)) * scale
+    return {
+        'mean': float(samples.mean() * scale),
+        'p50': float(p50),
+        'p99': float(p99),
+        'max': float(samples.max() * scale),
+    }
+
+
+class RenderStats:
+    # Rolling render timings over the last `window` buffers, recorded by the render loop while profiling is enabled
+    def __init__(self, window: int = 1000) -> None:
+        self.window = window
+        self.block_count = 0
+        self.xrun_count = 0
+        self.deadline = 0.
+        self.block_times: deque[float] = deque(maxlen=window)
+        self.node_times: dict[Node, deque[float]] = {}
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} ({self.block_count} blocks, {self.xrun_count} xruns)>'
+
+    def record_node(self, node: Node, elapsed: float) -> None:
+        times = self.node_times.get(node)
+        if times is None:
+            times = self.node_times.setdefault(node, deque(maxlen=self.window))
+        times.append(elapsed)
+
+    def record_block(self, elapsed: float, deadline: float) -> None:
+        self.block_count += 1
+        self.deadline = deadline
+        self.block_times.append(elapsed)
+        # Taking longer to render a buffer than it takes to play it back means the audio device will underrun
+        if elapsed > deadline:
+            self.xrun_count += 1
+
+    def forget(self, node: Node) -> None:
+        self.node_times.pop(node, None)
+
+    def reset(self) -> None:
+        self.block_count = 0
+        self.xrun_count = 0
+        self.block_times.clear()
+        self.node_times.clear()
+
+    def as_json(self) -> dict:
+        # Times are reported in milliseconds, and load as a fraction of the time available to render each buffer
+        nodes = {}
+        for node, times in list(self.node_times.items()):
+            # Summarised before checking for any times, as the render thread may clear them in between
+            summary = summarise(times, scale=1000)
+            if summary is not None:
+                nodes[node.name] = {'type': node.__class__.__name__, **summary}
+
+        return {
+            'blocks': self.block_count,
+            'xruns': self.xrun_count,
+            'deadline': self.deadline * 1000,
+            'block_time': summarise(self.block_times, scale=1000),
+            'load': summarise(self.block_times, scale=1 / self.deadline) if self.deadline else None,
+            'nodes': nodes,
+        }
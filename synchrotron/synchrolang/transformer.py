@@ -14,6 +14,7 @@ if TYPE_CHECKING:
     from threading import Thread
 
     from synchrotron.synchrotron import Synchrotron
+    from synchrotron.transaction import Transaction
 
 Value: TypeAlias = str | int | float | list['Value'] | bool | None
 Expression: TypeAlias = Value | type[Node] | Node | Port | Connection
@@ -21,9 +22,19 @@ Expression: TypeAlias = Value | type[Node] | Node | Port | Connection
 
 @lark.v_args(inline=True)
 class SynchrolangTransformer(lark.Transformer):
-    def __init__(self, synchrotron: Synchrotron) -> None:
+    def __init__(self, synchrotron: Synchrotron, transaction: Transaction | None = None) -> None:
         super().__init__()
         self.synchrotron = synchrotron
+        self.transaction = transaction
+
+    @property
+    def graph(self) -> Synchrotron | Transaction:
+        # Within a transaction, graph edits are staged rather than made to the live graph
+        return self.synchrotron if self.transaction is None else self.transaction
+
+    def _check_not_transactional(self, command: str) -> None:
+        if self.transaction is not None:
+            raise ValueError(f"'{command}' cannot be used within a transaction")
 
     # Literal values
 
@@ -45,20 +56,25 @@ class SynchrolangTransformer(lark.Transformer):
         return list(elements)
 
     def global_var(self, name: lark.Token) -> Any:
+        # Globals are looked up lazily, as some (e.g. stats) are relatively expensive to compute
         global_vars = {
-            'synchrotron': self.synchrotron,
-            'pyaudio': self.synchrotron.pyaudio_session,
-            'clock': self.synchrotron.global_clock,
-            'thread': self.synchrotron.render_thread,
-            'rate': self.synchrotron.sample_rate,
-            'buffer': self.synchrotron.buffer_size,
-            'nodes': self.synchrotron.nodes,
+            'synchrotron': lambda: self.synchrotron,
+            'backend': lambda: self.synchrotron.audio_backend,
+            'clock': lambda: self.synchrotron.global_clock,
+            'thread': lambda: self.synchrotron.render_thread,
+            'rate': lambda: self.synchrotron.sample_rate,
+            'buffer': lambda: self.synchrotron.buffer_size,
+            'nodes': lambda: self.synchrotron.nodes,
+            'workers': lambda: self.synchrotron.parallel_renderer,
+            'speedup': lambda: getattr(self.synchrotron.parallel_renderer, 'speedup', None),
+            'stages': lambda: self.synchrotron.pipeline_stages,
+            'latency': lambda: self.synchrotron.pipeline_latency,
+            'stats': self.synchrotron.get_stats,
         }
 
-        return_obj = global_vars.get(name, ...)
-        if return_obj is ...:
+        if name not in global_vars:
             raise ValueError(f"unknown global variable '{name}'")
-        return return_obj
+        return global_vars[name]()
 
     # Node instantiation
 
@@ -76,7 +92,7 @@ class SynchrolangTransformer(lark.Transformer):
     # Graph elements
 
     def node(self, node_name: lark.Token) -> Node:
-        return self.synchrotron.get_node(node_name)
+        return self.graph.get_node(node_name)
 
     @staticmethod
     def port(node: Node, port_name: lark.Token) -> Port:
@@ -97,27 +113,28 @@ class SynchrolangTransformer(lark.Transformer):
         raise ValueError(f"'{port.instance_name}' is an input port ({port.type_name}) and cannot be used as an output")
 
     def connection(self, source: Output, sink: Input) -> Connection:
-        return self.synchrotron.get_connection(source, sink, return_disconnected=True)
+        return self.graph.get_connection(source, sink, return_disconnected=True)
 
     # Commands
 
     def start(self) -> Thread:
+        self._check_not_transactional('start')
         return self.synchrotron.start_rendering()
 
     def stop(self) -> None:
+        self._check_not_transactional('stop')
         self.synchrotron.stop_rendering()
 
     def clear(self) -> None:
-        while self.synchrotron.nodes:
-            self.synchrotron.remove_node(self.synchrotron.nodes[0].name)
+        self.graph.clear()
 
     def export(self) -> str:
+        self._check_not_transactional('export')
         return self.synchrotron.export_state()
 
     def create(self, cls: type[Node] | int | float, name: str | None = None) -> Node:
         if name is None:
-            existing_names = {node.name for node in self.synchrotron.nodes}
-            while name is None or name in existing_names:
+            while name is None or self.graph.has_node(name):
                 name = '_' + ''.join(random.choice(string.ascii_lowercase) for _ in range(5))
         else:
             name = str(name)
@@ -127,26 +144,38 @@ class SynchrolangTransformer(lark.Transformer):
         else:
             node = DataNode(synchrotron=self.synchrotron, name=name, value=cls)
 
-        self.synchrotron.add_node(node)
+        try:
+            self.graph.add_node(node)
+        except BaseException:
+            node.teardown()
+            raise
         return node
 
     def link(self, connection: Connection) -> Connection:
-        return self.synchrotron.add_connection(connection.source, connection.sink)
+        return self.graph.add_connection(connection.source, connection.sink)
 
     def unlink(self, target: Node | Port | Connection) -> str:
         if isinstance(target, Node):
-            unlinked_count = len(self.synchrotron.unlink_node(target))
+            unlinked_count = len(self.graph.unlink_node(target))
         elif isinstance(target, Port):
-            unlinked_count = len(self.synchrotron.unlink_port(target))
+            unlinked_count = len(self.graph.unlink_port(target))
         elif isinstance(target, Connection):
-            unlinked_count = int(bool(self.synchrotron.remove_connection(target.source, target.sink)))
+            unlinked_count = int(bool(self.graph.remove_connection(target.source, target.sink)))
         else:
             raise TypeError(f'invalid target to unlink: expected Node | Port | Connection, got {type(target)}')
 
         return f'{unlinked_count} connection{"s" if unlinked_count != 1 else ""} unlinked'
 
     def remove(self, node: Node) -> Node:
-        return self.synchrotron.remove_node(node.name)
+        return self.graph.remove_node(node.name)
+
+    def offload(self, node: Node) -> Node:
+        self._check_not_transactional('offload')
+        return self.synchrotron.offload_node(node.name)
+
+    def inline(self, node: Node) -> Node:
+        self._check_not_transactional('inline')
+        return self.synchrotron.inline_node(node.name)
 
     @staticmethod
     def script(*commands: Any) -> tuple[Any, ...]:
@@ -1,60 +1,132 @@
 from __future__ import annotations
 
-from threading import Event, Thread
-from typing import TYPE_CHECKING, Any
+import contextlib
+import functools
+import time
+from concurrent.futures import Future
+from queue import Empty, SimpleQueue
+from threading import Event, Thread, current_thread
+from typing import TYPE_CHECKING, Any, Concatenate, ParamSpec, TypeVar
 
-from graphlib import TopologicalSorter
-from pyaudio import PyAudio
+import numpy as np
 
 from . import synchrolang
-from .nodes import Connection, Input, Node, Output, Port, RenderContext, get_node_types
+from .arena import BufferArena
+from .backends import AudioBackend, PyAudioBackend, get_backend
+from .nodes import Connection, Input, Node, NodeRegistry, Output, Port, RenderContext
 from .nodes.core import DataNode
+from .offload import OffloadedNode, get_offloaded_type
+from .schedule import ParallelRenderer, PipelineRenderer, RenderSchedule
+from .snapshot import NodeSnapshot, Snapshot
+from .stats import RenderStats
+from .transaction import Transaction
 
 if TYPE_CHECKING:
-    from queue import Queue
+    from collections.abc import Callable, Iterable
+
+P = ParamSpec('P')
+T = TypeVar('T')
+
+
+def at_buffer_boundary(method: Callable[Concatenate[Synchrotron, P], T]) -> Callable[Concatenate[Synchrotron, P], T]:
+    # Graph edits made while rendering are handed to the render thread and applied between two buffers, so the render
+    # loop never sees a half-applied edit and the graph is never mutated while it's being iterated over
+    @functools.wraps(method)
+    def wrapper(self: Synchrotron, *args: P.args, **kwargs: P.kwargs) -> T:
+        return self.run_at_buffer_boundary(functools.partial(method, self, *args, **kwargs))
+
+    return wrapper
 
 
 class Synchrotron:
-    def __init__(self, sample_rate: int = 44100, buffer_size: int = 256) -> None:
-        self.pyaudio_session = PyAudio()
+    def __init__(
+        self,
+        sample_rate: int = 44100,
+        buffer_size: int = 256,
+        audio_backend: AudioBackend | str | None = None,
+        render_workers: int = 0,
+        pipeline_stages: int = 1,
+        cull_dead_nodes: bool = True,
+        fold_constants: bool = True,
+        fuse_kernels: bool = True,
+        profile: bool = False,
+    ) -> None:
+        # Audio devices are only opened by the nodes which need them, through the backend (the sound card by default)
+        if audio_backend is None:
+            audio_backend = PyAudioBackend()
+        elif isinstance(audio_backend, str):
+            audio_backend = get_backend(audio_backend)
+        self.audio_backend = audio_backend
         self.global_clock = 0
         self.stop_event = Event()
         self.render_thread: Thread | None = None
         self.synchrolang_parser = synchrolang.SynchrolangParser()
         self.synchrolang_transformer = synchrolang.SynchrolangTransformer(self)
 
-        # It'd be cool to have a dynamic sample rate and buffer size, but it would be such an implementation headache
+        # Both can be changed later on with reconfigure()
         self.sample_rate = sample_rate
         self.buffer_size = buffer_size
 
-        self.node_types = {node_type.__name__: node_type for node_type in get_node_types()}
-        self.nodes: list[Node] = []
-        self.connections: list[Connection] = []
+        # Node modules are only imported once a node type is first used
+        self.node_types = NodeRegistry()
+        # Nodes by name and connections by their ports, both kept in the order they were added
+        self._nodes: dict[str, Node] = {}
+        self._connections: dict[tuple[Output, Input], Connection] = {}
         self._node_dependencies: dict[Node, set[Node]] = {}
-        self._output_queues: list[Queue] = []
+        self._schedule: RenderSchedule | None = None
+        self.cull_dead_nodes = cull_dead_nodes
+        self.fold_constants = fold_constants
+        self.fuse_kernels = fuse_kernels
+        self.buffer_arena = BufferArena()
+        self._pending_edits: SimpleQueue[tuple[Future, Callable[[], Any]]] = SimpleQueue()
+        self.parallel_renderer: ParallelRenderer | None = None
+        self.set_render_workers(render_workers)
+        self.pipeline_renderer: PipelineRenderer | None = None
+        self.set_pipeline_stages(pipeline_stages)
+        self.render_stats: RenderStats | None = RenderStats() if profile else None
 
     def get_node_type(self, node_type: str) -> type[Node]:
         if node_type not in self.node_types:
             raise ValueError(f"node type '{node_type}' not found")
         return self.node_types[node_type]
 
+    @property
+    def nodes(self) -> list[Node]:
+        return list(self._nodes.values())
+
+    @property
+    def connections(self) -> list[Connection]:
+        return list(self._connections.values())
+
+    def has_node(self, node_name: str) -> bool:
+        return node_name in self._nodes
+
     def get_node(self, node_name: str) -> Node:
         try:
-            return next(node for node in self.nodes if node.name == node_name)
-        except StopIteration:
+            return self._nodes[node_name]
+        except KeyError:
             raise ValueError(f"node '{node_name}' not found") from None
 
+    @at_buffer_boundary
     def add_node(self, node: Node) -> None:
-        if node in self.nodes:
+        name_collision = self._nodes.get(node.name)
+        if name_collision is node:
             raise ValueError(f'node {node!r} already added to graph')
-        name_collision = next((graph_node for graph_node in self.nodes if graph_node.name == node.name), None)
         if name_collision is not None:
             raise ValueError(f'node {node!r} has a duplicate name with node {name_collision.name}')
 
-        self.nodes.append(node)
+        self._nodes[node.name] = node
         self._node_dependencies[node] = set()
+        self._schedule = None
 
     def remove_node(self, node_name: str) -> Node:
+        node = self._detach_node(node_name)
+        # Tearing down can be slow (closing files, joining threads) so it's done after the node has left the graph
+        node.teardown()
+        return node
+
+    @at_buffer_boundary
+    def _detach_node(self, node_name: str) -> Node:
         node = self.get_node(node_name)
 
         # Detatch node from graph to prepare for removal
@@ -62,30 +134,101 @@ class Synchrotron:
             if input_port.connection is not None:
                 self.remove_connection(input_port.connection.source, input_port)
         for output_port in node.outputs:
-            for connection in output_port.connections:
+            for connection in list(output_port.connections):
                 self.remove_connection(output_port, connection.sink)
 
-        self.nodes.remove(node)
+        del self._nodes[node.name]
         self._node_dependencies.pop(node, None)
+        self._schedule = None
+        self.buffer_arena.release(node)
+        if self.render_stats is not None:
+            self.render_stats.forget(node)
+
+        return node
+
+    @at_buffer_boundary
+    def _replace_node(self, node: Node, replacement: Node) -> None:
+        # Swap a node for another with the same name and ports, keeping its place in the graph and its connections
+        if self._nodes.get(node.name) is not node:
+            raise ValueError(f'node {node!r} is not in the graph')
+        node_names = list(self._nodes)
+        sources = [(port.name, port.connection.source) for port in node.inputs if port.connection is not None]
+        sinks = [(port.name, connection.sink) for port in node.outputs for connection in port.connections]
+        self._detach_node(node.name)
+
+        self.add_node(replacement)
+        self._nodes = {name: self._nodes[name] for name in node_names}
+        for port in node.inputs:
+            replacement.get_input(port.name).buffer = port.buffer
+        for port_name, source in sources:
+            self.add_connection(source, replacement.get_input(port_name))
+        for port_name, sink in sinks:
+            self.add_connection(replacement.get_output(port_name), sink)
+
+    def offload_node(self, node_name: str) -> Node:
+        # The node is recreated in a worker process, so any state it had built up (e.g. playing notes) starts afresh
+        node = self.get_node(node_name)
+        if isinstance(node, OffloadedNode):
+            return node
+        if not node.offloadable:
+            raise ValueError(f'node {node!r} cannot be rendered in another process')
+
+        # Starting the worker process takes a while, so it's done before waiting for a buffer boundary
+        offloaded_node = get_offloaded_type(type(node))(synchrotron=self, name=node.name)
+        try:
+            self._replace_node(node, offloaded_node)
+        except BaseException:
+            offloaded_node.teardown()
+            raise
 
         node.teardown()
+        return offloaded_node
 
+    def inline_node(self, node_name: str) -> Node:
+        offloaded_node = self.get_node(node_name)
+        if not isinstance(offloaded_node, OffloadedNode):
+            return offloaded_node
+
+        node = offloaded_node.node_type(synchrotron=self, name=offloaded_node.name)
+        try:
+            self._replace_node(offloaded_node, node)
+        except BaseException:
+            node.teardown()
+            raise
+
+        offloaded_node.teardown()
         return node
 
+    def offload_expensive_nodes(self, threshold: float = 0.25) -> list[Node]:
+        # Offload every node whose median render time is over the given fraction of the time available for each buffer
+        stats = self.render_stats
+        if stats is None:
+            raise RuntimeError('profiling must be enabled to find which nodes are expensive to render')
+
+        deadline = self.buffer_size / self.sample_rate
+        expensive_nodes = [
+            node for node, times in list(stats.node_times.items())
+            if times and node.offloadable and not isinstance(node, OffloadedNode)
+            and float(np.median(times)) > threshold * deadline
+        ]
+        return [self.offload_node(node.name) for node in expensive_nodes]
+
     def get_connection(self, source: Output, sink: Input, return_disconnected: bool = False) -> Connection:
-        for connection in self.connections:
-            if connection.source == source and connection.sink == sink:
-                return connection
+        connection = self._connections.get((source, sink))
+        if connection is not None:
+            return connection
 
         if return_disconnected:
             return Connection(source, sink)
         raise ValueError(f'connection {source.instance_name} -> {sink.instance_name} does not exist')
 
+    @at_buffer_boundary
     def add_connection(self, source: Output, sink: Input, strict: bool = False) -> Connection:
         connection = self.get_connection(source, sink, return_disconnected=True)
         if connection.is_connected:
             return connection
 
+        sink.check_source(source)
         if sink.connection is not None:
             if strict:
                 raise ValueError(f'output {sink.instance_name} is already connected')
@@ -94,11 +237,13 @@ class Synchrotron:
         connection.is_connected = True
         source.connections.append(connection)
         sink.connection = connection
-        self.connections.append(connection)
+        self._connections[source, sink] = connection
         self._node_dependencies[sink.node].add(source.node)
+        self._schedule = None
 
         return connection
 
+    @at_buffer_boundary
     def remove_connection(self, source: Output, sink: Input) -> Connection | None:
         try:
             connection = self.get_connection(source, sink)
@@ -108,7 +253,7 @@ class Synchrotron:
         connection.is_connected = False
         source.connections.remove(connection)
         sink.connection = None
-        self.connections.remove(connection)
+        del self._connections[source, sink]
 
         # If sink node has no inputs connected to source node outputs then remove node dependency
         if not any(
@@ -117,9 +262,11 @@ class Synchrotron:
             if input_port.connection is not None
         ):
             self._node_dependencies[sink.node].remove(source.node)
+        self._schedule = None
 
         return connection
 
+    @at_buffer_boundary
     def unlink_port(self, port: Port) -> list[Connection]:
         if isinstance(port, Input):
             removed_connections = [self.remove_connection(port.connection.source, port.connection.sink)]
@@ -127,11 +274,12 @@ class Synchrotron:
             port: Output
             removed_connections = [
                 self.remove_connection(connection.source, connection.sink)
-                for connection in port.connections
+                for connection in list(port.connections)
             ]
 
         return list(filter(None, removed_connections))
 
+    @at_buffer_boundary
     def unlink_node(self, node: Node) -> list[Connection]:
         removed_connections = []
         for port in (*node.inputs, *node.outputs):
@@ -139,30 +287,218 @@ class Synchrotron:
 
         return removed_connections
 
-    def execute(self, script: str) -> tuple[Any, ...]:
-        tree = self.synchrolang_parser.parse(script)
-        return self.synchrolang_transformer.transform(tree)
-
-    def add_output_queue(self, queue: Queue) -> None:
-        self._output_queues.append(queue)
+    def transaction(self) -> Transaction:
+        return Transaction(self)
+
+    @at_buffer_boundary
+    def apply_changes(
+        self,
+        removed_connections: Iterable[tuple[Output, Input]] = (),
+        removed_nodes: Iterable[Node] = (),
+        added_nodes: Iterable[Node] = (),
+        added_connections: Iterable[tuple[Output, Input]] = (),
+        node_order: Iterable[str] | None = None,
+    ) -> None:
+        # Make a set of graph edits in one go. If any of them fails (e.g. it conflicts with an edit made in the
+        # meantime) every edit made so far is undone. Removed nodes are left for the caller to tear down. Nodes named in
+        # node_order are put in that order, ahead of any others.
+        node_names = list(self._nodes)
+        connection_ports = list(self._connections)
+        undo_steps: list[Callable[[], Any]] = []
+        try:
+            for source, sink in removed_connections:
+                if self.remove_connection(source, sink) is not None:
+                    undo_steps.append(functools.partial(self.add_connection, source, sink))
+            for node in removed_nodes:
+                if self._nodes.get(node.name) is not node:
+                    raise ValueError(f"node '{node.name}' not found")
+                self._detach_node(node.name)
+                undo_steps.append(functools.partial(self.add_node, node))
+            for node in added_nodes:
+                self.add_node(node)
+                undo_steps.append(functools.partial(self._detach_node, node.name))
+            for source, sink in added_connections:
+                for port in (source, sink):
+                    if self._nodes.get(port.node.name) is not port.node:
+                        raise ValueError(f"node '{port.node.name}' not found")
+                self.add_connection(source, sink, strict=True)
+                undo_steps.append(functools.partial(self.remove_connection, source, sink))
+        except BaseException:
+            for undo_step in reversed(undo_steps):
+                undo_step()
+            self._nodes = {name: self._nodes[name] for name in node_names}
+            self._connections = {ports: self._connections[ports] for ports in connection_ports}
+            raise
+
+        if node_order is not None:
+            ordered_nodes = {name: self._nodes[name] for name in node_order if name in self._nodes}
+            self._nodes = ordered_nodes | self._nodes
+
+    def clear(self) -> list[Node]:
+        removed_nodes = self.run_at_buffer_boundary(
+            lambda: [self._detach_node(node.name) for node in self.nodes],
+        )
+        for node in removed_nodes:
+            node.teardown()
+        return removed_nodes
+
+    def run_at_buffer_boundary(self, edit: Callable[[], T]) -> T:
+        render_thread = self.render_thread
+        if render_thread is None or not render_thread.is_alive() or current_thread() is render_thread:
+            return edit()
+
+        future: Future[T] = Future()
+        self._pending_edits.put((future, edit))
+        while True:
+            try:
+                return future.result(timeout=self.buffer_size / self.sample_rate)
+            except TimeoutError:
+                # The render thread may have stopped before getting round to applying the edit
+                if not render_thread.is_alive():
+                    self._apply_pending_edits()
+
+    def _apply_pending_edits(self) -> None:
+        while True:
+            try:
+                future, edit = self._pending_edits.get_nowait()
+            except Empty:
+                return
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(edit())
+            except BaseException as error:  # noqa: BLE001 (re-raised in the thread which requested the edit)
+                future.set_exception(error)
+
+    @at_buffer_boundary
+    def reconfigure(self, sample_rate: int | None = None, buffer_size: int | None = None) -> None:
+        # Switch sample rate and/or buffer size between two buffers, with every node carrying on from where it was
+        sample_rate = self.sample_rate if sample_rate is None else sample_rate
+        buffer_size = self.buffer_size if buffer_size is None else buffer_size
+        if sample_rate < 1 or buffer_size < 1:
+            raise ValueError(f'invalid sample rate {sample_rate} or buffer size {buffer_size}')
+
+        previous_configuration = (self.sample_rate, self.buffer_size)
+        if (sample_rate, buffer_size) == previous_configuration:
+            return
+
+        self._apply_configuration(sample_rate, buffer_size)
+        reconfigured_nodes = []
+        try:
+            for node in self.nodes:
+                node.reconfigure(sample_rate, buffer_size)
+                reconfigured_nodes.append(node)
+        except BaseException:
+            # Put back the nodes which had already switched over, so the whole session is left as it was
+            self._apply_configuration(*previous_configuration)
+            for node in reconfigured_nodes:
+                with contextlib.suppress(Exception):
+                    node.reconfigure(*previous_configuration)
+            raise
+
+    def _apply_configuration(self, sample_rate: int, buffer_size: int) -> None:
+        self.sample_rate = sample_rate
+        self.buffer_size = buffer_size
+        # Buffers of the old size are freed, and constant nodes are folded again at the new size
+        self.buffer_arena.clear()
+        self._schedule = None
+        if self.pipeline_renderer is not None:
+            self.pipeline_renderer.reset()
 
-    def render_graph(self) -> None:
-        render_context = RenderContext(
+    def execute(self, script: str, transactional: bool = False) -> tuple[Any, ...]:
+        tree = self.synchrolang_parser.parse(script)
+        if not transactional:
+            return self.synchrolang_transformer.transform(tree)
+
+        # The whole script is staged first, then applied between two buffers, or not at all if any command fails
+        with self.transaction() as transaction:
+            return synchrolang.SynchrolangTransformer(self, transaction).transform(tree)
+
+    @at_buffer_boundary
+    def set_render_workers(self, workers: int) -> None:
+        # 0 workers renders every node serially on the render thread
+        if self.parallel_renderer is not None:
+            self.parallel_renderer.shutdown()
+        self.parallel_renderer = ParallelRenderer(workers) if workers else None
+
+    @at_buffer_boundary
+    def set_pipeline_stages(self, stages: int) -> None:
+        # 1 stage renders each buffer in one go, while every extra stage spreads the graph across another thread at the
+        # cost of a buffer of latency. Buffers still part way through the old pipeline are dropped.
+        if self.pipeline_renderer is not None:
+            self.pipeline_renderer.shutdown()
+        self.pipeline_renderer = PipelineRenderer(stages) if stages > 1 else None
+
+    @property
+    def pipeline_stages(self) -> int:
+        return 1 if self.pipeline_renderer is None else self.pipeline_renderer.stage_count
+
+    @property
+    def pipeline_latency(self) -> float:
+        # Seconds of latency added by pipelining, on top of the audio device's own
+        return (self.pipeline_stages - 1) * self.buffer_size / self.sample_rate
+
+    def enable_profiling(self) -> None:
+        if self.render_stats is None:
+            self.render_stats = RenderStats()
+
+    def disable_profiling(self) -> None:
+        self.render_stats = None
+
+    def get_stats(self) -> dict:
+        stats = self.render_stats
+        return {
+            'enabled': stats is not None,
+            'parallel_speedup': None if self.parallel_renderer is None else self.parallel_renderer.speedup,
+            'pipeline_stages': self.pipeline_stages,
+            'pipeline_latency': self.pipeline_latency * 1000,
+            'underruns': self.audio_backend.underruns,
+            **({} if stats is None else stats.as_json()),
+        }
+
+    def get_schedule(self) -> RenderSchedule:
+        # Only recompile the execution plan if the graph has changed since the last buffer
+        schedule = self._schedule
+        if schedule is None:
+            schedule = self._schedule = RenderSchedule.compile(
+                self._node_dependencies,
+                ctx=self.get_render_context(),
+                cull=self.cull_dead_nodes,
+                fold=self.fold_constants,
+                fuse=self.fuse_kernels,
+            )
+        return schedule
+
+    def get_render_context(self) -> RenderContext:
+        return RenderContext(
             global_clock=self.global_clock,
             sample_rate=self.sample_rate,
             buffer_size=self.buffer_size,
         )
-        node_graph = TopologicalSorter(self._node_dependencies)
-        for node in node_graph.static_order():
-            node.render(render_context)
-            for output in node.outputs:
-                for connection in output.connections:
-                    connection.sink.buffer = connection.source.buffer
-
-        for queue in self._output_queues:
-            queue.join()
+
+    def render_graph(self) -> None:
+        self._apply_pending_edits()
+        render_context = self.get_render_context()
+        stats = self.render_stats
+        schedule = self.get_schedule()
+        start_time = time.perf_counter()
+        # Pipelining takes precedence over rendering each buffer in parallel
+        if self.pipeline_renderer is not None:
+            self.pipeline_renderer.render(schedule, render_context, stats)
+        elif self.parallel_renderer is not None:
+            self.parallel_renderer.render(schedule, render_context, stats)
+        elif stats is None:
+            schedule.render(render_context)
+        else:
+            schedule.render_profiled(render_context, stats)
+        if stats is not None:
+            stats.record_block(time.perf_counter() - start_time, deadline=self.buffer_size / self.sample_rate)
+
+        self.audio_backend.sync()
         self.global_clock += self.buffer_size
 
+    @at_buffer_boundary
     def export_state(self) -> str:
         script = ''
         for node in self.nodes:
@@ -177,6 +513,76 @@ class Synchrotron:
 
         return script
 
+    def save_snapshot(self) -> bytes:
+        # The graph and every node's state are captured between two buffers, then encoded off the render thread
+        snapshot = self.run_at_buffer_boundary(lambda: Snapshot(
+            sample_rate=self.sample_rate,
+            buffer_size=self.buffer_size,
+            nodes=[
+                NodeSnapshot(
+                    name=node.name,
+                    type=node.__class__.__name__,
+                    state=node.get_state(),
+                    value=node.value if isinstance(node, DataNode) else None,
+                    offloaded=isinstance(node, OffloadedNode),
+                )
+                for node in self.nodes
+            ],
+            connections=[
+                (
+                    connection.source.node.name,
+                    connection.source.name,
+                    connection.sink.node.name,
+                    connection.sink.name,
+                )
+                for connection in self.connections
+            ],
+        ))
+        return snapshot.to_bytes()
+
+    def restore_snapshot(self, data: bytes) -> list[Node]:
+        # Replaces the graph with the snapshot's in one go. Nodes which are already in the graph with the same name and
+        # type are kept (so e.g. audio devices aren't reopened) and only take on their saved state, while the rest are
+        # created and set up before they join the graph.
+        snapshot = Snapshot.from_bytes(data)
+        # Switched over first, so that new nodes are set up for the snapshot's configuration, and switched back if the
+        # graph can't be restored
+        previous_configuration = (self.sample_rate, self.buffer_size)
+        self.reconfigure(snapshot.sample_rate, snapshot.buffer_size)
+        try:
+            self._restore_graph(snapshot)
+        except BaseException:
+            self.reconfigure(*previous_configuration)
+            raise
+        return self.nodes
+
+    def _restore_graph(self, snapshot: Snapshot) -> None:
+        with self.transaction() as transaction:
+            existing_nodes = {node.name: node for node in transaction.nodes}
+            transaction.clear()
+            for node_snapshot in snapshot.nodes:
+                if node_snapshot.type == DataNode.__name__:
+                    node_type = DataNode
+                else:
+                    node_type = self.get_node_type(node_snapshot.type)
+                    if node_snapshot.offloaded:
+                        node_type = get_offloaded_type(node_type)
+
+                node = existing_nodes.get(node_snapshot.name)
+                if type(node) is not node_type or (node_type is DataNode and node.value != node_snapshot.value):
+                    if node_type is DataNode:
+                        node = DataNode(synchrotron=self, name=node_snapshot.name, value=node_snapshot.value)
+                    else:
+                        node = node_type(synchrotron=self, name=node_snapshot.name)
+                transaction.add_node(node)
+                transaction.set_node_state(node, node_snapshot.state)
+
+            for source_name, output_name, sink_name, input_name in snapshot.connections:
+                transaction.add_connection(
+                    transaction.get_node(source_name).get_output(output_name),
+                    transaction.get_node(sink_name).get_input(input_name),
+                )
+
     def start_rendering(self) -> Thread:
         if self.render_thread is not None and self.render_thread.is_alive():
             raise RuntimeError('render thread is already running')
@@ -194,9 +600,11 @@ class Synchrotron:
         self.stop_event.set()
         if self.render_thread is not None:
             self.render_thread.join()
+        self._apply_pending_edits()
 
     def shutdown(self) -> None:
         self.stop_rendering()
-        for node in self.nodes:
-            self.remove_node(node.name)
-        self.pyaudio_session.terminate()
+        self.clear()
+        self.set_render_workers(0)
+        self.set_pipeline_stages(1)
+        self.audio_backend.terminate()
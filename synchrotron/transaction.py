@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any
+
+from .nodes import Connection, Input, Node, Output, Port
+
+if TYPE_CHECKING:
+    from types import TracebackType
+
+    from .synchrotron import Synchrotron
+
+
+class Transaction:
+    # Graph edits are staged against a copy of the graph, away from the render thread, then applied together between two
+    # buffers by commit(). If any edit fails (while staging or while being applied), none of them are applied.
+    def __init__(self, synchrotron: Synchrotron) -> None:
+        self.synchrotron = synchrotron
+        self.is_open = True
+        # Only the differences from the graph as it was when the transaction started are applied on commit, so edits
+        # made to the graph in the meantime are kept
+        self._initial_nodes, self._initial_sources = synchrotron.run_at_buffer_boundary(
+            lambda: (
+                {node.name: node for node in synchrotron.nodes},
+                {connection.sink: connection.source for connection in synchrotron.connections},
+            ),
+        )
+        self._nodes = dict(self._initial_nodes)
+        self._sources = dict(self._initial_sources)
+        self._sinks: defaultdict[Output, set[Input]] = defaultdict(set)
+        for sink, source in self._sources.items():
+            self._sinks[source].add(sink)
+        self._created_nodes: list[Node] = []
+        self._node_states: list[tuple[Node, dict[str, Any]]] = []
+
+    def __repr__(self) -> str:
+        status = 'open' if self.is_open else 'closed'
+        return f'<{self.__class__.__name__} ({len(self._nodes)} nodes, {len(self._sources)} connections, {status})>'
+
+    def __enter__(self) -> Transaction:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        if not self.is_open:
+            return
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+    @property
+    def nodes(self) -> list[Node]:
+        return list(self._nodes.values())
+
+    @property
+    def connections(self) -> list[Connection]:
+        return [Connection(source, sink, is_connected=True) for sink, source in self._sources.items()]
+
+    def has_node(self, node_name: str) -> bool:
+        return node_name in self._nodes
+
+    def get_node(self, node_name: str) -> Node:
+        try:
+            return self._nodes[node_name]
+        except KeyError:
+            raise ValueError(f"node '{node_name}' not found") from None
+
+    def add_node(self, node: Node) -> None:
+        self._check_open()
+        name_collision = self._nodes.get(node.name)
+        if name_collision is node:
+            raise ValueError(f'node {node!r} already added to graph')
+        if name_collision is not None:
+            raise ValueError(f'node {node!r} has a duplicate name with node {name_collision.name}')
+
+        self._nodes[node.name] = node
+        self._created_nodes.append(node)
+
+    def remove_node(self, node_name: str) -> Node:
+        # The node is only torn down once the transaction has been committed
+        self._check_open()
+        node = self.get_node(node_name)
+        self.unlink_node(node)
+        del self._nodes[node_name]
+        return node
+
+    def set_node_state(self, node: Node, state: dict[str, Any]) -> None:
+        # Nodes already in the graph take on the state when the transaction is committed (having done any slow
+        # preparation now, so it doesn't hold up the render thread), and new nodes right away
+        self._check_open()
+        if self._initial_nodes.get(node.name) is node:
+            self._node_states.append((node, node.prepare_state(state)))
+        else:
+            node.set_state(state)
+
+    def get_connection(self, source: Output, sink: Input, return_disconnected: bool = False) -> Connection:
+        if self._sources.get(sink) is source:
+            return Connection(source, sink, is_connected=True)
+
+        if return_disconnected:
+            return Connection(source, sink)
+        raise ValueError(f'connection {source.instance_name} -> {sink.instance_name} does not exist')
+
+    def add_connection(self, source: Output, sink: Input, strict: bool = False) -> Connection:
+        self._check_open()
+        for port in (source, sink):
+            if self._nodes.get(port.node.name) is not port.node:
+                raise ValueError(f"node '{port.node.name}' not found")
+        sink.check_source(source)
+
+        previous_source = self._sources.get(sink)
+        if previous_source is source:
+            return Connection(source, sink, is_connected=True)
+        if previous_source is not None:
+            if strict:
+                raise ValueError(f'output {sink.instance_name} is already connected')
+            self.remove_connection(previous_source, sink)
+
+        self._sources[sink] = source
+        self._sinks[source].add(sink)
+        return Connection(source, sink, is_connected=True)
+
+    def remove_connection(self, source: Output, sink: Input) -> Connection | None:
+        self._check_open()
+        if self._sources.get(sink) is not source:
+            return None
+
+        del self._sources[sink]
+        self._sinks[source].discard(sink)
+        return Connection(source, sink)
+
+    def unlink_port(self, port: Port) -> list[Connection]:
+        if isinstance(port, Input):
+            source = self._sources.get(port)
+            removed_connections = [] if source is None else [self.remove_connection(source, port)]
+        else:
+            port: Output
+            removed_connections = [self.remove_connection(port, sink) for sink in list(self._sinks.get(port, ()))]
+
+        return list(filter(None, removed_connections))
+
+    def unlink_node(self, node: Node) -> list[Connection]:
+        removed_connections = []
+        for port in (*node.inputs, *node.outputs):
+            removed_connections.extend(self.unlink_port(port))
+
+        return removed_connections
+
+    def clear(self) -> list[Node]:
+        self._check_open()
+        removed_nodes = self.nodes
+        self._nodes.clear()
+        self._sources.clear()
+        self._sinks.clear()
+        return removed_nodes
+
+    def commit(self) -> None:
+        self._check_open()
+        self.is_open = False
+        initial_nodes, initial_sources = self._initial_nodes, self._initial_sources
+        removed_nodes = [node for node in initial_nodes.values() if self._nodes.get(node.name) is not node]
+        changes = {
+            'removed_connections': [
+                (source, sink) for sink, source in initial_sources.items() if self._sources.get(sink) is not source
+            ],
+            'removed_nodes': removed_nodes,
+            'added_nodes': [node for node in self._nodes.values() if initial_nodes.get(node.name) is not node],
+            'added_connections': [
+                (source, sink) for sink, source in self._sources.items() if initial_sources.get(sink) is not source
+            ],
+            'node_order': list(self._nodes),
+        }
+        try:
+            self.synchrotron.run_at_buffer_boundary(lambda: self._apply(changes))
+        except BaseException:
+            self._teardown_created_nodes()
+            raise
+
+        for node in removed_nodes:
+            node.teardown()
+        # Nodes created and then removed again within the transaction never made it into the graph
+        self._teardown_created_nodes()
+
+    def _apply(self, changes: dict[str, list]) -> None:
+        previous_states = []
+        try:
+            for node, state in self._node_states:
+                previous_states.append((node, node.get_state()))
+                node.set_state(state)
+            self.synchrotron.apply_changes(**changes)
+        except BaseException:
+            for node, state in reversed(previous_states):
+                node.set_state(state)
+            raise
+
+    def discard(self) -> None:
+        self._check_open()
+        self.is_open = False
+        self._teardown_created_nodes()
+
+    def _teardown_created_nodes(self) -> None:
+        # Only nodes which didn't end up in the graph are torn down, which is checked between buffers like any other
+        # look at the graph
+        self.synchrotron.run_at_buffer_boundary(self._teardown_unused_nodes)
+
+    def _teardown_unused_nodes(self) -> None:
+        graph_nodes = set(self.synchrotron.nodes)
+        for node in self._created_nodes:
+            if node not in graph_nodes:
+                node.teardown()
+        self._created_nodes.clear()
+
+    def _check_open(self) -> None:
+        if not self.is_open:
+            raise RuntimeError('transaction has already been committed or discarded')